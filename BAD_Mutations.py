@@ -19,6 +19,12 @@ import lrt_predict.General.check_modules as check_modules
 import lrt_predict.General.set_verbosity as set_verbosity
 #   Import our argument parsing script
 import lrt_predict.General.parse_args as parse_args
+#   Import the argument checking script
+import lrt_predict.General.check_args as check_args
+#   To split the CPUs between the tools
+import lrt_predict.General.resources as resources
+#   To estimate the memory of the tools and share the memory of a node
+import lrt_predict.General.admission as admission
 
 
 def setup(arg):
@@ -84,6 +90,8 @@ def fetch(arg, log):
         log.debug('Only converting files.')
         ens.convert()
         phy.convert()
+        merge(arg, log)
+        write_catalog(arg, log)
     elif arg['fetch_only']:
         log.debug('Only downloading files.')
         log.info('Fetching from Ensembl Plants...')
@@ -101,6 +109,189 @@ def fetch(arg, log):
         phy.fetch_cds()
         ens.convert()
         phy.convert()
+        merge(arg, log)
+        write_catalog(arg, log)
+    return
+
+
+def merge(arg, log):
+    """A function to combine the species databases into one merged
+    database, if it was asked for."""
+    if not check_args.is_true(arg.get('merged_db')):
+        return
+    import lrt_predict.Fetch.merge_db as merge_db
+    merge_db.build_merged(
+        check_modules.check_executable('makeblastdb'),
+        arg['base'],
+        log)
+    return
+
+
+def write_catalog(arg, log):
+    """A function to write the catalog of species databases, so that the
+    searches do not have to look for them in the base directory."""
+    import lrt_predict.Fetch.catalog as catalog
+    catalog.build_catalog(arg['base'], log)
+    return
+
+
+def hit_cache(arg, log):
+    """A function to open the cache of BLAST best hits, if a cache directory
+    was given. Returns None otherwise."""
+    if not arg.get('cache_dir'):
+        return None
+    import lrt_predict.General.disk_cache as disk_cache
+    log.info('Caching BLAST best hits in ' + arg['cache_dir'])
+    return disk_cache.DiskCache(
+        os.path.join(arg['cache_dir'], 'blast_hits'),
+        arg.get('cache_size') or 1024,
+        arg['loglevel'])
+
+
+def alignment_cache(arg, log):
+    """A function to open the cache of finished alignments and trees, if a
+    cache directory was given. It is kept next to the cache of BLAST best
+    hits, with its own size limit of the same size. Returns None otherwise."""
+    if not arg.get('cache_dir'):
+        return None
+    import lrt_predict.General.disk_cache as disk_cache
+    log.debug('Caching alignments and trees in ' + arg['cache_dir'])
+    return disk_cache.DiskCache(
+        os.path.join(arg['cache_dir'], 'alignments'),
+        arg.get('cache_size') or 1024,
+        arg['loglevel'])
+
+
+def fit_cache(arg, log):
+    """A function to open the cache of HyPhy background fits, if a cache
+    directory was given. It is kept next to the other caches, with its own
+    size limit of the same size. Returns None otherwise."""
+    if not arg.get('cache_dir'):
+        return None
+    import lrt_predict.General.disk_cache as disk_cache
+    log.debug('Caching HyPhy background fits in ' + arg['cache_dir'])
+    return disk_cache.DiskCache(
+        os.path.join(arg['cache_dir'], 'hyphy_fits'),
+        arg.get('cache_size') or 1024,
+        arg['loglevel'])
+
+
+def scratch_dir(arg, log):
+    """A function to make the scratch directory of a run. It holds every
+    temporary file of the run, and is removed at the end unless it should be
+    kept."""
+    import lrt_predict.General.scratch as scratch
+    return scratch.ScratchDir(
+        arg.get('scratch_dir'),
+        check_args.is_true(arg.get('keep_scratch')),
+        arg['loglevel'])
+
+
+def memory_ledger(arg, log):
+    """A function to open the memory ledger of the node, if admission
+    control is on. Returns None otherwise."""
+    if not check_args.is_true(arg.get('admission')):
+        return None
+    if arg.get('node_memory'):
+        if not check_args.valid_memory(arg['node_memory']):
+            log.error(
+                'NODE_MEMORY must be a number with an optional unit, like '
+                '64g.')
+            exit(1)
+        budget = resources.memory_mb(arg['node_memory'])
+    else:
+        #   Leave some of the memory of the node for everything else
+        budget = admission.node_memory_mb()
+        if budget is None:
+            log.warning(
+                'Cannot find the memory of this node. Set NODE_MEMORY to use '
+                'admission control.')
+            return None
+        budget = int(budget * 0.9)
+    return admission.MemoryLedger(
+        arg.get('admission_dir') or '/tmp',
+        budget,
+        arg['loglevel'])
+
+
+def alignment_memory(aln, backend, nseqs):
+    """A function to return the memory that aligning and estimating the tree
+    needs, in MB. For PASTA, this is the Java heap."""
+    if backend == 'pasta':
+        need = resources.memory_mb(aln.memory)
+    else:
+        need = max(
+            admission.estimate_mb(backend, nseqs, aln.max_length),
+            admission.estimate_mb('fasttree', nseqs, aln.max_length))
+    return need + admission.OVERHEAD_MB
+
+
+def search_program(arg):
+    """A function to return the search program to find homologues with. This
+    is tblastx unless another one was asked for."""
+    return arg.get('search_program') or 'tblastx'
+
+
+def merged_db(arg):
+    """A function to return the path to the merged database of all species,
+    if it should be searched. Returns None otherwise."""
+    if not check_args.is_true(arg.get('merged_db')):
+        return None
+    import lrt_predict.Fetch.merge_db as merge_db
+    return merge_db.merged_path(arg['base'])
+
+
+def select_species(b_search, arg, log):
+    """A function to set the largest number of species to search, and the
+    clade table to pick them with, from the configuration file."""
+    if not arg.get('max_species'):
+        return
+    if not check_args.valid_count(arg['max_species']):
+        log.error('MAX_SPECIES must be a positive integer.')
+        exit(1)
+    b_search.max_species = int(arg['max_species'])
+    if arg.get('species_clades'):
+        if not os.path.isfile(arg['species_clades']):
+            log.error(
+                'The clade table ' + arg['species_clades'] + ' does not '
+                'exist.')
+            exit(1)
+        import lrt_predict.Blast.species_select as species_select
+        b_search.clades = species_select.read_clades(arg['species_clades'])
+    return
+
+
+def configure_search(b_search, arg, log):
+    """A function to set the optional features of a BlastSearch from the
+    arguments."""
+    if arg['blast_format']:
+        b_search.outfmt = arg['blast_format']
+    b_search.program = search_program(arg)
+    b_search.merged = merged_db(arg)
+    if arg.get('prefilter'):
+        b_search.prefilter = int(arg['prefilter'])
+    b_search.cache = hit_cache(arg, log)
+    if arg.get('tool_threads'):
+        b_search.tool_threads = int(arg['tool_threads'])
+    select_species(b_search, arg, log)
+    if arg.get('stage_dir'):
+        import lrt_predict.Blast.db_stage as db_stage
+        b_search.stage = db_stage.DatabaseStage(
+            arg['base'],
+            arg['stage_dir'],
+            arg.get('stage_size'),
+            check_args.is_true(arg.get('stage_prewarm')),
+            arg['loglevel'])
+        log.info('Staging the databases in ' + b_search.stage.stage_dir)
+    #   The orthologue table is only used if it was built with the same search
+    if arg.get('orthologue_table') and arg['action'] == 'align':
+        import lrt_predict.Blast.orthologue_table as orthologue_table
+        table = orthologue_table.OrthologueTable(
+            arg['orthologue_table'],
+            arg['loglevel'])
+        if table.check_params(b_search.table_params()):
+            log.info('Using the orthologue table ' + arg['orthologue_table'])
+            b_search.orthologue_table = table
     return
 
 
@@ -112,10 +303,13 @@ def blast(arg, log):
     if blastdeps:
         check_modules.missing_mods(blastdeps)
         exit(1)
+    #   The tblastx path can be set in the config file. The other search
+    #   programs are expected to be in the PATH.
+    program = search_program(arg)
     missing_reqs = check_modules.missing_executables(
         [
             arg['bash_path'],
-            arg['tblastx_path']
+            arg['tblastx_path'] if program == 'tblastx' else program
         ])
     #   And then check the executable dependencies
     if missing_reqs:
@@ -131,16 +325,217 @@ def blast(arg, log):
         arg['target'],
         arg['fasta'],
         arg['evalue'],
+        arg['num_cpus'],
         arg['loglevel'])
+    configure_search(b_search, arg, log)
     b_search.blast_all()
     #   hom contains the file object that has the unaligned sequence in it.
     hom = b_search.get_hit_seqs()
     return hom
 
 
+def batch_blast(arg, queries, log):
+    """A function to search the databases with every query in a list of FASTA
+    files at once. Returns the BatchBlastSearch, with the homologous loci for
+    each query filled in."""
+    blastdeps = check_modules.check_modules(predict=True)
+    if blastdeps:
+        check_modules.missing_mods(blastdeps)
+        exit(1)
+    #   The tblastx path can be set in the config file. The other search
+    #   programs are expected to be in the PATH.
+    program = search_program(arg)
+    missing_reqs = check_modules.missing_executables(
+        [
+            arg['bash_path'],
+            arg['tblastx_path'] if program == 'tblastx' else program
+        ])
+    if missing_reqs:
+        log.error(
+            'Some required executables were not found on your system: ' +
+            '\n'.join(missing_reqs) + '\nPlease install them to continue.')
+        exit(1)
+    import lrt_predict.Blast.blast_search as blast_search
+    log.info('Creating a new instance to BLAST ' + str(len(queries)) +
+             ' queries.')
+    b_search = blast_search.BatchBlastSearch(
+        arg['base'],
+        arg['target'],
+        queries,
+        arg['evalue'],
+        arg['num_cpus'],
+        arg['loglevel'])
+    configure_search(b_search, arg, log)
+    b_search.blast_all()
+    return b_search
+
+
+def batch_align(arg, log):
+    """A function to search and align every query in a list of FASTA files.
+    Queries with the same CDS are only searched and aligned once, and the
+    alignment and tree are copied to the others. If isoforms are grouped,
+    each isoform uses the homologues of the longest isoform of its gene."""
+    import lrt_predict.General.parse_input as parse_input
+    import lrt_predict.General.dedup_queries as dedup_queries
+    queries = parse_input.fasta_list(arg['fasta_list'])
+    records = dedup_queries.read_queries(queries)
+    unique, copies = dedup_queries.group_by_cds(queries, records)
+    if check_args.is_true(arg.get('group_isoforms')):
+        homologues = dedup_queries.group_by_gene(unique, records)
+    else:
+        homologues = dict((query, query) for query in unique)
+    #   Keep the searched queries in the order of the list
+    searched = [query for query in unique if homologues[query] == query]
+    log.info(
+        str(len(queries)) + ' queries, ' + str(len(unique)) + ' unique CDS, ' +
+        str(len(searched)) + ' to search.')
+    b_search = batch_blast(arg, searched, log)
+    copied = 0
+    for query in unique:
+        q_search = b_search.query_search(homologues[query])
+        if not q_search.orthologues:
+            log.warning('No BLAST hits for ' + query + '. Skipping.')
+            #   The queries with the same CDS have no hits either
+            for copy in copies[query]:
+                log.warning(
+                    'No BLAST hits for ' + copy + ', which has the same CDS '
+                    'as ' + query + '. Skipping.')
+            continue
+        q_search.query = query
+        with q_search.get_hit_seqs() as unaligned:
+            msa, tree = align(dict(arg, fasta=query), unaligned, log)
+        for copy in copies[query]:
+            out_msa, out_tree = align_outputs(arg['output'], copy)
+            if dedup_queries.rename_outputs(
+                    msa, tree, records[query][0], records[copy][0],
+                    out_msa, out_tree):
+                log.info(
+                    copy + ' has the same CDS as ' + query + '. Copied the '
+                    'alignment to ' + out_msa + ' and the tree to ' +
+                    out_tree)
+                copied += 1
+                continue
+            #   If the query could not be renamed, align the copy on its own
+            log.warning(
+                'Could not rename ' + query + ' to ' + copy + ' in the '
+                'alignment. Aligning it separately.')
+            q_search.query = copy
+            with q_search.get_hit_seqs() as unaligned:
+                align(dict(arg, fasta=copy), unaligned, log)
+    log.info(
+        'Skipped ' + str(len(queries) - len(searched)) + ' BLAST searches '
+        'and ' + str(copied) + ' alignments of redundant queries.')
+    return
+
+
+def align_outputs(output, fasta):
+    """A function to return the paths that the alignment and the tree of a
+    query are copied to."""
+    new_nuc = os.path.join(
+        output,
+        os.path.basename(
+            fasta.replace(
+                '.fasta',
+                '_MSA.fasta')
+            )
+        )
+    new_tree = os.path.join(
+        output,
+        os.path.basename(
+            fasta.replace('.fasta', '.tree')
+            )
+        )
+    return (new_nuc, new_tree)
+
+
+def orthologues(arg, log, batch_size=100):
+    """A function to find the best hits of every CDS of the target species,
+    and store them in the orthologue table. The CDS are searched in batches,
+    and each batch is stored as soon as it is done, so that an interrupted
+    build can be picked up again."""
+    blastdeps = check_modules.check_modules(predict=True)
+    if blastdeps:
+        check_modules.missing_mods(blastdeps)
+        exit(1)
+    program = search_program(arg)
+    missing_reqs = check_modules.missing_executables(
+        [
+            arg['bash_path'],
+            arg['tblastx_path'] if program == 'tblastx' else program
+        ])
+    if missing_reqs:
+        log.error(
+            'Some required executables were not found on your system: ' +
+            '\n'.join(missing_reqs) + '\nPlease install them to continue.')
+        exit(1)
+    import tempfile
+    from Bio import SeqIO
+    import lrt_predict.Blast.blast_search as blast_search
+    import lrt_predict.Blast.orthologue_table as orthologue_table
+    table = orthologue_table.OrthologueTable(
+        arg['orthologue_table'],
+        arg['loglevel'])
+    #   A search with no queries yet, to find the parameters and databases
+    b_search = blast_search.BatchBlastSearch(
+        arg['base'],
+        arg['target'],
+        [],
+        arg['evalue'],
+        arg['num_cpus'],
+        arg['loglevel'])
+    configure_search(b_search, arg, log)
+    if not table.check_params(b_search.table_params(), store=True):
+        log.error(
+            'The orthologue table ' + arg['orthologue_table'] + ' was built '
+            'with different search parameters. Use a new table.')
+        exit(1)
+    databases = b_search.searched_databases()
+    #   Skip the CDS that are already in the table. The databases are checked
+    #   once, rather than for every CDS.
+    searched = table.searched_hashes(databases)
+    records = [
+        rec
+        for rec
+        in SeqIO.parse(arg['fasta'], 'fasta')
+        if table.seq_hash(rec.seq) not in searched]
+    log.info(str(len(records)) + ' CDS to search.')
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        #   BatchBlastSearch reads its queries from files
+        query_dir = tempfile.mkdtemp(prefix='BAD_Mutations_Orthologues_')
+        queries = []
+        for index, rec in enumerate(batch):
+            query = os.path.join(query_dir, str(index) + '.fasta')
+            SeqIO.write(rec, query, 'fasta')
+            queries.append(query)
+        b_search = blast_search.BatchBlastSearch(
+            arg['base'],
+            arg['target'],
+            queries,
+            arg['evalue'],
+            arg['num_cpus'],
+            arg['loglevel'])
+        configure_search(b_search, arg, log)
+        b_search.fetch_hits = False
+        b_search.blast_all()
+        for query, rec in zip(queries, batch):
+            table.add_query(
+                rec.id,
+                rec.seq,
+                b_search.batch_orthologues[query],
+                databases)
+        shutil.rmtree(query_dir)
+        log.info(
+            'Stored the orthologues of ' + str(start + len(batch)) + ' of ' +
+            str(len(records)) + ' CDS.')
+    table.close()
+    return
+
+
 def align(arg, unaligned, log):
-    """A function to align the homologous sequences with pasta, and return
-    the aligned sequences and the phylogenetic tree."""
+    """A function to align the homologous sequences with pasta, and copy the
+    aligned sequences and the phylogenetic tree into the output directory.
+    Returns the paths to the copies."""
     aligndeps = check_modules.check_modules(predict=True)
     if aligndeps:
         check_modules.missing_mods(aligndeps)
@@ -158,6 +553,15 @@ def align(arg, unaligned, log):
             'Some required executables were not found on your system: ' +
             '\n'.join(missing_reqs) + '\nPlease install them to continue.')
         exit(1)
+    #   MAFFT is only needed if it is asked for. Otherwise it is used for
+    #   small alignments if it is installed.
+    mafft_path = check_modules.check_executable(
+        arg.get('mafft_path') or 'mafft')
+    if arg.get('aligner') == 'mafft' and not mafft_path:
+        log.error(
+            'MAFFT was asked for, but was not found on your system. Please '
+            'install it, or set MAFFT in the configuration file.')
+        exit(1)
     #   Then we import the necessary modules
     import lrt_predict.Predict.align as aligner
     log.info('Creating a new instance of PastaAlign.')
@@ -168,42 +572,65 @@ def align(arg, unaligned, log):
         unaligned,
         arg['fasta'],
         arg['loglevel'])
+    #   The alignments are run one at a time, so each gets all of the CPUs
+    aln.threads = resources.tool_threads(arg)
+    aln.memory = arg.get('memory')
+    aln.check_codons = check_args.is_true(arg.get('check_codons'))
+    aln.mafft_path = mafft_path
+    if arg.get('species_tree'):
+        import lrt_predict.Predict.species_tree as species_tree
+        aln.species_tree = species_tree.read_tree(arg['species_tree'])
+        aln.species_tree_path = arg['species_tree']
+        aln.target = arg['target']
+    #   The tree of an earlier run of this gene can start PASTA
+    aln.previous_tree = align_outputs(arg['output'], arg['fasta'])[1]
     #   Prepare the sequences for alignment:
     #       Check length is multiple of 3
     #       Translate to protein
     #       Remove STOP codons
     nseqs = aln.prepare_sequences()
-    #   Then align them
-    if nseqs > 2:
-        stdout, stderr = aln.pasta_align()
-        log.debug('stdout: \n' + stdout.decode('utf-8'))
-        log.debug('stderr: \n' + stderr.decode('utf-8'))
-    else:
+    #   Then align them, with the aligner that suits the size of the
+    #   alignment unless one was asked for
+    backend = aligner.choose_aligner(
+        nseqs,
+        aln.max_length,
+        arg.get('aligner'),
+        bool(mafft_path))
+    if arg.get('aligner') == 'pasta' and backend != 'pasta':
         log.warning('Only two sequences; using clustal-omega for alignment.')
-        stdout, stderr = aln.clustalo_align()
-        log.debug('stdout: \n' + stdout.decode('utf-8'))
-        log.debug('stderr: \n' + stderr.decode('utf-8'))
-    #   Backtranslate the alignment
-    aln.back_translate()
-    #   Then sanitize the alignment and tree
-    aln.sanitize_outputs()
+    #   Size the Java heap of PASTA to the alignment, unless it was given.
+    #   The default heap is the least it gets, since PASTA ran out of memory
+    #   with less, and the estimate has not been measured.
+    if backend == 'pasta' and not arg.get('memory'):
+        aln.memory = str(max(
+            admission.estimate_mb('pasta', nseqs, aln.max_length),
+            resources.memory_mb(resources.DEFAULT_MEMORY))) + 'm'
+    #   The same sequences with the same programs give the same alignment and
+    #   tree, so they are read from the cache if they are in it
+    aln.cache = alignment_cache(arg, log)
+    key = None
+    if aln.cache is not None:
+        key = aln.cache_key(backend)
+    if key is not None and aln.cached_outputs(key):
+        log.info('Using the cached alignment and tree for ' + arg['fasta'])
+    else:
+        log.info(
+            'Aligning ' + str(nseqs) + ' sequences of up to ' +
+            str(aln.max_length) + ' residues with ' + backend + '.')
+        ledger = memory_ledger(arg, log)
+        if ledger is None:
+            run_alignment(aln, backend, log)
+        else:
+            with ledger.admit(
+                    alignment_memory(aln, backend, nseqs),
+                    backend + ' for ' + arg['fasta']):
+                run_alignment(aln, backend, log)
+        if key is not None:
+            aln.save_outputs(key)
     #   Then copy them over
     log.info('Nucleotide alignment in ' + aln.final_aln)
     log.info('Tree in ' + aln.tree_out)
-    new_nuc = os.path.join(
-        arg['output'],
-        os.path.basename(
-            arg['fasta'].replace(
-                '.fasta',
-                '_MSA.fasta')
-            )
-        )
-    new_tree = os.path.join(
-        arg['output'],
-        os.path.basename(
-            arg['fasta'].replace('.fasta', '.tree')
-            )
-        )
+    new_nuc, new_tree = align_outputs(arg['output'], arg['fasta'])
     open(new_nuc, 'w').close()
     open(new_tree, 'w').close()
     shutil.copy2(aln.final_aln, new_nuc)
@@ -212,6 +639,28 @@ def align(arg, unaligned, log):
     log.info('Tree copied to ' + new_tree)
     #   Cleanup the temporary file
     os.remove(aln.final_aln)
+    return (new_nuc, new_tree)
+
+
+def run_alignment(aln, backend, log):
+    """A function to align the prepared sequences, estimate the tree if the
+    aligner does not, back-translate the alignment, and sanitize the alignment
+    and the tree for HyPhy."""
+    stdout, stderr = aln.run_aligner(backend)
+    log.debug('stdout: \n' + stdout.decode('utf-8'))
+    log.debug('stderr: \n' + stderr.decode('utf-8'))
+    #   A pruned species tree takes the place of the gene tree, if there is one
+    if aln.species_tree is not None:
+        aln.prune_species_tree()
+    #   Only PASTA estimates a tree along with the alignment
+    if aln.tree_out is None:
+        stdout, stderr = aln.build_tree()
+        log.debug('stdout: \n' + stdout.decode('utf-8'))
+        log.debug('stderr: \n' + stderr.decode('utf-8'))
+    #   Backtranslate the alignment
+    aln.back_translate()
+    #   Then sanitize the alignment and tree
+    aln.sanitize_outputs()
     return
 
 
@@ -243,11 +692,38 @@ def predict(arg, log):
         arg['fasta'],
         arg['substitutions'],
         arg['loglevel'])
+    lrt.threads = resources.tool_threads(arg)
+    lrt.fit_threads = lrt.threads
+    #   The fit of the model to the whole alignment is the same for every
+    #   prediction on the same alignment and tree, so it is cached
+    lrt.fit_cache = fit_cache(arg, log)
     lrt.get_query_position()
     lrt.get_aligned_positions()
+    #   The positions can be split between several HyPhy runs, which share the
+    #   CPUs like the BLAST searches do. The shared fit runs before them, with
+    #   all of the threads.
+    if arg.get('site_shards'):
+        lrt.shards = max(
+            1,
+            min(int(arg['site_shards']), len(lrt.aligned_pos)))
+    if lrt.shards > 1:
+        lrt.workers, lrt.threads = resources.split_cores(
+            arg.get('num_cpus'),
+            lrt.shards,
+            arg.get('tool_threads'))
     lrt.write_aligned_subs()
     lrt.prepare_hyphy_inputs()
-    outputfile = lrt.predict_codons()
+    ledger = memory_ledger(arg, log)
+    if ledger is None:
+        outputfile = lrt.predict_codons()
+    else:
+        need = admission.estimate_mb(
+            'hyphy',
+            len(lrt.nmsa),
+            lrt.nmsa.get_alignment_length() // 3) * lrt.workers
+        need += admission.OVERHEAD_MB
+        with ledger.admit(need, 'HyPhy for ' + arg['fasta']):
+            outputfile = lrt.predict_codons()
     return outputfile
 
 
@@ -346,30 +822,43 @@ def main():
             setup(arguments_valid)
         elif arguments_valid['action'] == 'fetch':
             fetch(arguments_valid, loglevel)
+        elif arguments_valid['action'] == 'align' and \
+                arguments_valid['fasta_list']:
+            #   Search with every query at once, then align them one by one
+            with scratch_dir(arguments_valid, loglevel):
+                batch_align(arguments_valid, loglevel)
         elif arguments_valid['action'] == 'align':
-            #   We will return the filename that contains the unaligned
-            #   sequences, as we will use these as inputs for pasta
-            unaligned_seqs = blast(arguments_valid, loglevel)
-            #   Then add the query sequence and align them
-            align(
-                arguments_valid,
-                unaligned_seqs,
-                loglevel)
+            with scratch_dir(arguments_valid, loglevel):
+                #   We will return the filename that contains the unaligned
+                #   sequences, as we will use these as inputs for pasta
+                unaligned_seqs = blast(arguments_valid, loglevel)
+                #   Then add the query sequence and align them
+                align(
+                    arguments_valid,
+                    unaligned_seqs,
+                    loglevel)
+                #   Close it before the scratch directory is removed
+                unaligned_seqs.close()
+        elif arguments_valid['action'] == 'orthologues':
+            with scratch_dir(arguments_valid, loglevel):
+                orthologues(arguments_valid, loglevel)
         elif arguments_valid['action'] == 'predict':
-            out = predict(arguments_valid, loglevel)
-            #   copy the output file into the destination directory
-            #   To build the output filename, we join the output directory
-            #   with a new name based on the input filename
-            out_fname = os.path.join(
-                arguments_valid['output'],
-                os.path.basename(
-                    arguments_valid['fasta'].replace(
-                        '.fasta',
-                        '_Predictions.txt')
+            with scratch_dir(arguments_valid, loglevel):
+                out = predict(arguments_valid, loglevel)
+                #   copy the output file into the destination directory
+                #   To build the output filename, we join the output directory
+                #   with a new name based on the input filename
+                out_fname = os.path.join(
+                    arguments_valid['output'],
+                    os.path.basename(
+                        arguments_valid['fasta'].replace(
+                            '.fasta',
+                            '_Predictions.txt')
+                        )
                     )
-                )
-            open(out_fname, 'w').close()
-            shutil.copy2(out.name, out_fname)
+                open(out_fname, 'w').close()
+                shutil.copy2(out.name, out_fname)
+                out.close()
             loglevel.info('Prediction in ' + out_fname)
         elif arguments_valid['action'] == 'compile':
             compile_preds(arguments_valid, loglevel)
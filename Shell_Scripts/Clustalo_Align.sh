@@ -1,7 +1,7 @@
 #!/bin/bash
 #   Written by Thomas Kono, based off Prank_Align.sh from Paul Hoffman
-#   Shell script to run Clustal-omega on an input FASTA sequence then run
-#   fasttree to generate a Newick tree
+#   Shell script to run Clustal-omega on an input FASTA sequence. The tree is
+#   made separately, with FastTree.sh
 
 set -e
 set -u
@@ -10,18 +10,16 @@ set -o pipefail
 CLUSTALO="${1}"
 INPUT="${2}"
 OUTPUT="${3}"
-FASTTREE="${4}"
+#   Number of threads. Defaults to 1.
+NCPU="${4:-1}"
 
 # Run the alignment
 "${CLUSTALO}" \
     --infmt=fasta \
     -t Protein \
     --full-iter \
-    --threads=1 \
+    --threads="${NCPU}" \
     --outfmt=fasta \
     --force \
     -i "${INPUT}" \
     -o "${OUTPUT}"
-
-# then make a tree
-"${FASTTREE}" "${OUTPUT}" > "${OUTPUT/.fasta/.tre}"
@@ -0,0 +1,16 @@
+#!/bin/bash
+#   Shell script to estimate a Newick tree from an amino acid alignment with
+#   FastTree
+
+set -e
+set -u
+set -o pipefail
+
+FASTTREE="${1}"
+INPUT="${2}"
+OUTPUT="${3}"
+#   Number of threads. Defaults to 1. FastTreeMP reads OMP_NUM_THREADS.
+NCPU="${4:-1}"
+export OMP_NUM_THREADS="${NCPU}"
+
+"${FASTTREE}" "${INPUT}" > "${OUTPUT}"
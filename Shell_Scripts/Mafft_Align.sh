@@ -0,0 +1,22 @@
+#!/bin/bash
+#   Shell script to run MAFFT on an input FASTA sequence. The tree is made
+#   separately, with FastTree.sh
+
+set -e
+set -u
+set -o pipefail
+
+MAFFT="${1}"
+INPUT="${2}"
+OUTPUT="${3}"
+#   Number of threads. Defaults to 1.
+NCPU="${4:-1}"
+
+#   --auto picks L-INS-i for small alignments, and faster strategies for
+#   larger ones
+"${MAFFT}" \
+    --auto \
+    --amino \
+    --thread "${NCPU}" \
+    --quiet \
+    "${INPUT}" > "${OUTPUT}"
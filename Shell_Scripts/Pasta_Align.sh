@@ -6,10 +6,6 @@ set -e
 set -u
 set -o pipefail
 
-#   We have to set this environment variable to increase the java heap space,
-#   else it runs out of memory someitmes and fails to finish an alignment.
-export _JAVA_OPTIONS="-Xmx4g"
-
 #   Path to the Pasta executable as an argument
 PASTA=$1
 #   Input sequence as an argument
@@ -18,13 +14,37 @@ INPUT=$2
 TEMP_DIR=$3
 #   Job name
 JOBNAME=$4
+#   Number of CPUs. Defaults to 1.
+NCPU=${5:-1}
+#   Java heap size. Defaults to 4g.
+MEMORY=${6:-4g}
+#   Starting tree. Defaults to none, in which case Pasta makes its own.
+START_TREE=${7:-}
+#   Number of iterations without a better score to stop after. Defaults to
+#   none, in which case Pasta runs all of the iterations.
+STALL_LIMIT=${8:-}
+
+#   We have to set this environment variable to increase the java heap space,
+#   else it runs out of memory someitmes and fails to finish an alignment.
+export _JAVA_OPTIONS="-Xmx${MEMORY}"
+
+EXTRA_ARGS=()
+if [ -n "${START_TREE}" ]
+    then
+        EXTRA_ARGS+=("--treefile=${START_TREE}")
+fi
+if [ -n "${STALL_LIMIT}" ]
+    then
+        EXTRA_ARGS+=("--iter-without-imp-limit=${STALL_LIMIT}")
+fi
 
 $PASTA \
     -d protein\
     --no-return-final-tree-and-alignment\
-    --num-cpus=1\
+    --num-cpus=${NCPU}\
     --job=$JOBNAME\
     --iter-limit=5\
     --temporaries=${TEMP_DIR}\
+    ${EXTRA_ARGS[@]+"${EXTRA_ARGS[@]}"}\
     -i $INPUT\
     -o ${TEMP_DIR}
@@ -11,5 +11,14 @@ HYPHY="$1"
 PREDICTION_SCRIPT="$2"
 INPUT="$3"
 OUTPUT="$4"
+#   Number of threads for HyPhy. Defaults to 1.
+NCPU="${5:-1}"
 
-${HYPHY} ${PREDICTION_SCRIPT} <<< ${INPUT} > ${OUTPUT}
+#   Multithreaded HyPhy takes the number of threads as CPU=. Older builds do
+#   not take it, so only pass it if more than one thread is asked for.
+if [ "${NCPU}" -gt 1 ]
+    then
+        ${HYPHY} CPU=${NCPU} ${PREDICTION_SCRIPT} <<< ${INPUT} > ${OUTPUT}
+else
+    ${HYPHY} ${PREDICTION_SCRIPT} <<< ${INPUT} > ${OUTPUT}
+fi
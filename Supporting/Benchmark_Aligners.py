@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""Supporting script for BAD_Mutations that compares the aligners that the
+align subcommand can use, to check the size cutoffs of choose_aligner(). The
+homologues of each gene are cut down to several numbers of sequences, and
+each subset is aligned with PASTA, Clustal-omega, and MAFFT. The trees of
+Clustal-omega and MAFFT are estimated with FastTree, as in the align
+subcommand. The CPU and wall time of each aligner and its tree are recorded,
+and each alignment is compared with the PASTA alignment by the fraction of
+the pairs of residues that PASTA aligns that it also aligns. Takes five
+arguments, and optional more:
+    1) Path to PASTA
+    2) Path to Clustal-omega
+    3) Path to MAFFT
+    4) Path to FastTree
+    5) Output file for the per-subset results
+    6) FASTA files of unaligned homologous CDS, with the query first
+       (optional). Defaults to the alignments in Test_Data/MSA, with the gaps
+       removed.
+Writes a summary of the mean time and agreement with PASTA of each aligner,
+in bins of the number of sequences and the longest protein, to stdout.
+"""
+
+import sys
+import os
+import glob
+import time
+import resource
+import tempfile
+
+#   The lrt_predict package is one directory up from this script
+LRT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, LRT_PATH)
+from lrt_predict.Predict import align
+from lrt_predict.Predict import codons
+
+#   Numbers of sequences to cut each gene down to. PASTA needs at least 3.
+SIZES = [3, 5, 10, 20, 30, 50, 100]
+#   Aligners to compare. The first one is the reference.
+BACKENDS = ['pasta', 'clustalo', 'mafft']
+#   Bins of the summary, as the largest number of sequences and the longest
+#   protein of each bin. They bracket the cutoffs of choose_aligner().
+SEQ_BINS = [align.PROGRESSIVE_MAX_SEQS, float('inf')]
+LENGTH_BINS = [align.PROGRESSIVE_MAX_LENGTH, float('inf')]
+
+try:
+    pasta_path, clustalo_path, mafft_path, fasttree_path, out_file = \
+        sys.argv[1:6]
+except ValueError:
+    sys.stderr.write(__doc__)
+    exit(1)
+
+genes = sys.argv[6:]
+if not genes:
+    genes = sorted(glob.glob(os.path.join(LRT_PATH, 'Test_Data', 'MSA', '*')))
+
+
+def child_cpu():
+    """Return the CPU time used by finished child processes, in seconds."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def subsets(fname):
+    """Return the subsets of the homologues of one gene, as lists of (name,
+    CDS) tuples. Gaps are removed, so that alignments can be used as input."""
+    records = [
+        (name, cds.replace('-', ''))
+        for name, cds
+        in codons.read_fasta(fname)]
+    sizes = [size for size in SIZES if size < len(records)]
+    sizes.append(len(records))
+    return [records[:size] for size in sizes if size >= 3]
+
+
+def aligned_pairs(fname):
+    """Return the set of pairs of residues that an alignment puts in the same
+    column. Residues are numbered within their sequence."""
+    records = codons.read_fasta(fname)
+    counters = [0] * len(records)
+    pairs = set()
+    for col in range(max(len(seq) for name, seq in records)):
+        residues = []
+        for index, (name, seq) in enumerate(records):
+            if col < len(seq) and seq[col] != '-':
+                residues.append((name, counters[index]))
+                counters[index] += 1
+        for i in range(len(residues)):
+            for j in range(i + 1, len(residues)):
+                pairs.add((residues[i], residues[j]))
+    return pairs
+
+
+def run_backend(subset, backend):
+    """Align one subset with one aligner, and estimate the tree if the aligner
+    does not. Returns the CPU time, the wall time, the longest protein, and
+    the path to the amino acid alignment."""
+    unaligned = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        prefix='BAD_Mutations_Benchmark_',
+        suffix='.fasta')
+    codons.write_fasta(unaligned, subset)
+    unaligned.flush()
+    aln = align.PastaAlign(
+        pasta_path,
+        clustalo_path,
+        fasttree_path,
+        unaligned,
+        subset[0][0],
+        'WARNING')
+    aln.mafft_path = mafft_path
+    aln.prepare_sequences()
+    cpu = child_cpu()
+    wall = time.time()
+    aln.run_aligner(backend)
+    if aln.tree_out is None:
+        aln.build_tree()
+    cpu = child_cpu() - cpu
+    wall = time.time() - wall
+    unaligned.close()
+    return (cpu, wall, aln.max_length, aln.aln_out)
+
+
+def bin_of(nseqs, length):
+    """Return the summary bin of a subset."""
+    seq_bin = [b for b in SEQ_BINS if nseqs <= b][0]
+    length_bin = [b for b in LENGTH_BINS if length <= b][0]
+    return (seq_bin, length_bin)
+
+
+#   Sums of CPU time, wall time, agreement, and count per bin and aligner
+totals = {}
+with open(out_file, 'w') as out:
+    out.write('\t'.join([
+        'Gene', 'Sequences', 'Max_Length', 'Aligner', 'CPU_Seconds',
+        'Wall_Seconds', 'Same_As_PASTA']) + '\n')
+    for gene in genes:
+        for subset in subsets(gene):
+            reference = None
+            for backend in BACKENDS:
+                cpu, wall, length, aln_out = run_backend(subset, backend)
+                pairs = aligned_pairs(aln_out)
+                if reference is None:
+                    reference = pairs
+                same = float(len(pairs & reference)) / len(reference) \
+                    if reference else 1.0
+                key = bin_of(len(subset), length) + (backend,)
+                total = totals.setdefault(key, [0.0, 0.0, 0.0, 0])
+                total[0] += cpu
+                total[1] += wall
+                total[2] += same
+                total[3] += 1
+                out.write('\t'.join([
+                    os.path.basename(gene), str(len(subset)), str(length),
+                    backend, '%.2f' % cpu, '%.2f' % wall,
+                    '%.3f' % same]) + '\n')
+
+sys.stdout.write(
+    'Max_Sequences\tMax_Length\tAligner\tSubsets\tMean_CPU_Seconds\t'
+    'Mean_Wall_Seconds\tMean_Same_As_PASTA\n')
+for key in sorted(totals):
+    seq_bin, length_bin, backend = key
+    cpu, wall, same, count = totals[key]
+    sys.stdout.write('\t'.join([
+        str(seq_bin), str(length_bin), backend, str(count),
+        '%.2f' % (cpu / count), '%.2f' % (wall / count),
+        '%.3f' % (same / count)]) + '\n')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Supporting script for BAD_Mutations that compares the homology search
+programs. Each query is searched against every species database with tblastx,
+blastp, and tblastn, and with tblastx after the k-mer prefilter. The CPU time
+of the BLAST processes and the best hit in each species are recorded. The best
+hits of the other searches are compared to those of the exhaustive tblastx
+search. Takes four arguments, and an optional fifth:
+    1) Base directory with the species databases, made by the fetch subcommand
+    2) Target species, which is not searched
+    3) E-value threshold
+    4) Output file for the per-query results
+    5) Query FASTA files (optional). Defaults to the FASTA files in Test_Data
+Writes a summary of the total CPU time, agreement with tblastx, and speedup
+over tblastx of each search to stdout.
+"""
+
+import sys
+import os
+import glob
+import time
+import resource
+
+#   The lrt_predict package is one directory up from this script
+LRT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, LRT_PATH)
+from lrt_predict.Blast import blast_search
+
+#   Number of candidates per species for the prefiltered search
+PREFILTER = 50
+#   Name, search program, and prefilter of each search. The first one is the
+#   reference.
+SEARCHES = [
+    ('tblastx', 'tblastx', None),
+    ('blastp', 'blastp', None),
+    ('tblastn', 'tblastn', None),
+    ('tblastx_prefilter', 'tblastx', PREFILTER)]
+
+try:
+    base = sys.argv[1]
+    target = sys.argv[2]
+    evalue = float(sys.argv[3])
+    out_file = sys.argv[4]
+except (IndexError, ValueError):
+    sys.stderr.write(__doc__)
+    exit(1)
+
+queries = sys.argv[5:]
+if not queries:
+    queries = sorted(glob.glob(os.path.join(LRT_PATH, 'Test_Data', '*.fasta')))
+
+
+def child_cpu():
+    """Return the CPU time used by finished child processes, in seconds."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_search(query, program, prefilter):
+    """Search one query with one program. Returns the CPU time, the wall time,
+    and a dictionary of the name of the best hit in each species database."""
+    b_search = blast_search.BlastSearch(base, target, query, evalue, 1, 0)
+    b_search.program = program
+    b_search.prefilter = prefilter
+    cpu = child_cpu()
+    wall = time.time()
+    b_search.blast_all()
+    cpu = child_cpu() - cpu
+    wall = time.time() - wall
+    #   Compare on the name of the CDS, which is the same in the CDS and
+    #   protein databases, and in the prefiltered subjects
+    hits = dict(
+        (db, hit[1])
+        for db, hit
+        in b_search.orthologues.items())
+    return (cpu, wall, hits)
+
+
+totals = dict((name, [0.0, 0.0, 0, 0]) for name, p, n in SEARCHES)
+with open(out_file, 'w') as out:
+    out.write('\t'.join([
+        'Query', 'Search', 'CPU_Seconds', 'Wall_Seconds', 'Species_Hit',
+        'Same_As_tblastx']) + '\n')
+    for query in queries:
+        reference = None
+        for name, program, prefilter in SEARCHES:
+            cpu, wall, hits = run_search(query, program, prefilter)
+            if reference is None:
+                reference = hits
+            #   Count the species where the best hit is the same CDS as the
+            #   tblastx best hit, including species that neither one hit
+            same = len([
+                db
+                for db
+                in set(hits) | set(reference)
+                if hits.get(db) == reference.get(db)])
+            totals[name][0] += cpu
+            totals[name][1] += wall
+            totals[name][2] += same
+            totals[name][3] += len(set(hits) | set(reference))
+            out.write('\t'.join([
+                os.path.basename(query), name, '%.2f' % cpu, '%.2f' % wall,
+                str(len(hits)), str(same)]) + '\n')
+
+sys.stdout.write('Search\tCPU_Seconds\tWall_Seconds\tAgreement\tSpeedup\n')
+ref_cpu = totals[SEARCHES[0][0]][0]
+for name, program, prefilter in SEARCHES:
+    cpu, wall, same, total = totals[name]
+    agree = float(same) / total if total else 1.0
+    speedup = ref_cpu / cpu if cpu else 0.0
+    sys.stdout.write(
+        name + '\t%.2f\t%.2f\t%.3f\t%.1f\n' % (cpu, wall, agree, speedup))
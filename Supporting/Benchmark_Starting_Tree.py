@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Supporting script for BAD_Mutations that checks the starting tree of PASTA.
+Each gene is aligned with PASTA from scratch, from the tree of an earlier run,
+and from the species tree if one is given. The trees of the earlier runs are
+the trees in Test_Data/Tree. The CPU and wall time of PASTA are recorded, and
+the substitutions of the gene are predicted with HyPhy on each alignment and
+tree. The P-values of the LRT are compared with those of the alignment that
+PASTA made from scratch. Takes five arguments, and optional two more:
+    1) Path to PASTA
+    2) Path to Clustal-omega
+    3) Path to FastTree
+    4) Path to HyPhy
+    5) Output file for the per-gene results
+    6) Species tree in Newick format (optional)
+    7) Target species, for the species tree (optional)
+The genes are the ones in Test_Data: the sequences of Test_Data/MSA, with the
+gaps removed, and the query and substitutions of Test_Data.
+Writes a summary of the mean time and agreement with PASTA from scratch of
+each starting tree to stdout.
+"""
+
+import sys
+import os
+import glob
+import math
+import time
+import resource
+import tempfile
+
+#   The lrt_predict package is one directory up from this script
+LRT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, LRT_PATH)
+from lrt_predict.Predict import align
+from lrt_predict.Predict import codons
+from lrt_predict.Predict import predict
+from lrt_predict.Predict import species_tree
+
+#   P-value cutoff to compare the calls at. The agreement of the calls is
+#   reported next to the difference of the P-values, since a small change of
+#   a P-value only matters if it crosses the cutoff.
+P_CUTOFF = 0.05
+#   Starting trees to compare. The first one is the reference.
+STARTS = ['none', 'earlier_run', 'species_tree']
+
+try:
+    pasta_path, clustalo_path, fasttree_path, hyphy_path, out_file = \
+        sys.argv[1:6]
+except ValueError:
+    sys.stderr.write(__doc__)
+    exit(1)
+
+if len(sys.argv) > 6:
+    try:
+        species, target = sys.argv[6:8]
+    except ValueError:
+        sys.stderr.write(__doc__)
+        exit(1)
+    species = species_tree.read_tree(species)
+else:
+    species, target = (None, None)
+    STARTS.remove('species_tree')
+
+genes = sorted(
+    os.path.basename(fname).replace('.subs', '')
+    for fname
+    in glob.glob(os.path.join(LRT_PATH, 'Test_Data', '*.subs')))
+
+
+def child_cpu():
+    """Return the CPU time used by finished child processes, in seconds."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_pasta(gene, start):
+    """Align the homologues of one gene with PASTA from one starting tree.
+    Returns the CPU time, the wall time, and the paths to the back-translated
+    alignment and the tree."""
+    records = [
+        (name, cds.replace('-', ''))
+        for name, cds
+        in codons.read_fasta(
+            os.path.join(LRT_PATH, 'Test_Data', 'MSA', gene + '_MSA.fasta'))]
+    unaligned = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        prefix='BAD_Mutations_Benchmark_',
+        suffix='.fasta')
+    codons.write_fasta(unaligned, records)
+    unaligned.flush()
+    aln = align.PastaAlign(
+        pasta_path,
+        clustalo_path,
+        fasttree_path,
+        unaligned,
+        os.path.join(LRT_PATH, 'Test_Data', gene + '.fasta'),
+        'WARNING')
+    if start == 'earlier_run':
+        aln.previous_tree = os.path.join(
+            LRT_PATH, 'Test_Data', 'Tree', gene + '.tree')
+    elif start == 'species_tree':
+        aln.species_tree = species
+        aln.target = target
+    aln.prepare_sequences()
+    cpu = child_cpu()
+    wall = time.time()
+    aln.run_aligner('pasta')
+    cpu = child_cpu() - cpu
+    wall = time.time() - wall
+    aln.back_translate()
+    aln.sanitize_outputs()
+    unaligned.close()
+    return (cpu, wall, aln.final_aln, aln.tree_out)
+
+
+def query_columns(lrt):
+    """Return a dictionary of the first column of each codon of the query in
+    the alignment, by the number of the codon. The columns of the same codon
+    differ between alignments, so the P-values are compared by codon."""
+    columns = {}
+    real_position = 0
+    for index, column in enumerate(lrt.nmsa[lrt.query_pos].seq):
+        if column == '-':
+            continue
+        real_position += 1
+        if real_position % 3 == 0:
+            columns[index - 2] = real_position // 3
+    return columns
+
+
+def run_hyphy(gene, aln_path, tree_path):
+    """Predict the substitutions of one gene with HyPhy. Returns a dictionary
+    of the P-value of the LRT by the number of the codon."""
+    lrt = predict.LRTPredict(
+        hyphy_path,
+        aln_path,
+        tree_path,
+        os.path.join(LRT_PATH, 'Test_Data', gene + '.fasta'),
+        os.path.join(LRT_PATH, 'Test_Data', gene + '.subs'),
+        'WARNING')
+    lrt.get_query_position()
+    lrt.get_aligned_positions()
+    lrt.prepare_hyphy_inputs()
+    report = lrt.predict_codons()
+    report.seek(0)
+    columns = query_columns(lrt)
+    p_values = {}
+    for line in report:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 6 or 'NOSNP' in line:
+            continue
+        try:
+            codon = columns.get(int(fields[0]))
+            p_value = float(fields[5])
+        except ValueError:
+            continue
+        if codon is not None:
+            p_values[codon] = p_value
+    return p_values
+
+
+def log_difference(p1, p2):
+    """Return the absolute difference of the log10 of two P-values."""
+    tiny = 1e-300
+    return abs(math.log10(max(p1, tiny)) - math.log10(max(p2, tiny)))
+
+
+#   Sums of CPU time, wall time, log10 P-value difference, same calls, codons
+#   compared, and genes per starting tree
+totals = dict((start, [0.0, 0.0, 0.0, 0, 0, 0]) for start in STARTS)
+with open(out_file, 'w') as out:
+    out.write('\t'.join([
+        'Gene', 'Start', 'CPU_Seconds', 'Wall_Seconds', 'Codons',
+        'Max_Log10_P_Difference', 'Same_Call']) + '\n')
+    for gene in genes:
+        reference = None
+        for start in STARTS:
+            cpu, wall, aln_path, tree_path = run_pasta(gene, start)
+            p_values = run_hyphy(gene, aln_path, tree_path)
+            if reference is None:
+                reference = p_values
+            shared = sorted(set(p_values) & set(reference))
+            diffs = [
+                log_difference(p_values[codon], reference[codon])
+                for codon
+                in shared]
+            same = len([
+                codon
+                for codon
+                in shared
+                if (p_values[codon] < P_CUTOFF) ==
+                (reference[codon] < P_CUTOFF)])
+            total = totals[start]
+            total[0] += cpu
+            total[1] += wall
+            total[2] += sum(diffs)
+            total[3] += same
+            total[4] += len(shared)
+            total[5] += 1
+            out.write('\t'.join([
+                gene, start, '%.2f' % cpu, '%.2f' % wall, str(len(shared)),
+                '%.4f' % max(diffs + [0.0]), str(same)]) + '\n')
+
+sys.stdout.write(
+    'Start\tGenes\tMean_CPU_Seconds\tMean_Wall_Seconds\t'
+    'Mean_Log10_P_Difference\tSame_Call\tSpeedup\n')
+ref_wall = totals[STARTS[0]][1]
+for start in STARTS:
+    cpu, wall, diff, same, compared, count = totals[start]
+    mean_diff = diff / compared if compared else 0.0
+    agree = float(same) / compared if compared else 1.0
+    speedup = ref_wall / wall if wall else 0.0
+    sys.stdout.write('\t'.join([
+        start, str(count), '%.2f' % (cpu / count), '%.2f' % (wall / count),
+        '%.4f' % mean_diff, '%.3f' % agree, '%.1f' % speedup]) + '\n')
@@ -5,20 +5,37 @@
 import tempfile
 import os
 import re
+import json
+import logging
+from multiprocessing.pool import ThreadPool
 
 #   Import the Biopython library
 from Bio.Blast.Applications import NcbitblastxCommandline
+from Bio.Blast.Applications import NcbiblastpCommandline
+from Bio.Blast.Applications import NcbitblastnCommandline
 from Bio.Blast import NCBIXML
 from Bio import SeqIO
 
 #   Import the script to give verbose messages
 from lrt_predict.General import set_verbosity
-#   Operate on files
-from lrt_predict.General import file_funcs
 #   For checking for the presence of executables
 from lrt_predict.General import check_modules
 #   For fetching sequences from the BLAST databases
 from lrt_predict.Blast import sequence_fetch
+#   For fetching sequences from the FASTA files, without blastdbcmd
+from lrt_predict.Blast import fasta_index
+#   For translating queries for the protein search programs
+from lrt_predict.Fetch import format_blast
+#   For searching all species at once
+from lrt_predict.Fetch import merge_db
+#   For picking candidate subjects before searching
+from lrt_predict.Fetch import kmer_index
+#   For finding the species databases without walking the base directory
+from lrt_predict.Fetch import catalog
+#   For picking a subset of the species to search
+from lrt_predict.Blast import species_select
+#   For splitting the CPUs between searches and BLAST threads
+from lrt_predict.General import resources
 
 
 #   A class to handle our BLAST searches
@@ -37,34 +54,200 @@ class BlastSearch(object):
     gen_output():
         Creates a temporary file for storing BLAST output. Returns a filename
 
+    translate_query():
+        Translates a CDS query file into amino acids, for the blastp and
+        tblastn search programs.
+
     run_blast():
-        Runs tblastx with a query sequence on a databse. Uses the filename
-        from gen_output() to save the XML report. Returns the filename with
-        the NCBI XML BLAST output.
+        Runs the search program (tblastx, blastp, or tblastn) with a query
+        sequence on a databse. Uses the filename from gen_output() to save the
+        report. Returns the file with the tabular or NCBI XML BLAST output,
+        depending on `outfmt'.
+
+    tabular_hits():
+        Lazily read through a tabular BLAST report, yielding the query name,
+        hit title, and E-value of each HSP.
 
     get_seq_id():
+        Return the sequence ID of the best hit in a BLAST report. Dispatches
+        to get_seq_id_tabular() or get_seq_id_xml().
+
+    get_seq_id_tabular():
+        Read through the tabular BLAST report and stop at the first HSP that
+        passes the E-value threshold.
+
+    get_seq_id_xml():
         Read through the BLAST XML and find the BlastRecord that has the
         lowest E-value. Feed that BlastRecord to best_hit(), and return the
         sequence ID of the hit.
 
+    xml_hits():
+        Read through a BLAST XML report, yielding the query name, hit title,
+        and E-value of each HSP, like tabular_hits().
+
+    hit_from_title():
+        Split a hit title into a (sequence ID, GenBank ID) tuple.
+
+    local_db():
+        Return the path to read a database from, which is its node-local
+        copy if the databases are staged.
+
+    get_databases():
+        Find the species databases to search, skipping the target species.
+        If max_species is set, only a subset of them is searched.
+
+    select_species():
+        Pick at most max_species databases, spread across the clades of the
+        clade table, and report the search time that is saved.
+
+    prefilter_subjects():
+        Use the k-mer index of a species database to write the few records
+        that are most like the queries into a FASTA file, to search instead
+        of the whole database.
+
+    search_params():
+        Return the BLAST parameters that change which hit is the best one.
+
+    table_params():
+        Return the parameters that an orthologue table must have been built
+        with to be used for this search.
+
+    searched_databases():
+        Return the species databases that blast_all() stores hits for.
+
+    cache_key():
+        Build the key for a cached best hit, from the query sequence, the
+        identity of the database, and the search parameters.
+
+    search_database():
+        Run BLAST against one species database and return the best hit as a
+        (sequence ID, GenBank ID) tuple, or None if there is no hit. Checks
+        the orthologue table and the best-hit cache first, if there are any.
+
+    search_and_fetch():
+        Worker function for the parallel search. Searches one database and
+        fetches the sequence of the best hit as soon as the search is done.
+
+    merged_species():
+        Read the species tags of the merged database.
+
+    merged_targets():
+        Return the species databases that hits from the merged database are
+        stored for.
+
+    merged_best_hits():
+        Search the merged database once, and return the best hit in each
+        species for every query in the search.
+
+    search_merged():
+        Return the best hit in each species, from the best-hit cache or from
+        merged_best_hits().
+
+    blast_merged():
+        Search the merged database, fetch the hits, and store them under
+        their species databases, leaving out the target species.
+
     blast_all():
         BLAST search the provided query sequence against each species databse.
-        Return the list of best BLAST hits.
+        Return the list of best BLAST hits. If more than one CPU is available,
+        the databases are searched concurrently. If the merged database is
+        used, all species are searched at once instead.
+
+    fetch_hit_seq():
+        Get the FASTA sequence of a single hit out of a species database.
+
+    fetch_seqs():
+        Get the FASTA sequences of many hits out of one species database,
+        with a single call to blastdbcmd. Hits found by searching prefiltered
+        subjects are read from the FASTA file instead.
 
     get_hit_seqs():
         Using the output from blast_all(), get the FASTA sequence of each of
         the homologous sequences and write them into a temporary file.
     """
 
-    def __init__(self, base, target, query, evalue, verbose):
+    #   Columns of the tabular BLAST report. The subject title is last, since
+    #   it can contain spaces.
+    TAB_FIELDS = [
+        'qseqid',
+        'sseqid',
+        'evalue',
+        'bitscore',
+        'nident',
+        'length',
+        'sstart',
+        'send',
+        'qframe',
+        'sframe',
+        'stitle']
+
+    #   How many subject sequences to keep in the BLAST report
+    MAX_TARGET_SEQS = 5
+
+    #   How many subject sequences per species to keep in the BLAST report of
+    #   the merged database. This is larger than MAX_TARGET_SEQS, since the
+    #   paralogues in one species can push the others out of the report.
+    MERGED_TARGET_SEQS = 20
+
+    #   How many sampled k-mers a record must share with the query to be a
+    #   candidate for the prefiltered search. If no record shares this many,
+    #   the whole database is searched.
+    PREFILTER_MIN_SHARED = 2
+
+    #   Search programs that we support, and the command line wrapper for each
+    PROGRAMS = {
+        'tblastx': NcbitblastxCommandline,
+        'blastp': NcbiblastpCommandline,
+        'tblastn': NcbitblastnCommandline}
+
+    def __init__(self, base, target, query, evalue, ncpu, verbose):
         """Initialize the class with base directory, query sequence, e-value
-        threshold and verbosity level."""
+        threshold, number of CPUs to search with, and verbosity level."""
         self.query = query
         self.evalue = float(evalue)
+        self.ncpu = int(ncpu) if ncpu else 1
         self.orthologues = {}
+        #   Sequences of the hits, keyed on database. These are filled in by
+        #   the parallel search as each database finishes.
+        self.hit_seqs = {}
+        self.verbose = verbose
         self.mainlog = set_verbosity.verbosity('BLAST_Search', verbose)
         self.basedir = base
         self.target = target
+        #   BLAST report format: 'tabular' is faster to parse, 'xml' is kept
+        #   for debugging.
+        self.outfmt = 'tabular'
+        #   Search program. tblastx searches the CDS databases in six frames,
+        #   blastp searches the translated query against the protein
+        #   databases made by Fetcher.convert(), and tblastn searches the
+        #   translated query against the CDS databases.
+        self.program = 'tblastx'
+        #   Persistent cache of best hits. This is a DiskCache object, set by
+        #   the caller if a cache directory was given.
+        self.cache = None
+        #   Path to the merged database of all species. If this is set by the
+        #   caller, it is searched instead of each species database.
+        self.merged = None
+        #   Number of candidate subjects per species to pick with the k-mer
+        #   index before searching. None searches the whole database.
+        self.prefilter = None
+        #   Table of precomputed best hits. This is an OrthologueTable object,
+        #   set by the caller if a table was given.
+        self.orthologue_table = None
+        #   Largest number of species databases to search, and the clade
+        #   table to spread them across the phylogeny with. None searches
+        #   every species.
+        self.max_species = None
+        self.clades = []
+        #   Node-local copies of the databases. This is a DatabaseStage
+        #   object, set by the caller if a scratch directory was given.
+        self.stage = None
+        #   Threads for each BLAST run, if set by the caller. Otherwise the
+        #   CPUs are split between databases first, and then threads.
+        self.tool_threads = None
+        self.blast_threads = 1
+        #   Path to blastdbcmd, or False if it is not installed
+        self.blastdbcmd_path = check_modules.check_executable('blastdbcmd')
         return
 
     def best_hit(self, brecord):
@@ -72,18 +255,21 @@ class BlastSearch(object):
         We need to do this because of the ugly nested nature of the data
         structure 'return' immediately stops iteration, whereas 'break'
         only works on one loop."""
+        #   Only build the debugging messages if they will be printed
+        debug = self.mainlog.isEnabledFor(logging.DEBUG)
         for aln in brecord.alignments:
             for hsp in aln.hsps:
-                frames = [str(f) for f in hsp.frame]
-                debug_msg = aln.title + ' Stats:\n' +\
-                    'Bit Score: ' + str(hsp.bits) + '\n'\
-                    'E-value: ' + str(hsp.expect) + '\n'\
-                    'Identities ' + str(hsp.identities) + '\n'\
-                    'Aln. Length: ' + str(hsp.align_length) + '\n'\
-                    'Hit Start: ' + str(hsp.sbjct_start) + '\n'\
-                    'Hit End: ' + str(hsp.sbjct_end) + '\n'\
-                    'Frames: ' + ', '.join(frames)
-                self.mainlog.debug(debug_msg)
+                if debug:
+                    frames = [str(f) for f in hsp.frame]
+                    debug_msg = aln.title + ' Stats:\n' +\
+                        'Bit Score: ' + str(hsp.bits) + '\n'\
+                        'E-value: ' + str(hsp.expect) + '\n'\
+                        'Identities ' + str(hsp.identities) + '\n'\
+                        'Aln. Length: ' + str(hsp.align_length) + '\n'\
+                        'Hit Start: ' + str(hsp.sbjct_start) + '\n'\
+                        'Hit End: ' + str(hsp.sbjct_end) + '\n'\
+                        'Frames: ' + ', '.join(frames)
+                    self.mainlog.debug(debug_msg)
                 if hsp.expect <= self.evalue:
                     return aln.title
         else:
@@ -100,29 +286,132 @@ class BlastSearch(object):
         temp_output = tempfile.NamedTemporaryFile(
             mode='w+t',
             prefix='BAD_Mutations_BlastSearch_',
-            suffix='_BLASTout.xml')
+            suffix='_BLASTout.' + ('xml' if self.outfmt == 'xml' else 'txt'))
         self.mainlog.debug('Temp file created with name ' + temp_output.name)
         #   Return the file-like object
         return temp_output
 
-    def run_blast(self, database):
-        """Define a function to run the BLAST command."""
+    def translate_query(self, query):
+        """Define a function to translate a query file for the protein search
+        programs. The sequence names are kept, so hits can still be matched to
+        queries. Returns the file-like object of the translated query."""
+        temp_query = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_BlastSearch_',
+            suffix='_query.pep')
+        format_blast.translate_fasta(query, temp_query.name)
+        self.mainlog.debug('Translated ' + query + ' into ' + temp_query.name)
+        return temp_query
+
+    def run_blast(self, database, query=None, evalue=None,
+                  max_target_seqs=None, subject=None):
+        """Define a function to run the BLAST command. Searches with the
+        query of this object unless another query file is given. The database
+        is always the CDS database; for blastp, the protein database made
+        from it is searched instead. If a subject file from the prefilter is
+        given, it is searched instead of the database, with the size of the
+        database so that the E-values are the same."""
+        if query is None:
+            query = self.query
+        if evalue is None:
+            evalue = self.evalue
+        if max_target_seqs is None:
+            max_target_seqs = self.MAX_TARGET_SEQS
+        pep_query = None
+        if self.program in ('blastp', 'tblastn'):
+            pep_query = self.translate_query(query)
+            query = pep_query.name
+        database = self.local_db(database)
+        if self.program == 'blastp':
+            database += format_blast.PROTEIN_SUFFIX
         #   Create a temp file
         blastout = self.gen_output()
+        #   Tabular output with a fixed set of columns, or XML. The column
+        #   list has to be quoted, since the command is run through the shell.
+        if self.outfmt == 'xml':
+            outfmt = 5
+        else:
+            outfmt = "'6 " + ' '.join(self.TAB_FIELDS) + "'"
         #   Start building a command line
-        cline = NcbitblastxCommandline(
-            query=self.query,
-            out=blastout.name,
-            db=database,
-            evalue=self.evalue,
-            outfmt=5,
-            max_target_seqs=5)
+        if subject is not None:
+            cline = self.PROGRAMS[self.program](
+                query=query,
+                out=blastout.name,
+                subject=subject.name,
+                dbsize=subject.dbsize,
+                evalue=evalue,
+                outfmt=outfmt,
+                max_target_seqs=max_target_seqs,
+                num_threads=self.blast_threads)
+        else:
+            cline = self.PROGRAMS[self.program](
+                query=query,
+                out=blastout.name,
+                db=database,
+                evalue=evalue,
+                outfmt=outfmt,
+                max_target_seqs=max_target_seqs,
+                num_threads=self.blast_threads)
         self.mainlog.debug(str(cline))
         #   And then execute it
         cline()
+        if pep_query is not None:
+            pep_query.close()
         return blastout
 
+    def tabular_hits(self, out):
+        """Define a generator to read HSPs out of a tabular BLAST report one
+        at a time. Yields (query name, hit title, E-value) tuples. The title
+        is built the same way as the title of an XML alignment: the subject
+        ID, then a space, then the subject description."""
+        debug = self.mainlog.isEnabledFor(logging.DEBUG)
+        ncol = len(self.TAB_FIELDS)
+        for line in out:
+            #   Skip comment lines and blank lines
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t', ncol - 1)
+            if len(fields) < ncol:
+                fields += [''] * (ncol - len(fields))
+            hsp = dict(zip(self.TAB_FIELDS, fields))
+            title = hsp['sseqid'] + ' ' + hsp['stitle']
+            if debug:
+                debug_msg = title + ' Stats:\n' +\
+                    'Bit Score: ' + hsp['bitscore'] + '\n'\
+                    'E-value: ' + hsp['evalue'] + '\n'\
+                    'Identities ' + hsp['nident'] + '\n'\
+                    'Aln. Length: ' + hsp['length'] + '\n'\
+                    'Hit Start: ' + hsp['sstart'] + '\n'\
+                    'Hit End: ' + hsp['send'] + '\n'\
+                    'Frames: ' + hsp['qframe'] + ', ' + hsp['sframe']
+                self.mainlog.debug(debug_msg)
+            yield (hsp['qseqid'], title, float(hsp['evalue']))
+
     def get_seq_id(self, out):
+        """Define a function to get the best hit out of a BLAST report."""
+        if self.outfmt == 'xml':
+            return self.get_seq_id_xml(out)
+        else:
+            return self.get_seq_id_tabular(out)
+
+    def get_seq_id_tabular(self, out):
+        """Define a function to get the best hit out of a tabular BLAST
+        report. The hits are sorted by E-value, so we stop reading at the
+        first one that passes the threshold."""
+        out.seek(0)
+        self.mainlog.debug('Beginning to parse the BLAST output for ' +
+                           self.query + '.')
+        best = None
+        for qname, title, evalue in self.tabular_hits(out):
+            if evalue <= self.evalue:
+                best = title
+                self.mainlog.info('Saving ' + best + ' as best hit.')
+                break
+        #   Close the temporary file to clean up
+        out.close()
+        return best
+
+    def get_seq_id_xml(self, out):
         """Define a function to get the best hit out of a BLAST record."""
         #   Seek to the beginning of the temporary file to read its contents
         out.seek(0)
@@ -132,6 +421,7 @@ class BlastSearch(object):
         blast_records = NCBIXML.parse(out)
         #   Convert it to a list, since it should be relatively small...
         blast_records = list(blast_records)
+        best = None
         self.mainlog.info('We found ' + str(len(blast_records)) +
                           ' hits for ' + self.query + '.')
         #   If the list is empty, then we have no hits
@@ -147,43 +437,513 @@ class BlastSearch(object):
         out.close()
         return best
 
-    def blast_all(self):
-        """Define a function to BLAST against every database."""
-        databases = file_funcs.get_file_by_ext(self.basedir,
-                                               '.fa',
-                                               self.mainlog)
+    def xml_hits(self, out):
+        """Define a generator to read HSPs out of a BLAST XML report. Yields
+        the same (query name, hit title, E-value) tuples as tabular_hits()."""
+        for rec in NCBIXML.parse(out):
+            qname = rec.query.split()[0]
+            for aln in rec.alignments:
+                for hsp in aln.hsps:
+                    yield (qname, aln.title, hsp.expect)
+
+    def hit_from_title(self, title, names=None):
+        """Define a function to split the title of a hit into a tuple of the
+        sequence ID and the GenBank ID. The title is the subject ID, then the
+        description, which starts with the name of the record in the FASTA
+        file. Hits from a prefiltered search do not have an ID in the BLAST
+        database, so we find the record name out of the names that were
+        searched, and give None for the sequence ID."""
+        fasta_info = title.split(' ')
+        if names is None:
+            return (fasta_info[0], fasta_info[1])
+        for word in fasta_info[:2]:
+            #   FASTA subjects may be reported as local IDs
+            name = re.sub('^lcl\\|', '', word)
+            if name in names:
+                return (None, name)
+        return (None, fasta_info[1])
+
+    def get_databases(self):
+        """Define a function to find the species databases to search."""
+        #   Read the databases from the catalog written by fetch, rather than
+        #   walking the base directory for every gene
+        entries = catalog.databases(self.basedir, self.mainlog)
+        databases = [entry['path'] for entry in entries]
         self.mainlog.info('Running BLAST on ' +
                           str(len(databases)) +
                           ' species databases.')
         self.mainlog.debug('BLAST databases:\n' + '\n'.join(databases))
-        #   databases will always be at least length 1
-        #   if there is nothing, then the list will just have the empty string
-        if databases[0] == '':
+        if not databases:
             self.mainlog.error('The base directory ' +
                                self.basedir +
                                ' does not contain any BLAST databases!')
             exit(1)
-        for blast_db in databases:
-            #   If the target species is in the filename of the FASTA sequence,
-            #   we will skip it.
+        #   If the target species is in the filename of the FASTA sequence,
+        #   we will skip it.
+        databases = [
+            blast_db
+            for blast_db
+            in databases
+            if self.target.upper() not in blast_db.upper()]
+        databases = self.select_species(
+            databases,
+            dict(
+                (entry['path'], entry.get('residues'))
+                for entry
+                in entries))
+        #   blastp needs the protein databases that are made when the CDS
+        #   databases are converted
+        if self.program == 'blastp':
+            missing = [
+                blast_db
+                for blast_db
+                in databases
+                if not os.path.isfile(blast_db + format_blast.PROTEIN_SUFFIX)]
+            if missing:
+                self.mainlog.error(
+                    'The following species databases do not have protein '
+                    'databases for blastp. Run the fetch subcommand with '
+                    '--convert-only to make them:\n' + '\n'.join(missing))
+                exit(1)
+        return databases
+
+    def select_species(self, databases, residues):
+        """Define a function to pick at most max_species of the databases,
+        spread across the clades. residues is a dictionary of the number of
+        residues in each database, or None where it is not known. The search
+        time saved is estimated from the residues that are not searched."""
+        picked = species_select.select(
+            databases,
+            self.clades,
+            self.max_species)
+        if len(picked) == len(databases):
+            return databases
+        msg = (
+            'Searching ' + str(len(picked)) + ' of ' + str(len(databases)) +
+            ' species databases')
+        sizes = [residues.get(blast_db) for blast_db in databases]
+        if None not in sizes and sum(sizes):
+            skipped = sum(sizes) - sum(residues[db] for db in picked)
+            msg += (
+                ', which skips ' + '%.1f' % (100.0 * skipped / sum(sizes)) +
+                '% of the residues and about as much of the search time')
+        self.mainlog.info(msg + '.')
+        self.mainlog.debug(
+            'Species not searched:\n' + '\n'.join(
+                blast_db
+                for blast_db
+                in databases
+                if blast_db not in picked))
+        return picked
+
+    def search_params(self):
+        """Define a function to list the search parameters that go into the
+        cache key."""
+        return [
+            self.program,
+            repr(self.evalue),
+            str(self.MAX_TARGET_SEQS),
+            str(self.prefilter)]
+
+    def table_params(self):
+        """Define a function to list the parameters that an orthologue table
+        has to be built with, to give the same hits as this search."""
+        names = ['program', 'evalue', 'max_target_seqs', 'prefilter']
+        return list(zip(names, self.search_params())) + [
+            ('merged', str(bool(self.merged))),
+            ('target', self.target)]
+
+    def searched_databases(self):
+        """Define a function to list the species databases that the search
+        covers."""
+        if self.merged:
+            return self.merged_targets(self.merged_species())
+        return self.get_databases()
+
+    def table_hit(self, qseq, blast_db):
+        """Define a function to look up a best hit in the orthologue table.
+        Returns a tuple of (found, hit)."""
+        if self.orthologue_table is None:
+            return (False, None)
+        return self.orthologue_table.lookup(qseq, blast_db)
+
+    def local_db(self, blast_db):
+        """Define a function to return the path to read a database from. This
+        is the node-local copy if the databases are staged, and the database
+        itself otherwise. Results are still stored under the database."""
+        if self.stage is None:
+            return blast_db
+        return self.stage.local_path(blast_db)
+
+    def prefilter_subjects(self, blast_db, cds_seqs):
+        """Define a function to pick the records of a species database that
+        share the most k-mers with the query sequences, and write them into a
+        FASTA file to search instead of the database. Returns the file-like
+        object, with the size of the whole database and the names of the
+        records attached, or None if the whole database should be searched."""
+        picked = set()
+        local = self.local_db(blast_db)
+        for cds in cds_seqs:
+            found = kmer_index.candidates(
+                local,
+                str(cds),
+                self.prefilter,
+                self.PREFILTER_MIN_SHARED)
+            #   If any query has no candidates, it may have a distant hit
+            #   that the k-mers miss, so we search everything
+            if not found:
+                self.mainlog.info(
+                    'No prefilter candidates in ' + blast_db + '. Searching '
+                    'the whole database.')
+                return None
+            picked.update(found)
+        #   blastp searches the protein records, which have the same names
+        if self.program == 'blastp':
+            source = local + format_blast.PROTEIN_SUFFIX
+        else:
+            source = local
+        all_names = fasta_index.record_names(source)
+        names = [all_names[rec] for rec in sorted(picked)]
+        subject = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_BlastSearch_',
+            suffix='_subjects.fasta')
+        fastas = fasta_index.fetch(source, names)
+        for name in names:
+            subject.write(fastas.get(name, ''))
+        subject.flush()
+        subject.dbsize = fasta_index.total_length(source)
+        subject.names = set(names)
+        self.mainlog.info(
+            'Searching ' + str(len(names)) + ' of ' + str(len(all_names)) +
+            ' records in ' + blast_db + '.')
+        return subject
+
+    def cache_key(self, qseq, blast_db):
+        """Define a function to build the cache key for a query sequence and
+        a database. The database is identified by its path, size, and
+        modification time, so that a re-fetched database misses the cache."""
+        stat = os.stat(blast_db)
+        return self.cache.make_key(
+            str(qseq).upper(),
+            os.path.abspath(blast_db),
+            stat.st_size,
+            int(stat.st_mtime),
+            *self.search_params())
+
+    def cached_hit(self, key):
+        """Define a function to look up a best hit in the cache. Returns a
+        tuple of (found, hit), since a cached hit can be None. For the merged
+        database, the hit is a dictionary of best hits keyed on species
+        tag."""
+        data = self.cache.get(key)
+        if data is None:
+            return (False, None)
+        hit = json.loads(data.decode('utf-8'))['hit']
+        if isinstance(hit, dict):
+            hit = dict((tag, tuple(h)) for tag, h in hit.items())
+        elif hit:
+            hit = tuple(hit)
+        return (True, hit)
+
+    def store_hit(self, key, hit):
+        """Define a function to save a best hit into the cache."""
+        self.cache.put(key, json.dumps({'hit': hit}).encode('utf-8'))
+        return
+
+    def search_database(self, blast_db):
+        """Define a function to search one database and return the best hit."""
+        if self.orthologue_table is not None:
+            found, hit = self.table_hit(
+                SeqIO.read(self.query, 'fasta').seq,
+                blast_db)
+            if found:
+                self.mainlog.info(
+                    'Using the orthologue table for ' + self.query + ' in ' +
+                    blast_db + '.')
+                return hit
+        if self.cache is not None:
+            key = self.cache_key(SeqIO.read(self.query, 'fasta').seq, blast_db)
+            found, hit = self.cached_hit(key)
+            if found:
+                self.mainlog.info(
+                    'Using cached best hit for ' + self.query + ' in ' +
+                    blast_db + '.')
+                return hit
+            hit = self.blast_database(blast_db)
+            self.store_hit(key, hit)
+            return hit
+        return self.blast_database(blast_db)
+
+    def blast_database(self, blast_db):
+        """Define a function to run BLAST on one database and return the best
+        hit."""
+        subject = None
+        if self.prefilter:
+            subject = self.prefilter_subjects(
+                blast_db,
+                [SeqIO.read(self.query, 'fasta').seq])
+        #   Get the BLAST output
+        blast_output = self.run_blast(blast_db, subject=subject)
+        #   And parse it
+        homologous_locus = self.get_seq_id(blast_output)
+        names = None
+        if subject is not None:
+            names = subject.names
+            subject.close()
+        #   We do this check in case there is no match in a species
+        if not homologous_locus:
+            return None
+        #   We want the first and second parts, separated by a space. We need
+        #   the second part if we want to fetch from the FASTA file.
+        return self.hit_from_title(homologous_locus, names)
+
+    def search_and_fetch(self, blast_db):
+        """Define a function to search one database and fetch the sequence of
+        the best hit right away. This is run in the worker threads."""
+        hit = self.search_database(blast_db)
+        fasta = None
+        if hit:
+            fasta = self.fetch_hit_seq(blast_db, hit)
+        return (blast_db, hit, fasta)
+
+    def save_result(self, blast_db, hit, fasta):
+        """Define a function to store the search result for one database."""
+        #   Only save those that have a match
+        if hit:
+            #   And then tack it onto the list of orthologues
+            self.orthologues[blast_db] = hit
+            if fasta is not None:
+                self.hit_seqs[blast_db] = fasta
+        return
+
+    def merged_species(self):
+        """Define a function to read the species tags of the merged database.
+        Returns a list of (tag, species database, number of residues)
+        tuples."""
+        if not os.path.isfile(self.merged + merge_db.SPECIES_SUFFIX):
+            self.mainlog.error(
+                'The merged database ' + self.merged + ' does not exist. Run '
+                'the fetch subcommand with --merged-db to make it.')
+            exit(1)
+        if self.program == 'blastp' and not os.path.isfile(
+                self.merged + format_blast.PROTEIN_SUFFIX):
+            self.mainlog.error(
+                'The merged database ' + self.merged + ' does not have a '
+                'protein database for blastp.')
+            exit(1)
+        return merge_db.read_species(self.merged)
+
+    def merged_targets(self, species):
+        """Define a function to list the species databases of the merged
+        database that hits are stored for. The target species is left out,
+        and the rest are subject to the species selection. Every species is
+        still searched, since they are all in one database."""
+        databases = [
+            blast_db
+            for tag, blast_db, nres
+            in species
+            if self.target.upper() not in blast_db.upper()]
+        return species_select.select(databases, self.clades, self.max_species)
+
+    def merged_best_hits(self, species, query=None):
+        """Define a function to search the merged database once, and return
+        the best hit in each species for each query, as a dictionary keyed on
+        query name and then on species tag. E-values are computed against the
+        whole merged database, so they are scaled down to what they would be
+        against the database of each species before they are compared to the
+        threshold."""
+        total = float(sum(nres for tag, db, nres in species))
+        scale = dict((tag, nres / total) for tag, db, nres in species)
+        #   Search with a threshold that lets through every hit that could
+        #   pass in the smallest species
+        evalue = self.evalue / min(s for s in scale.values() if s > 0)
+        blast_output = self.run_blast(
+            self.merged,
+            query,
+            evalue=evalue,
+            max_target_seqs=self.MERGED_TARGET_SEQS * len(species))
+        blast_output.seek(0)
+        if self.outfmt == 'xml':
+            hsps = self.xml_hits(blast_output)
+        else:
+            hsps = self.tabular_hits(blast_output)
+        best_hits = {}
+        for qname, title, hit_evalue in hsps:
+            hit = self.hit_from_title(title)
+            tag = merge_db.species_tag(hit[1])
+            if tag not in scale:
+                continue
+            query_hits = best_hits.setdefault(qname, {})
+            #   The first HSP that passes is the best one in its species
+            if tag in query_hits:
+                continue
+            if hit_evalue * scale[tag] <= self.evalue:
+                query_hits[tag] = hit
+        blast_output.close()
+        return best_hits
+
+    def merged_table_hits(self, qseq, species):
+        """Define a function to look up the best hit in each species in the
+        orthologue table. Returns a dictionary keyed on species tag, or None
+        if any species other than the target is missing from the table."""
+        hits = {}
+        for tag, blast_db, nres in species:
             if self.target.upper() in blast_db.upper():
                 continue
-            #   Get the BLAST output
-            blast_output = self.run_blast(blast_db)
-            #   And parse it
-            homologous_locus = self.get_seq_id(blast_output)
-            #   We do this check in case there is no match in a species
-            #   Only save those that have a match
-            if homologous_locus:
-                #   We want the first and second parts, separated by a space
-                fasta_info = homologous_locus.split(' ')
-                seq_id = fasta_info[0]
-                #   We need this part if we want to search by regex
-                gb_id = fasta_info[1]
-                #   And then tack it onto the list of orthologues
-                self.orthologues[blast_db] = (seq_id, gb_id)
+            found, hit = self.table_hit(qseq, blast_db)
+            if not found:
+                return None
+            if hit:
+                hits[tag] = hit
+        return hits
+
+    def search_merged(self, species):
+        """Define a function to get the best hit in each species for the
+        query, out of the cache or the merged database. Returns a dictionary
+        keyed on species tag. The target species is not left out here, so
+        that the cached hits do not depend on it."""
+        if self.orthologue_table is not None:
+            hits = self.merged_table_hits(
+                SeqIO.read(self.query, 'fasta').seq,
+                species)
+            if hits is not None:
+                self.mainlog.info(
+                    'Using the orthologue table for ' + self.query + '.')
+                return hits
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(
+                SeqIO.read(self.query, 'fasta').seq,
+                self.merged)
+            found, hits = self.cached_hit(key)
+            if found:
+                self.mainlog.info(
+                    'Using cached best hits for ' + self.query + ' in ' +
+                    self.merged + '.')
+                return hits
+        best_hits = self.merged_best_hits(species)
+        #   There is only one query in the search
+        hits = list(best_hits.values())[0] if best_hits else {}
+        if key is not None:
+            self.store_hit(key, hits)
+        return hits
+
+    def blast_merged(self):
+        """Define a function to search the merged database, and store the
+        best hits under the species databases they came from."""
+        species = self.merged_species()
+        self.mainlog.info(
+            'Running BLAST on the merged database of ' + str(len(species)) +
+            ' species.')
+        hits = self.search_merged(species)
+        #   Leave out the target species, and those that were not selected
+        targets = set(self.merged_targets(species))
+        species = [sp for sp in species if sp[1] in targets]
+        #   The hits are fetched out of the merged database
+        fetched = self.fetch_seqs(
+            self.merged,
+            set(hits[tag] for tag, blast_db, nres in species if tag in hits))
+        for tag, blast_db, nres in species:
+            if tag in hits:
+                self.save_result(
+                    blast_db,
+                    hits[tag],
+                    fetched[hits[tag]])
         return
 
+    def blast_all(self):
+        """Define a function to BLAST against every database."""
+        if self.merged:
+            #   There is only one search, so it gets all of the CPUs
+            nworkers, self.blast_threads = resources.split_cores(
+                self.ncpu,
+                1,
+                self.tool_threads)
+            self.blast_merged()
+            return
+        databases = self.get_databases()
+        #   Searching databases at once scales better than the threads of one
+        #   search, so the CPUs go to workers first.
+        nworkers, self.blast_threads = resources.split_cores(
+            self.ncpu,
+            len(databases),
+            self.tool_threads)
+        self.mainlog.info(
+            'Searching with ' + str(nworkers) + ' workers and ' +
+            str(self.blast_threads) + ' BLAST threads each.')
+        if nworkers > 1:
+            #   We use threads rather than processes, since the real work is
+            #   done by the BLAST subprocesses.
+            pool = ThreadPool(nworkers)
+            try:
+                #   map() keeps the results in the same order as the databases,
+                #   so the orthologues are stored in the same order as in the
+                #   serial search.
+                results = pool.map(self.search_and_fetch, databases)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [
+                self.search_and_fetch(blast_db)
+                for blast_db
+                in databases]
+        for blast_db, hit, fasta in results:
+            self.save_result(blast_db, hit, fasta)
+        return
+
+    def fetch_hit_seq(self, database, seqid):
+        """Define a function to get the sequence of one hit out of a database.
+        Returns the sequence as a FASTA string."""
+        database = self.local_db(database)
+        if self.blastdbcmd_path and seqid[0]:
+            fasta, error = sequence_fetch.blastdbcmd(
+                self.blastdbcmd_path,
+                database,
+                seqid[0])
+            self.mainlog.debug('Stdout:\n' + fasta.decode('utf-8'))
+            self.mainlog.debug('Stderr:\n' + error.decode('utf-8'))
+            return fasta.decode('utf-8')
+        else:
+            #   Look the sequence up in the offset index of the FASTA file
+            fasta = fasta_index.fetch(database, [seqid[1]])
+            return fasta.get(seqid[1], '')
+
+    def fetch_seqs(self, database, seqids):
+        """Define a function to get the sequences of many hits out of one
+        database. Returns a dictionary of FASTA strings keyed on hit. Starting
+        blastdbcmd costs more than looking up a sequence, so all of the hits
+        are fetched with one call. If that fails, we fall back to fetching
+        them one at a time. Hits without a sequence ID, and all hits when
+        blastdbcmd is not installed, are read out of the FASTA file with its
+        offset index in one pass."""
+        seqids = set(seqids)
+        local = self.local_db(database)
+        by_id = [s for s in seqids if self.blastdbcmd_path and s[0]]
+        by_name = [s for s in seqids if s not in by_id]
+        fastas = {}
+        if by_name:
+            found = fasta_index.fetch(local, [s[1] for s in by_name])
+            for seqid in by_name:
+                fastas[seqid] = found.get(seqid[1], '')
+        if by_id:
+            found, error = sequence_fetch.blastdbcmd_batch(
+                self.blastdbcmd_path,
+                local,
+                [seqid[0] for seqid in by_id])
+            self.mainlog.debug('Stderr:\n' + error.decode('utf-8'))
+            if found is not None:
+                for seqid in by_id:
+                    fastas[seqid] = found[seqid[0]]
+            else:
+                self.mainlog.warning(
+                    'Could not fetch all hits from ' + database + ' at once. '
+                    'Fetching them one at a time.')
+                for seqid in by_id:
+                    fastas[seqid] = self.fetch_hit_seq(database, seqid)
+        return fastas
+
     def get_hit_seqs(self):
         """Define a function to get the hit sequences out of the databses."""
         #   Create a temporary file for holding sequence information while we
@@ -203,55 +963,34 @@ class BlastSearch(object):
         #    Start a new string to write the data into the file
         towrite = '>' + qseq.name + '\n' + str(qseq.seq) + '\n'
         #   Check to see if the blastdbcmd command is avilable
-        blastdbcmd_path = check_modules.check_executable('blastdbcmd')
-        if blastdbcmd_path:
-            self.mainlog.debug('Using ' + blastdbcmd_path)
-            for database, seqid in self.orthologues.items():
-                fasta, error = sequence_fetch.blastdbcmd(
-                    blastdbcmd_path,
-                    database,
-                    seqid[0])
-                self.mainlog.debug('Stdout:\n' + fasta.decode('utf-8'))
-                self.mainlog.debug('Stderr:\n' + error.decode('utf-8'))
-                fasta_str = fasta.decode('utf-8')
-                #   If the sequence has ambiguous nucleotides (WRKYSMVBDHN),
-                #   then we exclude it.
-                db_seq = ''.join(fasta_str.split('\n')[1:])
-                #   Then, search for the ambiguous nucleotides, skip if they are
-                #   found.
-                if re.search('S|W|R|K|Y|M|V|B|D|H|N', db_seq, re.I):
-                    self.mainlog.warning(
-                        'Removing sequence from ' +
-                        os.path.basename(database) +
-                        ' due to ambiguous nucleotides.')
-                    continue
-                #   We will use the name of the assembly as the species name
-                spname = os.path.basename(database)
-                #   Then split on . and take the first part
-                spname = '>' + spname.split('.')[0]
-                #   Then replace the weird ID with the species name
-                fasta_str = re.sub('>.+', spname, fasta_str)
-                towrite += fasta_str
+        if self.blastdbcmd_path:
+            self.mainlog.debug('Using ' + self.blastdbcmd_path)
         else:
-            self.mainlog.debug('Using regex')
-            for database, seqid in self.orthologues.items():
-                fasta = sequence_fetch.get_seq_by_regex(database, seqid[1])
-                #   Perform the same check here for ambiguous nucleotides.
-                db_seq = ''.join(fasta.split('\n')[1:])
-                #   Then, search for the ambiguous nucleotides, skip if they are
-                #   found.
-                if re.search('S|W|R|K|Y|M|V|B|D|H|N', db_seq, re.I):
-                    self.mainlog.warning(
-                        'Removing sequence from ' +
-                        os.path.basename(database) +
-                        ' due to ambiguous nucleotides.')
-                #   We will use the name of the assembly as the species name
-                spname = os.path.basename(database)
-                #   Then split on . and take the first part
-                spname = '>' + spname.split('.')[0]
-                #   Then replace the weird ID with the species name
-                fasta = re.sub('>.+', spname, fasta)
-                towrite += fasta
+            self.mainlog.debug('Using the FASTA offset index')
+        for database, seqid in self.orthologues.items():
+            #   The search will have fetched these already
+            if database in self.hit_seqs:
+                fasta_str = self.hit_seqs[database]
+            else:
+                fasta_str = self.fetch_hit_seq(database, seqid)
+            #   If the sequence has ambiguous nucleotides (WRKYSMVBDHN),
+            #   then we exclude it.
+            db_seq = ''.join(fasta_str.split('\n')[1:])
+            #   Then, search for the ambiguous nucleotides, skip if they are
+            #   found.
+            if re.search('S|W|R|K|Y|M|V|B|D|H|N', db_seq, re.I):
+                self.mainlog.warning(
+                    'Removing sequence from ' +
+                    os.path.basename(database) +
+                    ' due to ambiguous nucleotides.')
+                continue
+            #   We will use the name of the assembly as the species name
+            spname = os.path.basename(database)
+            #   Then split on . and take the first part
+            spname = '>' + spname.split('.')[0]
+            #   Then replace the weird ID with the species name
+            fasta_str = re.sub('>.+', spname, fasta_str)
+            towrite += fasta_str
         self.mainlog.debug('Writing sequences into ' + temp_output.name)
         temp_output.write(towrite)
         #   We flush() it so that there is no data left unwritten
@@ -260,3 +999,334 @@ class BlastSearch(object):
         temp_output.seek(0)
         self.mainlog.debug(temp_output.read())
         return temp_output
+
+
+class BatchBlastSearch(BlastSearch):
+    """A class to search many query sequences at once. All of the queries are
+    written into one multi-FASTA file, so that each species database is only
+    searched once for the whole set of genes. The hits are then split back out
+    per query.
+
+    Inherits the searching and sequence fetching methods from BlastSearch, and
+    overrides the following:
+
+    search_database():
+        Run BLAST with every query against one database and return a
+        dictionary of the best hit for each query file. Queries with a cached
+        best hit are not searched again.
+
+    search_and_fetch():
+        Worker function for the parallel search. Searches one database, then
+        fetches the sequences of the best hits for every query with a single
+        call to blastdbcmd.
+
+    save_result():
+        Store the best hits and their sequences for one database, keyed on
+        query file.
+
+    Adds the following methods:
+
+    write_batch_query():
+        Write a list of query sequences into a single FASTA file, with
+        batch-local names so that the BLAST output can be split by query.
+
+    get_batch_ids():
+        Read through the multi-query BLAST report and return the best hit for
+        each query file.
+
+    get_batch_ids_xml():
+        The same as get_batch_ids(), for the XML report.
+
+    search_merged():
+        Return the best hit in each species for every query, from the cache or
+        from one search of the merged database with the uncached queries.
+
+    blast_merged():
+        Search the merged database, fetch the hits of every query at once, and
+        store them under their species databases.
+
+    query_search():
+        Return a BlastSearch object for one query, with the orthologues from
+        the batch search filled in, ready for get_hit_seqs().
+    """
+
+    #   Prefix for the batch-local query names
+    QUERY_PREFIX = 'BADq'
+
+    def __init__(self, base, target, queries, evalue, ncpu, verbose):
+        BlastSearch.__init__(self, base, target, None, evalue, ncpu, verbose)
+        self.queries = queries
+        #   Best hits, keyed on query file and then on database
+        self.batch_orthologues = dict((q, {}) for q in queries)
+        #   Sequences of the best hits, keyed the same way
+        self.batch_hit_seqs = dict((q, {}) for q in queries)
+        #   Whether to fetch the sequences of the hits. Building the
+        #   orthologue table only needs the IDs.
+        self.fetch_hits = True
+        #   Map of batch-local query names to query files
+        self.query_names = {}
+        #   Query sequences, keyed on query file
+        self.query_seqs = {}
+        for index, query in enumerate(self.queries):
+            #   We identify each query by its position in the batch
+            self.query_names[self.QUERY_PREFIX + str(index)] = query
+            self.query_seqs[query] = SeqIO.read(query, 'fasta')
+        self.batch_query = self.write_batch_query(self.queries)
+        self.query = self.batch_query.name
+        self.mainlog.info(
+            'Searching with ' + str(len(self.queries)) + ' query sequences.')
+        return
+
+    def write_batch_query(self, queries):
+        """Define a function to write a list of queries into one file."""
+        temp_query = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_BlastSearch_',
+            suffix='_batch_query.fasta')
+        self.mainlog.debug('Writing batch query into ' + temp_query.name)
+        for index, query in enumerate(self.queries):
+            if query not in queries:
+                continue
+            qseq = self.query_seqs[query]
+            #   The original name is kept as the description
+            qname = self.QUERY_PREFIX + str(index)
+            temp_query.write(
+                '>' + qname + ' ' + qseq.id + '\n' + str(qseq.seq) + '\n')
+        temp_query.flush()
+        return temp_query
+
+    def get_batch_ids(self, out):
+        """Define a function to get the best hit for each query out of a
+        multi-query BLAST report."""
+        if self.outfmt == 'xml':
+            return self.get_batch_ids_xml(out)
+        out.seek(0)
+        best_hits = {}
+        for qname, title, evalue in self.tabular_hits(out):
+            query = self.query_names.get(qname)
+            if not query or query in best_hits:
+                continue
+            if evalue <= self.evalue:
+                self.mainlog.debug(
+                    'Saving ' + title + ' as best hit for ' + query + '.')
+                best_hits[query] = title
+        out.close()
+        return best_hits
+
+    def get_batch_ids_xml(self, out):
+        """Define a function to get the best hit for each query out of a
+        multi-query BLAST XML report."""
+        out.seek(0)
+        best_hits = {}
+        #   There is one BlastRecord per query, so we do not have to hold the
+        #   whole report in memory.
+        for rec in NCBIXML.parse(out):
+            qname = rec.query.split()[0]
+            query = self.query_names.get(qname)
+            if not query or query in best_hits:
+                continue
+            best = self.best_hit(rec)
+            if best:
+                self.mainlog.debug(
+                    'Saving ' + best + ' as best hit for ' + query + '.')
+                best_hits[query] = best
+        out.close()
+        return best_hits
+
+    def search_database(self, blast_db):
+        """Define a function to search one database with every query. Queries
+        that have a cached best hit are left out of the search."""
+        hits = {}
+        to_search = self.queries
+        if self.orthologue_table is not None:
+            to_search = []
+            for query in self.queries:
+                found, hit = self.table_hit(
+                    self.query_seqs[query].seq,
+                    blast_db)
+                if not found:
+                    to_search.append(query)
+                elif hit:
+                    hits[query] = hit
+            self.mainlog.info(
+                'Found ' + str(len(self.queries) - len(to_search)) + ' of ' +
+                str(len(self.queries)) + ' queries in the orthologue table '
+                'for ' + blast_db + '.')
+        if self.cache is not None:
+            keys = {}
+            searched = to_search
+            to_search = []
+            for query in searched:
+                keys[query] = self.cache_key(
+                    self.query_seqs[query].seq,
+                    blast_db)
+                found, hit = self.cached_hit(keys[query])
+                if not found:
+                    to_search.append(query)
+                elif hit:
+                    hits[query] = hit
+            self.mainlog.info(
+                'Using cached best hits for ' +
+                str(len(searched) - len(to_search)) + ' of ' +
+                str(len(searched)) + ' queries in ' + blast_db + '.')
+        if not to_search:
+            return hits
+        subject = None
+        names = None
+        if self.prefilter:
+            #   One set of subjects for the whole batch: the candidates of
+            #   every query together
+            subject = self.prefilter_subjects(
+                blast_db,
+                [self.query_seqs[query].seq for query in to_search])
+        if subject is not None:
+            names = subject.names
+        if len(to_search) == len(self.queries):
+            blast_output = self.run_blast(blast_db, subject=subject)
+        else:
+            subset = self.write_batch_query(to_search)
+            blast_output = self.run_blast(
+                blast_db,
+                subset.name,
+                subject=subject)
+            subset.close()
+        if subject is not None:
+            subject.close()
+        best_hits = self.get_batch_ids(blast_output)
+        self.mainlog.info(
+            'Found hits for ' + str(len(best_hits)) + ' of ' +
+            str(len(to_search)) + ' queries in ' + blast_db + '.')
+        for query in to_search:
+            hit = None
+            if query in best_hits:
+                hit = self.hit_from_title(best_hits[query], names)
+                hits[query] = hit
+            if self.cache is not None:
+                self.store_hit(keys[query], hit)
+        return hits
+
+    def search_and_fetch(self, blast_db):
+        """Define a function to search one database and fetch the sequences
+        of all of the best hits at once. Returns the hits and the sequences,
+        both keyed on query file."""
+        hits = self.search_database(blast_db)
+        if not self.fetch_hits:
+            return (blast_db, hits, {})
+        fetched = self.fetch_seqs(blast_db, set(hits.values()))
+        fastas = dict(
+            (query, fetched[seqid])
+            for query, seqid
+            in hits.items())
+        return (blast_db, hits, fastas)
+
+    def save_result(self, blast_db, hit, fasta):
+        """Define a function to store the hits of every query for one
+        database."""
+        for query, seqid in hit.items():
+            self.batch_orthologues[query][blast_db] = seqid
+            if query in fasta:
+                self.batch_hit_seqs[query][blast_db] = fasta[query]
+        return
+
+    def search_merged(self, species):
+        """Define a function to get the best hit in each species for every
+        query. Returns a dictionary keyed on query file, then on species
+        tag."""
+        hits = {}
+        keys = {}
+        to_search = self.queries
+        if self.orthologue_table is not None:
+            to_search = []
+            for query in self.queries:
+                table_hits = self.merged_table_hits(
+                    self.query_seqs[query].seq,
+                    species)
+                if table_hits is None:
+                    to_search.append(query)
+                else:
+                    hits[query] = table_hits
+        if self.cache is not None:
+            searched = to_search
+            to_search = []
+            for query in searched:
+                keys[query] = self.cache_key(
+                    self.query_seqs[query].seq,
+                    self.merged)
+                found, hit = self.cached_hit(keys[query])
+                if found:
+                    hits[query] = hit
+                else:
+                    to_search.append(query)
+            self.mainlog.info(
+                'Using cached best hits for ' +
+                str(len(searched) - len(to_search)) + ' of ' +
+                str(len(searched)) + ' queries in ' + self.merged + '.')
+        if not to_search:
+            return hits
+        if len(to_search) == len(self.queries):
+            best_hits = self.merged_best_hits(species)
+        else:
+            subset = self.write_batch_query(to_search)
+            best_hits = self.merged_best_hits(species, subset.name)
+            subset.close()
+        for qname, query_hits in best_hits.items():
+            query = self.query_names.get(qname)
+            if query:
+                hits[query] = query_hits
+        for query in to_search:
+            hits.setdefault(query, {})
+            if self.cache is not None:
+                self.store_hit(keys[query], hits[query])
+        return hits
+
+    def blast_merged(self):
+        """Define a function to search the merged database with every query,
+        and store the best hits under the species databases they came
+        from."""
+        species = self.merged_species()
+        self.mainlog.info(
+            'Running BLAST on the merged database of ' + str(len(species)) +
+            ' species.')
+        hits = self.search_merged(species)
+        #   Leave out the target species, and those that were not selected
+        targets = set(self.merged_targets(species))
+        species = [sp for sp in species if sp[1] in targets]
+        #   Fetch the hits of every query with one call
+        all_hits = set()
+        if self.fetch_hits:
+            for query_hits in hits.values():
+                all_hits.update(
+                    query_hits[tag]
+                    for tag, blast_db, nres
+                    in species
+                    if tag in query_hits)
+        fetched = self.fetch_seqs(self.merged, all_hits)
+        for tag, blast_db, nres in species:
+            db_hits = dict(
+                (query, query_hits[tag])
+                for query, query_hits
+                in hits.items()
+                if tag in query_hits)
+            self.save_result(
+                blast_db,
+                db_hits,
+                dict(
+                    (q, fetched[h])
+                    for q, h
+                    in db_hits.items()
+                    if h in fetched))
+        return
+
+    def query_search(self, query):
+        """Define a function to make a BlastSearch for one of the queries, with
+        the orthologues already filled in."""
+        b_search = BlastSearch(
+            self.basedir,
+            self.target,
+            query,
+            self.evalue,
+            1,
+            self.verbose)
+        b_search.orthologues = self.batch_orthologues[query]
+        b_search.hit_seqs = self.batch_hit_seqs[query]
+        return b_search
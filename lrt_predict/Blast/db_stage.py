@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""Stage species databases on node-local scratch space, so that many jobs on
+a cluster do not all read the databases from a shared filesystem. Each
+database is staged with all of the files next to it that start with its name,
+like the BLAST database files, the protein database, and the indices. Files
+are hard-linked if the scratch directory is on the same filesystem as the
+database, and copied otherwise."""
+
+#   Import standard library modules here
+import os
+import glob
+import shutil
+import hashlib
+import fcntl
+import time
+import threading
+
+#   Import our helper scripts here
+from lrt_predict.General import set_verbosity
+
+
+class DatabaseStage(object):
+    """A class to keep node-local copies of species databases.
+
+    Contains the following class attributes:
+        LOCK_NAME (str)       Name of the lock file for eviction
+        STAMP_SUFFIX (str)    Suffix of the file that marks a staged database
+        MIN_IDLE (int)        Seconds a staged database has to be unused for
+                              before it can be evicted
+        CHUNK (int)           Bytes to read at a time when prewarming
+
+    Contains the following instance attributes:
+        base (str)            Base directory of the species databases
+        stage_dir (str)       Directory that holds the copies of this base
+        max_bytes (int)       Maximum size of the copies, or None for no limit
+        prewarm (bool)        Read each database once after staging it, to
+                              load it into the page cache
+        staged (dict)         Local copies that this process has checked,
+                              keyed on the path to the database
+        lock (Lock)           Guards staged, which the threads of a
+                              parallel search share
+        mainlog (logger)      Logging messages formatter and handler
+
+    Contains the following methods:
+        local_path(blast_db):
+            Return the path to the local copy of a database, staging it if it
+            is not staged yet or has changed.
+
+        stage(blast_db):
+            Copy or link the files of a database into the stage directory.
+
+        evict():
+            Remove copies whose database is gone, and the least recently used
+            copies until the stage directory is under its size limit.
+
+    Each database is staged under its own lock file, so that only one job
+    copies it and the others wait for the copy. A stamp file next to each
+    copy records the size and modification time of the database it was made
+    from, and is touched whenever the copy is used. This needs a filesystem
+    that supports flock().
+    """
+
+    LOCK_NAME = '.lock'
+    STAMP_SUFFIX = '.staged'
+    MIN_IDLE = 3600
+    CHUNK = 8 * 1024 * 1024
+
+    def __init__(self, base, scratch, max_mb, prewarm, verbose):
+        self.mainlog = set_verbosity.verbosity('Database_Stage', verbose)
+        self.base = os.path.abspath(base)
+        #   Copies of different base directories do not mix
+        tag = hashlib.sha1(self.base.encode('utf-8')).hexdigest()[:12]
+        self.stage_dir = os.path.join(
+            os.path.abspath(os.path.expandvars(os.path.expanduser(scratch))),
+            'BAD_Mutations_' + tag)
+        self.max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+        self.prewarm = prewarm
+        #   Local copies that have been checked in this process
+        self.staged = {}
+        self.lock = threading.Lock()
+        self.makedirs(self.stage_dir)
+        self.mainlog.debug(
+            'Staging databases from ' + self.base + ' in ' + self.stage_dir)
+        return
+
+    @staticmethod
+    def makedirs(path):
+        """Make a directory, if another job has not made it already."""
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+        return
+
+    @staticmethod
+    def identity(path):
+        """Return the size and modification time of a file, as a string."""
+        stat = os.stat(path)
+        return str(stat.st_size) + '\t' + str(int(stat.st_mtime))
+
+    def local_path(self, blast_db):
+        """Return the path to the local copy of a database."""
+        with self.lock:
+            local = self.staged.get(blast_db)
+        if local is None:
+            local = self.stage(blast_db)
+            with self.lock:
+                self.staged[blast_db] = local
+        #   Mark the copy as recently used, so that it is not evicted
+        try:
+            os.utime(local + self.STAMP_SUFFIX, None)
+        except OSError:
+            pass
+        return local
+
+    def stage(self, blast_db):
+        """Stage a database, unless an up-to-date copy is already there.
+        Returns the path to the copy."""
+        key = blast_db
+        blast_db = os.path.abspath(blast_db)
+        rel = os.path.relpath(blast_db, self.base)
+        #   Databases outside of the base directory are not staged
+        if rel.startswith(os.pardir):
+            return blast_db
+        local = os.path.join(self.stage_dir, rel)
+        self.makedirs(os.path.dirname(local))
+        stamp = local + self.STAMP_SUFFIX
+        with open(local + self.LOCK_NAME, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                source_id = self.identity(blast_db)
+                try:
+                    with open(stamp, 'r') as handle:
+                        staged_id = handle.read().strip()
+                except (IOError, OSError):
+                    staged_id = None
+                if staged_id == source_id:
+                    self.mainlog.debug('Using staged copy ' + local)
+                    return local
+                #   Remove the stamp first, so that a copy that is cut short
+                #   is never used
+                if staged_id is not None:
+                    os.remove(stamp)
+                nbytes = 0
+                start = time.time()
+                for fname in self.database_files(blast_db):
+                    dest = os.path.join(
+                        os.path.dirname(local),
+                        os.path.basename(fname))
+                    nbytes += self.place(fname, dest)
+                with open(stamp, 'w') as handle:
+                    handle.write(source_id + '\n')
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.mainlog.info(
+            'Staged ' + blast_db + ' in ' + local + ' (' + str(nbytes) +
+            ' bytes in ' + '%.1f' % (time.time() - start) + ' seconds).')
+        #   Record the copy before evicting, so that no thread evicts it
+        with self.lock:
+            self.staged[key] = local
+        self.evict()
+        return local
+
+    def database_files(self, blast_db):
+        """Return the files that belong to a database: the database itself,
+        and the files that start with its name. The gzipped download, and our
+        own lock and stamp files, are left out."""
+        skip = ('.gz', self.LOCK_NAME, self.STAMP_SUFFIX)
+        return [blast_db] + sorted(
+            fname
+            for fname
+            in glob.glob(blast_db + '.*')
+            if not fname.endswith(skip) and '.tmp_' not in fname and
+            os.path.isfile(fname))
+
+    def place(self, fname, dest):
+        """Hard-link or copy one file into the stage directory, under a
+        temporary name that is renamed into place. Returns the number of bytes
+        that were copied, which is 0 for a link."""
+        tmp = dest + '.tmp_' + str(os.getpid())
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        nbytes = 0
+        try:
+            os.link(fname, tmp)
+        except OSError:
+            #   The scratch directory is on another filesystem
+            shutil.copy2(fname, tmp)
+            nbytes = os.path.getsize(tmp)
+        if self.prewarm:
+            self.read_through(tmp)
+        os.rename(tmp, dest)
+        return nbytes
+
+    def read_through(self, fname):
+        """Read a file once, so that it is in the page cache when BLAST
+        opens it."""
+        with open(fname, 'rb') as handle:
+            while handle.read(self.CHUNK):
+                pass
+        return
+
+    def copies(self):
+        """Return a list of (last use, size, local path, source path) tuples
+        for every staged database."""
+        found = []
+        for root, dirs, files in os.walk(self.stage_dir):
+            for fname in files:
+                if not fname.endswith(self.STAMP_SUFFIX):
+                    continue
+                stamp = os.path.join(root, fname)
+                local = stamp[:-len(self.STAMP_SUFFIX)]
+                size = sum(
+                    os.path.getsize(f)
+                    for f
+                    in self.database_files(local)
+                    if os.path.isfile(f))
+                try:
+                    mtime = os.path.getmtime(stamp)
+                except OSError:
+                    continue
+                source = os.path.join(
+                    self.base,
+                    os.path.relpath(local, self.stage_dir))
+                found.append((mtime, size, local, source))
+        return found
+
+    def remove(self, local):
+        """Remove the staged copy of a database, if no job is staging it."""
+        with open(local + self.LOCK_NAME, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return False
+            try:
+                #   The stamp goes first, so the copy is not used while the
+                #   rest is removed
+                os.remove(local + self.STAMP_SUFFIX)
+                for fname in self.database_files(local):
+                    try:
+                        os.remove(fname)
+                    except OSError:
+                        pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return True
+
+    def evict(self):
+        """Remove copies whose database no longer exists, then the least
+        recently used copies until the stage directory is under its size
+        limit. Copies that were used in the last MIN_IDLE seconds are kept, so
+        that we do not pull a database out from under a running search."""
+        with open(os.path.join(self.stage_dir, self.LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                found = sorted(self.copies())
+                #   Other threads add to staged while we evict
+                with self.lock:
+                    in_use = set(self.staged.values())
+                total = sum(size for mtime, size, local, source in found)
+                now = time.time()
+                nremoved = 0
+                for mtime, size, local, source in found:
+                    gone = not os.path.isfile(source)
+                    full = self.max_bytes is not None and \
+                        total > self.max_bytes
+                    if not gone and not full:
+                        continue
+                    if now - mtime < self.MIN_IDLE:
+                        continue
+                    if local in in_use:
+                        continue
+                    if self.remove(local):
+                        total -= size
+                        nremoved += 1
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        if nremoved:
+            self.mainlog.info(
+                'Evicted ' + str(nremoved) + ' staged databases from ' +
+                self.stage_dir + '.')
+        return total
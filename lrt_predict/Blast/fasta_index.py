@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""An offset index for FASTA files, similar to the .fai index from samtools
+faidx. The index is a tab-delimited file next to the FASTA file with one line
+per record: the sequence name, the sequence length, the byte offset of the
+first sequence line, and the number of bytes in the sequence lines. Fetching
+a record is then a seek and a read, rather than a scan through the file."""
+
+#   Import standard library modules here
+import os
+import tempfile
+import threading
+
+#   Suffix of the index file. We do not use .fai, since the columns differ.
+INDEX_SUFFIX = '.fidx'
+
+#   Indices that have been read in, keyed on the path to the FASTA file. Each
+#   value is a tuple of the modification time of the index and what _load()
+#   returns.
+_LOADED = {}
+_LOCK = threading.Lock()
+
+
+def index_path(fasta):
+    """Return the path to the index of a FASTA file."""
+    return fasta + INDEX_SUFFIX
+
+
+def is_stale(fasta):
+    """Return True if the index of a FASTA file is missing or older than the
+    FASTA file."""
+    idx = index_path(fasta)
+    if not os.path.isfile(idx):
+        return True
+    return os.path.getmtime(idx) < os.path.getmtime(fasta)
+
+
+def build_index(fasta):
+    """Read through a FASTA file and write its index. The index is written
+    under a temporary name and renamed into place, so that jobs that share the
+    databases never read a partial index. Returns the path to the index."""
+    records = []
+    name = None
+    offset = 0
+    start = 0
+    length = 0
+    #   Read in binary mode, so that the offsets are in bytes
+    with open(fasta, 'rb') as handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                if name is not None:
+                    records.append((name, length, start, offset - start))
+                #   The name is the first word of the header, which is what
+                #   BLAST reports as the start of the hit title
+                name = line[1:].split(None, 1)[0].decode('utf-8')
+                start = offset + len(line)
+                length = 0
+            else:
+                length += len(line.strip())
+            offset += len(line)
+    if name is not None:
+        records.append((name, length, start, offset - start))
+    idx = index_path(fasta)
+    handle = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        dir=os.path.dirname(os.path.abspath(fasta)),
+        prefix='.tmp_',
+        suffix=INDEX_SUFFIX,
+        delete=False)
+    try:
+        for rec in records:
+            handle.write('\t'.join(str(x) for x in rec) + '\n')
+    finally:
+        handle.close()
+    os.rename(handle.name, idx)
+    return idx
+
+
+def load_index(fasta):
+    """Return the index of a FASTA file as a dictionary of (offset, number of
+    bytes) tuples, keyed on sequence name. The index is built if it is missing
+    or out of date, and is only read from disk once per process."""
+    return _load(fasta)[0]
+
+
+def record_names(fasta):
+    """Return the names of the records in a FASTA file, in file order."""
+    return _load(fasta)[1]
+
+
+def total_length(fasta):
+    """Return the total length of the sequences in a FASTA file."""
+    return _load(fasta)[2]
+
+
+def _load(fasta):
+    """Read the index of a FASTA file, building it first if it is missing or
+    out of date. Returns a tuple of the dictionary of offsets, the list of
+    record names, and the total sequence length."""
+    with _LOCK:
+        if is_stale(fasta):
+            build_index(fasta)
+        mtime = os.path.getmtime(index_path(fasta))
+        if fasta in _LOADED and _LOADED[fasta][0] == mtime:
+            return _LOADED[fasta][1]
+        index = {}
+        names = []
+        total = 0
+        with open(index_path(fasta), 'r') as handle:
+            for line in handle:
+                name, length, offset, nbytes = line.rstrip('\n').split('\t')
+                names.append(name)
+                total += int(length)
+                #   The first record with a name wins, like a regex search
+                if name not in index:
+                    index[name] = (int(offset), int(nbytes))
+        _LOADED[fasta] = (mtime, (index, names, total))
+        return _LOADED[fasta][1]
+
+
+def fetch(fasta, names):
+    """Fetch records out of a FASTA file by name. Returns a dictionary of
+    FASTA strings keyed on name. Names that are not in the file are left
+    out."""
+    index = load_index(fasta)
+    records = {}
+    with open(fasta, 'rb') as handle:
+        for name in names:
+            if name not in index:
+                continue
+            offset, nbytes = index[name]
+            handle.seek(offset)
+            seq = handle.read(nbytes).decode('utf-8')
+            if seq and not seq.endswith('\n'):
+                seq += '\n'
+            records[name] = '>' + name + '\n' + seq
+    return records
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""A table of precomputed best hits for every CDS of the target species,
+stored in an SQLite database. It is built once with the 'orthologues'
+subcommand, and then BlastSearch can look the orthologues of a query up in it
+instead of searching. A row is only used if the species database has not
+changed since the table was built, and if the table was built with the same
+search parameters."""
+
+#   Import standard library modules here
+import os
+import hashlib
+import sqlite3
+import threading
+
+#   Import our helper scripts here
+from lrt_predict.General import set_verbosity
+
+
+class OrthologueTable(object):
+    """A class to store and look up the best hits of target species CDS.
+
+    Contains the following instance attributes:
+        path (str)            Path to the SQLite database
+        usable (bool)         False if the table was built with different
+                              search parameters, and should not be used
+        mainlog (logger)      Logging messages formatter and handler
+
+    Contains the following methods:
+        seq_hash(seq):
+            Return the key of a query sequence.
+
+        check_params(params, store):
+            Check the search parameters against the ones the table was built
+            with. If store is True and the table is new, store them.
+
+        add_query(name, seq, hits, databases):
+            Store the best hit of a query in each species database. Species
+            without a hit are stored too, so that we know they were searched.
+
+        lookup(seq, blast_db):
+            Return a tuple of (found, hit) for a query in one species database.
+
+        searched_hashes(databases):
+            Return the set of query hashes that are stored for every one of a
+            list of species databases.
+
+        close():
+            Close the connection to the table.
+
+    Queries are identified by a hash of their sequence, so that a query is
+    found no matter what it is named in the FASTA file. The table can be read
+    from many threads at once.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS params '
+        '(name TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE IF NOT EXISTS databases '
+        '(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)',
+        'CREATE TABLE IF NOT EXISTS queries '
+        '(hash TEXT PRIMARY KEY, name TEXT)',
+        'CREATE TABLE IF NOT EXISTS hits '
+        '(hash TEXT, path TEXT, seq_id TEXT, gb_id TEXT, '
+        'PRIMARY KEY (hash, path))']
+
+    def __init__(self, path, verbose):
+        self.mainlog = set_verbosity.verbosity('Orthologue_Table', verbose)
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.usable = True
+        self.lock = threading.Lock()
+        #   The table is read from the worker threads of the search, so the
+        #   connection is shared, and guarded by the lock.
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+        #   Identity of the species databases, as they were when the table
+        #   was built
+        self.databases = dict(
+            (path, (size, mtime))
+            for path, size, mtime
+            in self.conn.execute('SELECT path, size, mtime FROM databases'))
+        self.mainlog.debug('Opened orthologue table ' + self.path)
+        return
+
+    @staticmethod
+    def seq_hash(seq):
+        """Return the key of a query sequence."""
+        return hashlib.sha1(str(seq).upper().encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def db_identity(blast_db):
+        """Return the size and modification time of a species database."""
+        stat = os.stat(blast_db)
+        return (stat.st_size, int(stat.st_mtime))
+
+    def check_params(self, params, store=False):
+        """Check that the search parameters match the ones the table was
+        built with. If store is True and the table is new, the parameters are
+        stored instead. Returns True if the table can be used with these
+        parameters."""
+        params = dict(params)
+        with self.lock:
+            stored = dict(self.conn.execute('SELECT name, value FROM params'))
+            if not stored and store:
+                self.conn.executemany(
+                    'INSERT INTO params VALUES (?, ?)',
+                    params.items())
+                self.conn.commit()
+                return True
+        if not stored:
+            self.mainlog.warning(
+                'The orthologue table ' + self.path + ' is empty. It will not '
+                'be used.')
+            self.usable = False
+        elif stored != params:
+            self.mainlog.warning(
+                'The orthologue table ' + self.path + ' was built with '
+                'different search parameters. It will not be used.')
+            self.mainlog.debug(
+                'Table: ' + str(stored) + '\nSearch: ' + str(params))
+            self.usable = False
+        return self.usable
+
+    def add_query(self, name, seq, hits, databases):
+        """Store the best hits of a query. hits is a dictionary of (sequence
+        ID, GenBank ID) tuples keyed on species database, and databases is the
+        list of species databases that were searched."""
+        key = self.seq_hash(seq)
+        rows = []
+        for blast_db in databases:
+            hit = hits.get(blast_db)
+            path = os.path.abspath(blast_db)
+            if hit:
+                rows.append((key, path, hit[0], hit[1]))
+            else:
+                rows.append((key, path, None, None))
+        with self.lock:
+            for blast_db in databases:
+                path = os.path.abspath(blast_db)
+                identity = self.db_identity(blast_db)
+                if self.databases.get(path) != identity:
+                    #   The database has changed, so the hits of the other
+                    #   queries in it are out of date
+                    self.conn.execute(
+                        'DELETE FROM hits WHERE path = ?',
+                        (path,))
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO databases VALUES (?, ?, ?)',
+                        (path,) + identity)
+                    self.databases[path] = identity
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?)',
+                rows)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO queries VALUES (?, ?)',
+                (key, name))
+            self.conn.commit()
+        return
+
+    def lookup(self, seq, blast_db):
+        """Look up the best hit of a query in one species database. Returns a
+        tuple of (found, hit), since a stored hit can be None. Nothing is
+        found if the species database has changed since it was searched."""
+        if not self.usable:
+            return (False, None)
+        path = os.path.abspath(blast_db)
+        if self.databases.get(path) != self.db_identity(blast_db):
+            return (False, None)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT seq_id, gb_id FROM hits WHERE hash = ? AND path = ?',
+                (self.seq_hash(seq), path)).fetchone()
+        if row is None:
+            return (False, None)
+        if row[1] is None:
+            return (True, None)
+        return (True, (row[0], row[1]))
+
+    def searched_hashes(self, databases):
+        """Return the set of hashes of the queries that have been searched
+        against every one of the species databases. Each database is checked
+        once, so this is much faster than calling lookup() for every query
+        and database."""
+        if not self.usable or not databases:
+            return set()
+        searched = None
+        for blast_db in databases:
+            path = os.path.abspath(blast_db)
+            #   Nothing stored for a changed database can be used
+            if self.databases.get(path) != self.db_identity(blast_db):
+                return set()
+            with self.lock:
+                hashes = set(
+                    row[0]
+                    for row
+                    in self.conn.execute(
+                        'SELECT hash FROM hits WHERE path = ?',
+                        (path,)))
+            if searched is None:
+                searched = hashes
+            else:
+                searched &= hashes
+            if not searched:
+                break
+        return searched
+
+    def close(self):
+        """Close the connection to the table."""
+        self.conn.close()
+        return
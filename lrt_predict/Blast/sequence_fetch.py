@@ -1,26 +1,18 @@
 #!/usr/bin/env python
 
 #   A script to retrieve FASTA sequences from a BLAST database
-#   Basically just a fancy wrapper around blastdbcmd
+#   Basically just a fancy wrapper around blastdbcmd. Sequences can be fetched
+#   one at a time, or many at once from the same database.
 
 import subprocess
-import re
-import os
-
-#   create a variable to hold the path to our installation directory
-#   It is two levels above this one
-LRT_PATH = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
-#   The directory that contains shell scripts
-SEQ_FETCH_SCRIPT = os.path.join(
-    LRT_PATH,
-    'Shell_Scripts',
-    'Seq_From_BLASTdb.sh')
+import tempfile
+import collections
 
 
 def blastdbcmd(path, db, seqID):
     """Wrapper function for the blastdbcmd sequence fetch command."""
-    cmd = ['bash', SEQ_FETCH_SCRIPT, path, db, seqID]
-    #   Execute the script
+    cmd = [path, '-entry', seqID, '-db', db]
+    #   Execute the command directly, rather than through a shell script.
     #   shell=False to ensure that we aren't executing commands from untrusted
     #   sources. We set out and err to subprocess.PIPE so we can save the
     #   output for later
@@ -34,25 +26,78 @@ def blastdbcmd(path, db, seqID):
     return (out, err)
 
 
-def get_seq_by_regex(db, seqID):
-    """Use a regular expression to pull out FASTA sequences."""
-    #   Open a handle to the fasta file
-    handle = open(db, 'r')
-    #   And read its contents into memory.
-    fasta = handle.read()
-    #   Then we build the regex out of the sequence id
-    #   We have to prepend a >, since that starts off the FASTA record
-    s = '>' + seqID
-    #   Then, we have to escape any dots in the name, since . is a special
-    #   regex character
-    s = s.replace('.', r'\.')
-    #   Then build the full regex
-    #   Match the start of the FASTA record, followed by any number of
-    #   characters, followed by a newline, then ATCGN, across multiple lines
-    #   Thanks to Paul Hoffman for the regex.
-    pattern = re.compile('(^' + s + '.*\n[ATCGN\n]*)', re.M)
-    #   Search the fasta for the right sequence and return it
-    target_seq = pattern.search(fasta)
-    #   Close this file handle
-    handle.close()
-    return target_seq
+def split_fasta(fasta):
+    """Split a string of FASTA records into a list of records. Each record
+    keeps its header line and ends with a newline."""
+    records = []
+    for chunk in fasta.split('\n>'):
+        if not chunk.strip():
+            continue
+        if not chunk.startswith('>'):
+            chunk = '>' + chunk
+        if not chunk.endswith('\n'):
+            chunk += '\n'
+        records.append(chunk)
+    return records
+
+
+def record_ids(record):
+    """Return the IDs that a sequence may have been asked for by, from the
+    header of its FASTA record: the first word, and the parts of an ID like
+    lcl|name or gnl|db|name, last part first."""
+    header = record.split('\n', 1)[0][1:].split()
+    if not header:
+        return []
+    return [header[0]] + header[0].split('|')[::-1]
+
+
+def match_records(seq_ids, records):
+    """Match FASTA records to the sequence IDs that they were fetched with,
+    by the IDs in their headers. Returns a dictionary of records keyed on
+    sequence ID, or None if a record does not match, or an ID has no record.
+    """
+    #   An ID can also be found by its last part, since blastdbcmd may leave
+    #   out a prefix like lcl|. The whole ID is tried first.
+    wanted = {}
+    for seq_id in seq_ids:
+        wanted[seq_id] = seq_id
+    for seq_id in seq_ids:
+        wanted.setdefault(seq_id.split('|')[-1], seq_id)
+    found = {}
+    for record in records:
+        for rec_id in record_ids(record):
+            if rec_id in wanted and wanted[rec_id] not in found:
+                found[wanted[rec_id]] = record
+                break
+        else:
+            return None
+    if len(found) != len(seq_ids):
+        return None
+    return found
+
+
+def blastdbcmd_batch(path, db, seqIDs):
+    """Fetch many sequences out of one database with a single call to
+    blastdbcmd, using -entry_batch. Returns a tuple of a dictionary of FASTA
+    strings keyed on sequence ID, and the stderr of blastdbcmd. The records
+    are matched to the IDs by their headers. If that cannot be done for all
+    of them, the dictionary is None and the caller should fetch them one at a
+    time."""
+    #   Remove duplicates, but keep the order
+    unique_ids = list(collections.OrderedDict.fromkeys(seqIDs))
+    id_list = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        prefix='BAD_Mutations_SeqFetch_',
+        suffix='_ids.txt')
+    id_list.write('\n'.join(unique_ids) + '\n')
+    id_list.flush()
+    cmd = [path, '-entry_batch', id_list.name, '-db', db]
+    p = subprocess.Popen(
+        cmd,
+        shell=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    id_list.close()
+    records = split_fasta(out.decode('utf-8'))
+    return (match_records(unique_ids, records), err)
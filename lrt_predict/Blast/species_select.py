@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Functions to pick a subset of the species databases to search, spread
+across the phylogeny. Species are grouped by a clade table, which is a
+tab-delimited file with a species name and a clade name on each line:
+    Zmays       Poaceae_Panicoideae
+    Sbicolor    Poaceae_Panicoideae
+Lines that start with # are comments. A species name matches a database if it
+is in the file name of the database, ignoring case, like TARGET_SPECIES.
+Species that are not in the table are each put in a clade of their own.
+
+The selection takes one species from each clade in turn, until the maximum
+number of species is reached. Clades are visited in the order that they first
+appear in the table, and species within a clade in table order, so the
+selection only depends on the table and the names of the databases."""
+
+#   Import standard library modules here
+import os
+
+
+def read_clades(path):
+    """Read a clade table. Returns a list of (species, clade) tuples, in the
+    order of the file."""
+    clades = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            tmp = line.strip().split()
+            if len(tmp) < 2:
+                continue
+            clades.append((tmp[0], tmp[1]))
+    return clades
+
+
+def clade_of(blast_db, clades):
+    """Return a tuple of the clade of a species database and the rank of the
+    species in the table. Databases that are not in the table get None for
+    the rank. If more than one species name matches, the longest wins."""
+    fname = os.path.basename(blast_db).upper()
+    best = None
+    for rank, (species, clade) in enumerate(clades):
+        if species.upper() not in fname:
+            continue
+        if best is None or len(species) > len(clades[best][0]):
+            best = rank
+    if best is None:
+        return (fname, None)
+    return (clades[best][1], best)
+
+
+def select(databases, clades, max_species):
+    """Pick at most max_species of the databases, one clade at a time. Returns
+    the picked databases, in the order that they were given."""
+    if max_species is None or len(databases) <= max_species:
+        return list(databases)
+    #   Group the databases by clade. Clades in the table come first, in table
+    #   order, and then the databases that are not in the table, by name.
+    groups = {}
+    order = {}
+    for blast_db in databases:
+        clade, rank = clade_of(blast_db, clades)
+        if rank is None:
+            key = (1, os.path.basename(blast_db), blast_db)
+        else:
+            key = (0, rank, blast_db)
+        groups.setdefault(clade, []).append(key)
+        order[clade] = min(order.get(clade, key), key)
+    members = [
+        [key[2] for key in sorted(groups[clade])]
+        for clade
+        in sorted(groups, key=lambda c: order[c])]
+    picked = set()
+    depth = 0
+    while len(picked) < max_species:
+        for group in members:
+            if depth < len(group) and len(picked) < max_species:
+                picked.add(group[depth])
+        depth += 1
+    return [blast_db for blast_db in databases if blast_db in picked]
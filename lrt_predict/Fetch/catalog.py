@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""A catalog of the species databases in a base directory. It is written when
+the databases are converted, so that the search does not have to walk the
+base directory to find them. The catalog is a tab-delimited file in the base
+directory with a header line, and one line per species database:
+    path, species, sequences, residues, MD5, size, modification time
+The path is relative to the base directory. The names, sizes, and modification
+times of the databases are used to tell if a database was added, removed, or
+changed since the catalog was written."""
+
+#   Import standard library modules here
+import os
+import tempfile
+
+#   Import our helper scripts
+from lrt_predict.General import file_funcs
+from lrt_predict.Blast import fasta_index
+
+#   Name of the catalog in the base directory
+CATALOG_NAME = 'Species_Databases.catalog'
+#   Columns of the catalog
+COLUMNS = [
+    'Path', 'Species', 'Sequences', 'Residues', 'MD5', 'Size', 'Mtime']
+#   Suffix of the species databases
+DB_SUFFIX = '.fa'
+
+
+def catalog_path(base):
+    """Return the path to the catalog of a base directory."""
+    return os.path.join(base, CATALOG_NAME)
+
+
+def species_of(blast_db):
+    """Return the species name of a species database."""
+    return os.path.basename(blast_db).split('.')[0]
+
+
+def describe(blast_db, log):
+    """Return the catalog entry of one species database, as a dictionary keyed
+    on the lower-cased column names."""
+    stat = os.stat(blast_db)
+    return {
+        'path': blast_db,
+        'species': species_of(blast_db),
+        'sequences': len(fasta_index.record_names(blast_db)),
+        'residues': fasta_index.total_length(blast_db),
+        'md5': file_funcs.calculate_md5(blast_db, log),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime)}
+
+
+def build_catalog(base, log):
+    """Find the species databases in a base directory and write the catalog.
+    The catalog is written under a temporary name and renamed into place, so
+    that running searches never read a partial catalog. Returns the list of
+    entries."""
+    databases = [
+        db
+        for db
+        in file_funcs.get_file_by_ext(base, DB_SUFFIX, log)
+        if db]
+    entries = [describe(db, log) for db in sorted(databases)]
+    handle = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        dir=base,
+        prefix='.tmp_',
+        suffix='.catalog',
+        delete=False)
+    try:
+        handle.write('\t'.join(COLUMNS) + '\n')
+        for entry in entries:
+            handle.write('\t'.join([
+                os.path.relpath(entry['path'], base),
+                entry['species'],
+                str(entry['sequences']),
+                str(entry['residues']),
+                entry['md5'],
+                str(entry['size']),
+                str(entry['mtime'])]) + '\n')
+    finally:
+        handle.close()
+    os.rename(handle.name, catalog_path(base))
+    log.info(
+        'Wrote catalog of ' + str(len(entries)) + ' species databases to ' +
+        catalog_path(base))
+    return entries
+
+
+def load_catalog(base):
+    """Read the catalog of a base directory. Returns a list of entries, in the
+    same form as describe(), or None if there is no catalog."""
+    cat = catalog_path(base)
+    if not os.path.isfile(cat):
+        return None
+    entries = []
+    with open(cat, 'r') as f:
+        for line in f:
+            if line.startswith(COLUMNS[0] + '\t'):
+                continue
+            tmp = line.rstrip('\n').split('\t')
+            if len(tmp) != len(COLUMNS):
+                continue
+            entries.append({
+                'path': os.path.join(base, tmp[0]),
+                'species': tmp[1],
+                'sequences': int(tmp[2]),
+                'residues': int(tmp[3]),
+                'md5': tmp[4],
+                'size': int(tmp[5]),
+                'mtime': int(tmp[6])})
+    return entries
+
+
+def catalog_dirs(base, entries):
+    """Return the directories that a new species database could be added to:
+    the base directory, each directory in it, and the directory of each
+    database in the catalog."""
+    dirs = set([base])
+    try:
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            if os.path.isdir(path):
+                dirs.add(path)
+    except OSError:
+        pass
+    for entry in entries:
+        dirs.add(os.path.dirname(entry['path']))
+    return dirs
+
+
+def listed_databases(dirs):
+    """Return the set of paths of the species databases in a set of
+    directories. Only the directories themselves are listed, not the
+    directories below them."""
+    found = set()
+    for path in dirs:
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(DB_SUFFIX) and \
+                    os.path.isfile(os.path.join(path, name)):
+                found.add(os.path.join(path, name))
+    return found
+
+
+def is_stale(base, entries):
+    """Return True if the catalog no longer describes the base directory. This
+    is the case if a species database was changed, removed, or added to the
+    base directory or to a species directory in it. The databases are
+    compared by name, size, and modification time, and not by the times of
+    their directories, since searches write indices and temporary files next
+    to the databases. This only lists the base directory and the species
+    directories, and does not walk the base directory."""
+    if not os.path.isfile(catalog_path(base)):
+        return True
+    cataloged = set(
+        os.path.normpath(entry['path'])
+        for entry
+        in entries)
+    listed = set(
+        os.path.normpath(path)
+        for path
+        in listed_databases(catalog_dirs(base, entries)))
+    if listed != cataloged:
+        return True
+    for entry in entries:
+        try:
+            stat = os.stat(entry['path'])
+        except OSError:
+            return True
+        if (stat.st_size, int(stat.st_mtime)) != \
+                (entry['size'], entry['mtime']):
+            return True
+    return False
+
+
+def databases(base, log):
+    """Return the catalog entries of the species databases in a base
+    directory. If the catalog is missing or out of date, the base directory is
+    searched instead, and the entries only have the path and species name."""
+    entries = load_catalog(base)
+    if entries is not None and not is_stale(base, entries):
+        log.debug('Read species databases from ' + catalog_path(base))
+        return entries
+    log.warning(
+        'The catalog of species databases in ' + base + ' is missing or out '
+        'of date. Searching the base directory instead. Run the fetch '
+        'subcommand with --convert-only to update it.')
+    return [
+        {'path': db, 'species': species_of(db)}
+        for db
+        in file_funcs.get_file_by_ext(base, DB_SUFFIX, log)
+        if db]
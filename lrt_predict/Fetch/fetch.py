@@ -8,6 +8,8 @@ from lrt_predict.General import file_funcs
 from lrt_predict.General import set_verbosity
 from lrt_predict.Fetch import format_blast
 from lrt_predict.General import dir_funcs
+from lrt_predict.Blast import fasta_index
+from lrt_predict.Fetch import kmer_index
 
 
 class Fetcher(object):
@@ -52,4 +54,18 @@ class Fetcher(object):
             out, error = format_blast.format_blast(makeblastdb_path, fname)
             self.mainlog.info('stdout: \n' + out.decode('utf-8'))
             self.mainlog.info('stderr: \n' + error.decode('utf-8'))
+            #   Index the unzipped FASTA file, so that sequences can be
+            #   fetched from it quickly without blastdbcmd
+            fasta = fname.replace('.gz', '', 1)
+            if file_funcs.file_exists(fasta, self.mainlog):
+                fasta_index.build_index(fasta)
+                kmer_index.build_index(fasta)
+                self.mainlog.info('Indexed ' + fasta)
+                #   Also make a translated database for protein searches
+                pep, out, error = format_blast.format_protein(
+                    makeblastdb_path,
+                    fasta)
+                self.mainlog.info('Made protein database ' + pep)
+                self.mainlog.info('stdout: \n' + out.decode('utf-8'))
+                self.mainlog.info('stderr: \n' + error.decode('utf-8'))
         return
@@ -7,6 +7,10 @@ import subprocess
 #   To handle paths
 import os
 
+#   To translate the CDS
+from Bio.Seq import Seq
+from Bio.Data.CodonTable import TranslationError
+
 #   create a variable to hold the path to our installation directory
 #   It is two levels above this one
 #   os.path.realpath(__file__) is the full path to this script
@@ -15,6 +19,10 @@ LRT_PATH = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
 #   The directory that contains shell scripts
 DBFORMAT_SCRIPT = os.path.join(LRT_PATH, 'Shell_Scripts', 'Unzip_CDS.sh')
 
+#   Suffix of the translated species databases. This must not end in .fa, or
+#   the protein databases would be searched as species databases.
+PROTEIN_SUFFIX = '.pep'
+
 
 def format_blast(makeblastdb_path, fname):
     """Call the shell script that handles BLAST database formatting."""
@@ -32,3 +40,53 @@ def format_blast(makeblastdb_path, fname):
         stderr=subprocess.PIPE)
     out, err = p.communicate()
     return (out, err)
+
+
+def translate_fasta(in_fasta, out_fasta):
+    """Translate every record of a CDS FASTA file into amino acids, in the
+    first frame. The headers are copied as-is, and every record is kept in the
+    same order, so that the ordinal IDs that BLAST gives to the records of the
+    protein database are the same as those of the CDS database. Records that
+    are too short to translate are written as a single X."""
+    with open(in_fasta, 'r') as inp, open(out_fasta, 'w') as out:
+        header = None
+        seq = []
+        for line in inp:
+            if line.startswith('>'):
+                if header is not None:
+                    out.write(header + translate_seq(''.join(seq)) + '\n')
+                header = line
+                seq = []
+            else:
+                seq.append(line.strip())
+        if header is not None:
+            out.write(header + translate_seq(''.join(seq)) + '\n')
+    return out_fasta
+
+
+def translate_seq(cds):
+    """Translate a CDS string, dropping any trailing partial codon."""
+    cds = cds[:len(cds) - (len(cds) % 3)]
+    if not cds:
+        return 'X'
+    try:
+        return str(Seq(cds).translate())
+    except TranslationError:
+        #   Characters that are not nucleotides at all. We still need a
+        #   record here, to keep the ordinal IDs in step.
+        return 'X' * (len(cds) // 3)
+
+
+def format_protein(makeblastdb_path, fname):
+    """Translate an unzipped CDS FASTA file and make a protein BLAST database
+    out of it, for the blastp search backend. Returns the path to the protein
+    FASTA file, and the output of makeblastdb."""
+    pep = translate_fasta(fname, fname + PROTEIN_SUFFIX)
+    cmd = [makeblastdb_path, '-in', pep, '-dbtype', 'prot']
+    p = subprocess.Popen(
+        cmd,
+        shell=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    return (pep, out, err)
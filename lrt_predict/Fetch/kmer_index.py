@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""A k-mer index of the translated CDS in a species database, used to pick a
+small set of candidate subjects for a query before running BLAST. Each record
+is translated in the first frame, and a fixed sample of its amino acid k-mers
+is stored. The same sample is taken from the query, so the records that share
+the most sampled k-mers with the query are the likely best hits.
+
+The index is a binary file next to the FASTA file. It holds the number of
+(k-mer, record) pairs, then the k-mer codes in sorted order, then the record
+numbers in the same order, all as unsigned 32-bit integers. Records are
+numbered from 0 in the order of the FASTA file."""
+
+#   Import standard library modules here
+import os
+import array
+import bisect
+import heapq
+import shutil
+import tempfile
+import threading
+
+#   Import our helper scripts
+from lrt_predict.Fetch import format_blast
+
+#   Suffix of the index file
+INDEX_SUFFIX = '.kmer'
+#   Length of the k-mers, in amino acids
+K = 5
+#   Keep one k-mer in SAMPLE, chosen by a hash of the k-mer, so that the query
+#   and the subjects keep the same ones
+SAMPLE = 8
+#   Amino acids that we encode. Anything else, like stops, breaks the k-mer.
+ALPHABET = 'ACDEFGHIKLMNPQRSTVWY'
+CODES = dict((aa, i) for i, aa in enumerate(ALPHABET))
+NCODES = len(ALPHABET) ** K
+#   Number of (k-mer, record) pairs that are sorted in memory at once when the
+#   index is built, and that are read or written at once when the sorted
+#   chunks are merged
+CHUNK = 1 << 20
+BLOCK = 1 << 16
+
+#   Indices that have been read in, keyed on the path to the FASTA file
+_LOADED = {}
+_LOCK = threading.Lock()
+
+
+def index_path(fasta):
+    """Return the path to the k-mer index of a FASTA file."""
+    return fasta + INDEX_SUFFIX
+
+
+def is_stale(fasta):
+    """Return True if the k-mer index of a FASTA file is missing or older than
+    the FASTA file."""
+    idx = index_path(fasta)
+    if not os.path.isfile(idx):
+        return True
+    return os.path.getmtime(idx) < os.path.getmtime(fasta)
+
+
+def sampled(code):
+    """Return True if a k-mer is in the sample. We use a multiplicative hash,
+    so that the sample does not depend on the last residue of the k-mer."""
+    return ((code * 2654435761) & 0xffffffff) % SAMPLE == 0
+
+
+def kmers(protein):
+    """Return the set of sampled k-mer codes in a protein sequence."""
+    found = set()
+    code = 0
+    length = 0
+    for aa in protein.upper():
+        if aa not in CODES:
+            code = 0
+            length = 0
+            continue
+        code = (code * len(ALPHABET) + CODES[aa]) % NCODES
+        length += 1
+        if length >= K and sampled(code):
+            found.add(code)
+    return found
+
+
+def read_cds(fasta):
+    """Yield the CDS sequences of a FASTA file, in order."""
+    seq = None
+    with open(fasta, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                if seq is not None:
+                    yield ''.join(seq)
+                seq = []
+            elif seq is not None:
+                seq.append(line.strip())
+    if seq is not None:
+        yield ''.join(seq)
+
+
+def sorted_runs(fasta, tmpdir):
+    """Write the (k-mer, record) pairs of a CDS FASTA file into files of at
+    most CHUNK pairs each, sorted. A pair is packed into one unsigned 64-bit
+    integer, with the k-mer code in the high half, so that sorting the pairs
+    sorts them by k-mer, then by record. Returns the open files, rewound, and
+    the number of pairs."""
+    runs = []
+    total = 0
+    chunk = array.array('Q')
+    for record, cds in enumerate(read_cds(fasta)):
+        for code in kmers(format_blast.translate_seq(cds)):
+            chunk.append((code << 32) | record)
+        if len(chunk) >= CHUNK:
+            runs.append(write_run(chunk, tmpdir))
+            total += len(chunk)
+            chunk = array.array('Q')
+    if chunk or not runs:
+        runs.append(write_run(chunk, tmpdir))
+        total += len(chunk)
+    return (runs, total)
+
+
+def write_run(chunk, tmpdir):
+    """Sort one chunk of packed pairs into a temporary file. Returns the file,
+    rewound."""
+    handle = tempfile.TemporaryFile(dir=tmpdir)
+    array.array('Q', sorted(chunk)).tofile(handle)
+    handle.seek(0)
+    return handle
+
+
+def read_run(handle):
+    """Yield the packed pairs of a sorted run, reading BLOCK at a time."""
+    while True:
+        block = array.array('Q')
+        try:
+            block.fromfile(handle, BLOCK)
+        except EOFError:
+            #   The last block is short; fromfile() keeps what it read
+            pass
+        if not block:
+            return
+        for pair in block:
+            yield pair
+
+
+def build_index(fasta):
+    """Build the k-mer index of a CDS FASTA file. The pairs are sorted in
+    chunks and merged, so that only one chunk of them is held in memory. The
+    index is written under a temporary name and renamed into place. Returns
+    the path to the index."""
+    tmpdir = os.path.dirname(os.path.abspath(fasta))
+    runs, total = sorted_runs(fasta, tmpdir)
+    handle = tempfile.NamedTemporaryFile(
+        mode='wb',
+        dir=tmpdir,
+        prefix='.tmp_',
+        suffix=INDEX_SUFFIX,
+        delete=False)
+    #   The codes go straight into the index, and the records into a second
+    #   file that is appended after them
+    records = tempfile.TemporaryFile(dir=tmpdir)
+    try:
+        array.array('I', [total]).tofile(handle)
+        code_block = array.array('I')
+        record_block = array.array('I')
+        for pair in heapq.merge(*[read_run(run) for run in runs]):
+            code_block.append(pair >> 32)
+            record_block.append(pair & 0xffffffff)
+            if len(code_block) >= BLOCK:
+                code_block.tofile(handle)
+                record_block.tofile(records)
+                code_block = array.array('I')
+                record_block = array.array('I')
+        code_block.tofile(handle)
+        record_block.tofile(records)
+        records.seek(0)
+        shutil.copyfileobj(records, handle)
+    finally:
+        handle.close()
+        records.close()
+        for run in runs:
+            run.close()
+    os.rename(handle.name, index_path(fasta))
+    return index_path(fasta)
+
+
+def load_index(fasta):
+    """Return the k-mer codes and record numbers of the index of a FASTA file,
+    building the index if it is missing or out of date. The index is only read
+    from disk once per process."""
+    with _LOCK:
+        if is_stale(fasta):
+            build_index(fasta)
+        mtime = os.path.getmtime(index_path(fasta))
+        if fasta in _LOADED and _LOADED[fasta][0] == mtime:
+            return _LOADED[fasta][1]
+        with open(index_path(fasta), 'rb') as handle:
+            count = array.array('I')
+            count.fromfile(handle, 1)
+            codes = array.array('I')
+            codes.fromfile(handle, count[0])
+            records = array.array('I')
+            records.fromfile(handle, count[0])
+        _LOADED[fasta] = (mtime, (codes, records))
+        return (codes, records)
+
+
+def candidates(fasta, cds, ntop, min_shared):
+    """Return the numbers of the records in a FASTA file that share the most
+    sampled k-mers with a CDS query, best first. At most ntop records are
+    returned, and only those that share at least min_shared k-mers."""
+    codes, records = load_index(fasta)
+    counts = {}
+    for code in kmers(format_blast.translate_seq(cds)):
+        start = bisect.bisect_left(codes, code)
+        end = bisect.bisect_right(codes, code, start)
+        for i in range(start, end):
+            counts[records[i]] = counts.get(records[i], 0) + 1
+    ranked = sorted(
+        (rec for rec, n in counts.items() if n >= min_shared),
+        key=lambda rec: (-counts[rec], rec))
+    return ranked[:ntop]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Functions to combine all of the species CDS databases into one merged BLAST
+database, so that a query can be searched against every species at once. Each
+sequence name is prefixed with a tag for its species, like
+    >BADSP3__Sobic.001G000100.1
+and a table that maps the tags back to the species databases is written next
+to the merged database."""
+
+#   To manage subprocesses
+import subprocess
+#   To handle paths
+import os
+
+#   Import our helper scripts
+from lrt_predict.General import file_funcs
+from lrt_predict.Fetch import format_blast
+
+#   Name of the merged database in the base directory. This must not end in
+#   .fa, or it would be searched as a species database.
+MERGED_NAME = 'All_Species_CDS.merged'
+#   Suffix of the table of species tags
+SPECIES_SUFFIX = '.species'
+#   Prefix of the species tags, and the separator between the tag and the
+#   original sequence name
+TAG_PREFIX = 'BADSP'
+TAG_SEP = '__'
+
+
+def merged_path(base):
+    """Return the path to the merged database in a base directory."""
+    return os.path.join(base, MERGED_NAME)
+
+
+def species_tag(name):
+    """Return the species tag of a sequence name in the merged database, or
+    None if it does not have one."""
+    if not name.startswith(TAG_PREFIX) or TAG_SEP not in name:
+        return None
+    return name.split(TAG_SEP, 1)[0]
+
+
+def tag_fasta(in_fasta, tag, out):
+    """Copy the records of a FASTA file into an open file handle, with the
+    species tag added to the front of each name. Returns the number of
+    residues that were copied."""
+    nres = 0
+    with open(in_fasta, 'r') as inp:
+        for line in inp:
+            #   The last line of a file may not end in a newline
+            if not line.endswith('\n'):
+                line += '\n'
+            if line.startswith('>'):
+                out.write('>' + tag + TAG_SEP + line[1:])
+            else:
+                nres += len(line.strip())
+                out.write(line)
+    return nres
+
+
+def makeblastdb(makeblastdb_path, fname, dbtype):
+    """Format a FASTA file as a BLAST database."""
+    cmd = [makeblastdb_path, '-in', fname, '-dbtype', dbtype]
+    p = subprocess.Popen(
+        cmd,
+        shell=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    return (out, err)
+
+
+def build_merged(makeblastdb_path, base, log):
+    """Combine the species databases in a base directory into one merged
+    database, and write the table of species tags. If every species has a
+    protein database, a merged protein database is made as well, with the
+    same tags."""
+    databases = [
+        db
+        for db
+        in file_funcs.get_file_by_ext(base, '.fa', log)
+        if db]
+    if not databases:
+        log.error('There are no species databases in ' + base + ' to merge.')
+        exit(1)
+    merged = merged_path(base)
+    log.info(
+        'Merging ' + str(len(databases)) + ' species databases into ' +
+        merged)
+    species = []
+    with open(merged, 'w') as handle:
+        for index, db in enumerate(sorted(databases)):
+            tag = TAG_PREFIX + str(index)
+            nres = tag_fasta(db, tag, handle)
+            species.append((tag, os.path.relpath(db, base), nres))
+    with open(merged + SPECIES_SUFFIX, 'w') as handle:
+        for tag, db, nres in species:
+            handle.write('\t'.join([tag, db, str(nres)]) + '\n')
+    out, err = makeblastdb(makeblastdb_path, merged, 'nucl')
+    log.info('stdout: \n' + out.decode('utf-8'))
+    log.info('stderr: \n' + err.decode('utf-8'))
+    #   Only make the protein database if all of the species have one, or
+    #   the tags would not line up
+    peps = [
+        os.path.join(base, db) + format_blast.PROTEIN_SUFFIX
+        for tag, db, nres
+        in species]
+    if all(os.path.isfile(pep) for pep in peps):
+        merged_pep = merged + format_blast.PROTEIN_SUFFIX
+        with open(merged_pep, 'w') as handle:
+            for (tag, db, nres), pep in zip(species, peps):
+                tag_fasta(pep, tag, handle)
+        out, err = makeblastdb(makeblastdb_path, merged_pep, 'prot')
+        log.info('stdout: \n' + out.decode('utf-8'))
+        log.info('stderr: \n' + err.decode('utf-8'))
+    else:
+        log.warning(
+            'Not all species have protein databases, so no merged protein '
+            'database was made.')
+    return merged
+
+
+def read_species(merged):
+    """Read the table of species tags of a merged database. Returns a list of
+    (tag, species database, number of residues) tuples."""
+    base = os.path.dirname(merged)
+    species = []
+    with open(merged + SPECIES_SUFFIX, 'r') as f:
+        for line in f:
+            tmp = line.strip().split('\t')
+            if len(tmp) != 3:
+                continue
+            species.append((tmp[0], os.path.join(base, tmp[1]), int(tmp[2])))
+    return species
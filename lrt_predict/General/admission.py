@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""Admission control for the memory of a node. Jobs that run on the same node
+share a ledger file, which lists the memory that each running tool was
+admitted with. A tool only starts when its estimated memory fits in what is
+left of the memory budget of the node; otherwise it waits for other tools to
+finish. The ledger is locked with flock(), so no service has to run on the
+node.
+
+The memory of a tool is estimated from the number of sequences and the length
+of the longest one, with a fixed part and a part per 1000 residues. These
+estimates are rough, and on the high side."""
+
+#   Import standard library modules here
+import os
+import socket
+import time
+import fcntl
+import uuid
+import contextlib
+
+#   Import our helper scripts here
+from lrt_predict.General import set_verbosity
+
+#   Memory estimates in MB, as a fixed part and a part per 1000 residues of
+#   input, which is the number of sequences times the longest length. The
+#   PASTA estimate is the Java heap; its tree estimate and subset alignments
+#   grow with the size of the alignment.
+MEMORY_MODEL = {
+    'pasta': (2048, 20),
+    'clustalo': (256, 2),
+    'mafft': (256, 4),
+    'fasttree': (128, 1),
+    'hyphy': (512, 30)}
+#   Memory for everything besides the tool, like Python itself, in MB
+OVERHEAD_MB = 256
+
+
+def estimate_mb(tool, nseqs, max_length):
+    """Estimate the memory that a tool needs for nseqs sequences of up to
+    max_length residues, in MB."""
+    fixed, per_k = MEMORY_MODEL[tool]
+    return int(fixed + per_k * nseqs * max_length / 1000.0)
+
+
+def node_memory_mb():
+    """Return the physical memory of the node, in MB, or None if it cannot
+    be found."""
+    try:
+        pages = os.sysconf('SC_PHYS_PAGES')
+        page_size = os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+    return int(pages * page_size / (1024 * 1024))
+
+
+def pid_alive(pid):
+    """Return True if a process with this PID is running on this node."""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        #   EPERM means that it is running, as another user
+        return e.errno == 1
+    return True
+
+
+class MemoryLedger(object):
+    """A class to admit tools to run within the memory budget of a node.
+
+    Contains the following class attributes:
+        POLL (float)          Seconds to wait between checks of the ledger
+
+    Contains the following instance attributes:
+        ledger (str)          Path to the ledger file of this node
+        budget_mb (int)       Memory budget of the node, in MB
+        mainlog (logger)      Logging messages formatter and handler
+
+    Contains the following methods:
+        admit(need_mb, label):
+            A context manager that waits until need_mb fits in the budget,
+            records it in the ledger, and removes it again at the end.
+
+    Each line of the ledger holds the PID, a token, and the memory in MB of
+    one admitted tool. Lines of processes that are no longer running are
+    dropped, so a job that is killed does not hold its memory forever. A tool
+    that needs more than the whole budget is admitted when nothing else is
+    running, rather than never.
+    """
+
+    POLL = 5.0
+
+    def __init__(self, ledger_dir, budget_mb, verbose):
+        self.mainlog = set_verbosity.verbosity('Memory_Ledger', verbose)
+        #   PIDs only mean something on one node, so each node has its own
+        #   ledger, even if the directory is shared
+        self.ledger = os.path.join(
+            os.path.abspath(os.path.expandvars(ledger_dir)),
+            'BAD_Mutations_' + socket.gethostname() + '.memory')
+        self.budget_mb = int(budget_mb)
+        self.mainlog.debug(
+            'Memory budget of ' + str(self.budget_mb) + ' MB in ' +
+            self.ledger)
+        return
+
+    def read(self, handle):
+        """Read the entries of the ledger from an open handle, dropping those
+        of processes that have exited. Returns a list of (pid, token, MB)
+        tuples."""
+        handle.seek(0)
+        entries = []
+        for line in handle:
+            tmp = line.split()
+            if len(tmp) != 3:
+                continue
+            try:
+                entry = (int(tmp[0]), tmp[1], int(tmp[2]))
+            except ValueError:
+                continue
+            if pid_alive(entry[0]):
+                entries.append(entry)
+        return entries
+
+    @staticmethod
+    def write(handle, entries):
+        """Replace the contents of the ledger with a list of entries."""
+        handle.seek(0)
+        handle.truncate()
+        for entry in entries:
+            handle.write('\t'.join(str(e) for e in entry) + '\n')
+        handle.flush()
+        return
+
+    def try_admit(self, token, need_mb):
+        """Record a tool in the ledger if it fits in the budget. Returns a
+        tuple of whether it was admitted, and the memory in use."""
+        with open(self.ledger, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                entries = self.read(handle)
+                used = sum(entry[2] for entry in entries)
+                if entries and used + need_mb > self.budget_mb:
+                    #   Write back the ledger without the exited processes
+                    self.write(handle, entries)
+                    return (False, used)
+                entries.append((os.getpid(), token, need_mb))
+                self.write(handle, entries)
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return (True, used)
+
+    def release(self, token):
+        """Remove a tool from the ledger."""
+        with open(self.ledger, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                entries = [
+                    entry
+                    for entry
+                    in self.read(handle)
+                    if entry[1] != token]
+                self.write(handle, entries)
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return
+
+    @contextlib.contextmanager
+    def admit(self, need_mb, label):
+        """Wait until need_mb MB fits in the budget of the node, and hold it
+        until the end of the with block."""
+        token = uuid.uuid4().hex[:12]
+        start = time.time()
+        waiting = False
+        while True:
+            admitted, used = self.try_admit(token, need_mb)
+            if admitted:
+                break
+            if not waiting:
+                self.mainlog.info(
+                    'Waiting to run ' + label + ', which needs about ' +
+                    str(need_mb) + ' MB. ' + str(used) + ' of ' +
+                    str(self.budget_mb) + ' MB are in use on this node.')
+                waiting = True
+            time.sleep(self.POLL)
+        if waiting:
+            self.mainlog.info(
+                'Admitted ' + label + ' after ' +
+                '%.0f' % (time.time() - start) + ' seconds.')
+        try:
+            yield
+        finally:
+            self.release(token)
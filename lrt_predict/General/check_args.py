@@ -33,3 +33,30 @@ def valid_email(email):
         return True
     else:
         return False
+
+
+#   Is a count, like the number of CPUs, a positive integer? None means it was
+#   not given.
+def valid_count(count):
+    if count is None:
+        return True
+    try:
+        return int(count) >= 1
+    except ValueError:
+        return False
+
+
+#   Is a switch turned on? Switches from the config file are strings, like
+#   'yes' or 'true', and switches from the command line are True or False.
+def is_true(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+#   Is an amount of memory, like 4g or 512m, valid? A number without a unit is
+#   in megabytes. None means it was not given.
+def valid_memory(memory):
+    if memory is None:
+        return True
+    return re.match(r'^[0-9]+[kmgKMG]?$', str(memory).strip()) is not None
@@ -2,6 +2,9 @@
 
 #   A script to check for the presence of all the required modules
 
+#   Import standard library modules here
+import os
+
 #   Gain access to the spawn.find_executable(), which works a lot like `which`
 from distutils import spawn
 
@@ -53,3 +56,17 @@ def missing_executables(exelist):
         else:
             missing_programs.append(e)
     return missing_programs
+
+
+def tool_identity(path):
+    """Return a string that changes when a program is replaced, like by
+    installing another version: its real path, size, and modification time.
+    This is much faster than running the program to ask for its version."""
+    if not path:
+        return ''
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return path + '\t' + str(stat.st_size) + '\t' + str(int(stat.st_mtime))
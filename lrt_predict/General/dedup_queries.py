@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Functions to find redundant work in a batch of queries. Transcripts with
+the same CDS get the same homologues and the same alignment, so only one of
+them is searched and aligned, and the alignment and tree are copied to the
+others with the query renamed. Optionally, the isoforms of a gene model share
+the homologues of the longest isoform, and are only aligned separately."""
+
+#   Import standard library modules here
+import re
+import hashlib
+
+#   Import Biopython modules here for sequence handling
+from Bio import SeqIO
+
+#   Suffixes that mark the isoforms of a gene model, like
+#   Sobic.001G000100.1 and GRMZM2G000001_T01
+ISOFORM_SUFFIX = r'(\.[0-9]+|_T[0-9]+)$'
+
+
+def cds_hash(seq):
+    """Return a hash of a CDS, ignoring case."""
+    return hashlib.sha1(str(seq).upper().encode('utf-8')).hexdigest()
+
+
+def gene_model(name):
+    """Return the name of the gene model of a transcript."""
+    return re.sub(ISOFORM_SUFFIX, '', name)
+
+
+def hyphy_name(name):
+    """Return a sequence name the way it is written into the alignment and
+    the tree, which only have alphanumerics and underscores."""
+    return re.sub('[^0-9a-zA-Z]', '_', name)
+
+
+def read_queries(queries):
+    """Read the query FASTA files. Returns a dictionary of (name, sequence)
+    tuples keyed on file name."""
+    records = {}
+    for query in queries:
+        rec = SeqIO.read(query, 'fasta')
+        records[query] = (rec.name, str(rec.seq))
+    return records
+
+
+def group_by_cds(queries, records):
+    """Group queries that have the same CDS. Returns a list of unique queries,
+    in the order given, and a dictionary of the other queries with the same
+    CDS, keyed on the unique query."""
+    first = {}
+    unique = []
+    copies = {}
+    for query in queries:
+        key = cds_hash(records[query][1])
+        if key in first:
+            copies[first[key]].append(query)
+        else:
+            first[key] = query
+            unique.append(query)
+            copies[query] = []
+    return (unique, copies)
+
+
+def group_by_gene(queries, records):
+    """Pick the query whose homologues each query will use. This is the
+    longest isoform of its gene model, or the first one of the longest.
+    Returns a dictionary keyed on query."""
+    longest = {}
+    for query in queries:
+        gene = gene_model(records[query][0])
+        if gene not in longest or \
+                len(records[query][1]) > len(records[longest[gene]][1]):
+            longest[gene] = query
+    return dict(
+        (query, longest[gene_model(records[query][0])])
+        for query
+        in queries)
+
+
+def rename_outputs(msa, tree, old, new, out_msa, out_tree):
+    """Copy an alignment and a tree, renaming the query sequence in both.
+    Returns False if the query is not found in both, in which case nothing
+    is written."""
+    old = hyphy_name(old)
+    new = hyphy_name(new)
+    with open(msa, 'r') as f:
+        msa_text = f.read()
+    with open(tree, 'r') as f:
+        tree_text = f.read()
+    #   The query is a whole header line of the alignment, and a whole label
+    #   of the tree
+    msa_text, n_msa = re.subn(
+        '^>' + re.escape(old) + '$',
+        '>' + new,
+        msa_text,
+        flags=re.M)
+    tree_text, n_tree = re.subn(
+        '(?<=[(,])' + re.escape(old) + '(?=[:,);])',
+        new,
+        tree_text)
+    if n_msa != 1 or n_tree != 1:
+        return False
+    with open(out_msa, 'w') as f:
+        f.write(msa_text)
+    with open(out_tree, 'w') as f:
+        f.write(tree_text)
+    return True
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""A persistent, content-addressed cache on disk. Entries are files named by
+the SHA1 of their key, so that many jobs can share one cache directory. Writes
+are atomic, and the total size of the cache is bounded by evicting the least
+recently used entries."""
+
+#   Import standard library modules here
+import os
+import hashlib
+import tempfile
+import fcntl
+
+#   Import our helper scripts here
+from lrt_predict.General import set_verbosity
+
+
+class DiskCache(object):
+    """A class to store and retrieve cached results on disk.
+
+    Contains the following class attributes:
+        LOCK_NAME (str)       Name of the lock file in the cache directory
+        SIZE_NAME (str)       Name of the file holding the cache size
+        LOW_WATER (float)     Fraction of max_bytes to evict down to, so that
+                              we do not scan the cache on every write
+
+    Contains the following instance attributes:
+        cache_dir (str)       Directory that holds the cache
+        max_bytes (int)       Maximum size of the cache, in bytes
+        mainlog (logger)      Logging messages formatter and handler
+
+    Contains the following methods:
+        make_key(*parts):
+            Build a key out of any number of strings.
+
+        get(key):
+            Return the cached data for a key, or None if it is not cached.
+            Marks the entry as recently used.
+
+        put(key, data):
+            Store data for a key. The file is written under a temporary name
+            and renamed into place, so readers never see a partial entry.
+
+        evict():
+            Remove the least recently used entries until the cache is smaller
+            than its low-water mark.
+
+    Concurrent jobs are kept from clobbering each other with a lock file in
+    the cache directory. This needs a filesystem that supports flock().
+    """
+
+    LOCK_NAME = '.lock'
+    SIZE_NAME = '.size'
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir, max_mb, verbose):
+        self.mainlog = set_verbosity.verbosity('Disk_Cache', verbose)
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                #   Another job may have made it at the same time
+                if not os.path.isdir(self.cache_dir):
+                    raise
+        self.mainlog.debug(
+            'Using cache in ' + self.cache_dir + ' with a limit of ' +
+            str(self.max_bytes) + ' bytes.')
+        return
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a key by hashing the parts together."""
+        sha = hashlib.sha1()
+        for part in parts:
+            sha.update(str(part).encode('utf-8'))
+            #   Separate the parts so that ('ab', 'c') and ('a', 'bc') differ
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def entry_path(self, key):
+        """Return the path to the file for a key. Entries are spread across
+        subdirectories named by the first two characters of the key."""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """Return the data stored for a key, or None if there is none."""
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as handle:
+                data = handle.read()
+        except (IOError, OSError):
+            return None
+        #   Touch the entry, so that it counts as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.mainlog.debug('Cache hit for ' + key)
+        return data
+
+    def put(self, key, data):
+        """Store data for a key."""
+        path = self.entry_path(key)
+        subdir = os.path.dirname(path)
+        if not os.path.isdir(subdir):
+            try:
+                os.makedirs(subdir)
+            except OSError:
+                if not os.path.isdir(subdir):
+                    raise
+        #   Write under a temporary name in the same directory, then rename it.
+        #   rename() is atomic on POSIX filesystems.
+        handle = tempfile.NamedTemporaryFile(
+            mode='wb',
+            dir=subdir,
+            prefix='.tmp_',
+            delete=False)
+        try:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        finally:
+            handle.close()
+        #   The size of the entry that is replaced is read under the lock, so
+        #   that two jobs writing the same key do not both subtract it
+        with open(os.path.join(self.cache_dir, self.LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    old_size = os.path.getsize(path)
+                except OSError:
+                    old_size = 0
+                os.rename(handle.name, path)
+                self.add_size(len(data) - old_size)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.mainlog.debug('Cached ' + str(len(data)) + ' bytes for ' + key)
+        return
+
+    def add_size(self, nbytes):
+        """Add to the running total of the cache size, and evict entries if it
+        has grown past the limit. Must be called with the lock held."""
+        size_file = os.path.join(self.cache_dir, self.SIZE_NAME)
+        try:
+            with open(size_file, 'r') as handle:
+                total = int(handle.read().strip() or 0) + nbytes
+        except (IOError, OSError, ValueError):
+            #   The new entry is already in place, so it is counted here
+            total = self.disk_usage()
+        if total > self.max_bytes:
+            total = self.evict()
+        with open(size_file, 'w') as handle:
+            handle.write(str(total))
+        return
+
+    def entries(self):
+        """Return a list of (mtime, size, path) tuples for every entry."""
+        found = []
+        for subdir in os.listdir(self.cache_dir):
+            subpath = os.path.join(self.cache_dir, subdir)
+            if not os.path.isdir(subpath):
+                continue
+            for fname in os.listdir(subpath):
+                #   Skip files that are still being written
+                if fname.startswith('.tmp_'):
+                    continue
+                path = os.path.join(subpath, fname)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def disk_usage(self):
+        """Return the total size of all entries, in bytes."""
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is under its
+        low-water mark. Must be called with the lock held. Returns the new size
+        of the cache."""
+        found = sorted(self.entries())
+        total = sum(size for mtime, size, path in found)
+        target = self.max_bytes * self.LOW_WATER
+        nremoved = 0
+        for mtime, size, path in found:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            nremoved += 1
+        self.mainlog.info(
+            'Evicted ' + str(nremoved) + ' entries from the cache in ' +
+            self.cache_dir + '.')
+        return total
@@ -20,11 +20,132 @@ import lrt_predict.Fetch.phytozome_species as phytozome_species
 SPECIES_LIST = ensembl_species.ensembl_fetch + phytozome_species.phyto_fetch
 
 
+#   The options of the homology search are shared by 'align' and
+#   'orthologues', so that a table of orthologues is built with the same search
+#   that 'align' would run.
+def add_search_args(sub_args):
+    """Add the options that control the homology search to a subcommand."""
+    sub_args.add_argument(
+        '--blast-format',
+        required=False,
+        choices=['tabular', 'xml'],
+        default=None,
+        help=(
+            'Format of the BLAST reports. XML is slower to parse, but gives '
+            'more detail for debugging. Defaults to tabular.'
+            ))
+    sub_args.add_argument(
+        '--search-program',
+        required=False,
+        choices=['tblastx', 'blastp', 'tblastn'],
+        default=None,
+        help=(
+            'Program to search for homologues with. blastp and tblastn '
+            'translate the query, and are much faster than tblastx. blastp '
+            'needs the protein databases made by the fetch subcommand. '
+            'Defaults to tblastx.'
+            ))
+    sub_args.add_argument(
+        '--merged-db',
+        required=False,
+        action='store_true',
+        default=False,
+        help=(
+            'Search the merged database of all species once, rather than '
+            'each species database. Make it with fetch --merged-db.'
+            ))
+    sub_args.add_argument(
+        '--prefilter',
+        required=False,
+        type=int,
+        default=None,
+        help=(
+            'Only search the N records of each species database that share '
+            'the most k-mers with the query. Off by default.'
+            ))
+    sub_args.add_argument(
+        '--cache-dir',
+        required=False,
+        default=None,
+        help=(
+            'Directory to cache BLAST best hits and alignments in. Repeated '
+            'searches with the same query and databases, and repeated '
+            'alignments of the same homologues, are read from the cache.'
+            ))
+    sub_args.add_argument(
+        '--stage-dir',
+        required=False,
+        default=None,
+        help=(
+            'Node-local scratch directory to copy the databases to before '
+            'searching them, for cluster jobs.'
+            ))
+    return
+
+
+#   The resources of a job are shared by every subcommand that runs external
+#   tools.
+def add_resource_args(sub_args):
+    """Add the options that set the CPUs and memory of a job."""
+    sub_args.add_argument(
+        '--num-cpus',
+        '-n',
+        required=False,
+        type=int,
+        default=None,
+        help=(
+            'Number of CPUs to use. They are split between running searches '
+            'in parallel and the threads of each tool. Defaults to 1.'
+            ))
+    sub_args.add_argument(
+        '--tool-threads',
+        required=False,
+        type=int,
+        default=None,
+        help=(
+            'Number of threads for each run of an external tool. Defaults to '
+            'giving the CPUs to parallel runs first.'
+            ))
+    sub_args.add_argument(
+        '--memory',
+        required=False,
+        default=None,
+        help=(
+            'Memory for the job, like 4g or 512m. Used for the Java heap of '
+            'PASTA. Defaults to an estimate from the size of the alignment.'
+            ))
+    return
+
+
+#   The scratch directory options are shared by the subcommands that run
+#   BLAST, the aligners, and HyPhy.
+def add_scratch_args(sub_args):
+    """Add the options that control the scratch directory of a run."""
+    sub_args.add_argument(
+        '--scratch-dir',
+        required=False,
+        default=None,
+        help=(
+            'Directory to make the scratch directory of the run in, like a '
+            'tmpfs or a node-local disk. Defaults to the system temporary '
+            'directory.'
+            ))
+    sub_args.add_argument(
+        '--keep-scratch',
+        required=False,
+        action='store_true',
+        default=False,
+        help='Do not remove the scratch directory at the end, for debugging.')
+    return
+
+
 #   A function to actually parse the arguments
 def parse_args():
     """Parse the arguments. We set up three subcommands here:
         setup:   Generate config file and download dependencies
         fetch:   Download CDS files from Phytozome and Ensembl
+        align:   Search for homologues, align them, and estimate a tree
+        orthologues: Store the best hits of every target species CDS
         predict: Align homologous sequences and predict deleterious subs
 
     See the manual or help message for detailed descriptions of all the
@@ -129,6 +250,15 @@ def parse_args():
         action='store_true',
         default=False,
         help='Do not fetch new CDS from databases, just convert to BLAST db.')
+    fetch_args.add_argument(
+        '--merged-db',
+        required=False,
+        action='store_true',
+        default=False,
+        help=(
+            'After converting, also combine all species into one merged '
+            'BLAST database, for align --merged-db.'
+            ))
 
     #   Create a parser for 'align'
     align_args = subparser.add_parser(
@@ -150,12 +280,61 @@ def parse_args():
         required=False,
         type=float,
         help='E-value threshold for accepting sequences into the alignment.')
-    align_args.add_argument(
+    #   Either a single query, or a list of queries to search as a batch
+    queries = align_args.add_mutually_exclusive_group(required=True)
+    queries.add_argument(
         '--fasta',
         '-f',
-        required=True,
         default=None,
         help='Path to the input FASTA file.')
+    queries.add_argument(
+        '--fasta-list',
+        '-l',
+        default=None,
+        help=(
+            'Path to a file listing input FASTA files, one per line. All of '
+            'the queries are searched against each database in a single '
+            'BLAST run.'
+            ))
+    add_search_args(align_args)
+    add_resource_args(align_args)
+    add_scratch_args(align_args)
+    align_args.add_argument(
+        '--orthologue-table',
+        '-T',
+        required=False,
+        default=None,
+        help=(
+            'Look the best hits up in this table, made by the orthologues '
+            'subcommand, before searching.'
+            ))
+    align_args.add_argument(
+        '--group-isoforms',
+        required=False,
+        action='store_true',
+        default=False,
+        help=(
+            'With --fasta-list, search only the longest isoform of each gene '
+            'model, and align the other isoforms with its homologues.'
+            ))
+    align_args.add_argument(
+        '--species-tree',
+        required=False,
+        default=None,
+        help=(
+            'Newick tree of the species. It is pruned to the species in each '
+            'alignment and used as the tree, instead of estimating one.'
+            ))
+    align_args.add_argument(
+        '--aligner',
+        required=False,
+        choices=['auto', 'pasta', 'clustalo', 'mafft'],
+        default=None,
+        help=(
+            'Program to align the homologues with. auto uses MAFFT, or '
+            'Clustal-omega if MAFFT is not installed, for small alignments, '
+            'and PASTA for the others. Defaults to auto.'
+            ))
     align_args.add_argument(
         '--output',
         '-o',
@@ -163,6 +342,48 @@ def parse_args():
         default=os.getcwd(),
         help='Output directory.')
 
+    #   Create a parser for 'orthologues'
+    orth_args = subparser.add_parser(
+        'orthologues',
+        help=(
+            'Find the best hits of every CDS of the target species once, and '
+            'store them in a table for align.'
+            ))
+    orth_args.add_argument(
+        '--base',
+        '-b',
+        required=False,
+        help='Base directory for species databses.')
+    orth_args.add_argument(
+        '--config',
+        '-c',
+        required=False,
+        help='Use this configuration file.')
+    orth_args.add_argument(
+        '--evalue',
+        '-e',
+        required=False,
+        type=float,
+        help='E-value threshold for accepting sequences into the alignment.')
+    orth_args.add_argument(
+        '--fasta',
+        '-f',
+        required=True,
+        default=None,
+        help='Path to a FASTA file with all of the CDS of the target species.')
+    orth_args.add_argument(
+        '--orthologue-table',
+        '-T',
+        required=False,
+        default=None,
+        help=(
+            'Path to the table to store the best hits in. It is created if it '
+            'does not exist, and queries that are already in it are skipped.'
+            ))
+    add_search_args(orth_args)
+    add_resource_args(orth_args)
+    add_scratch_args(orth_args)
+
     #   Create a parser for 'predict'
     predict_args = subparser.add_parser(
         'predict',
@@ -197,6 +418,28 @@ def parse_args():
         required=True,
         default=None,
         help='Path to the input substitutions file.')
+    predict_args.add_argument(
+        '--cache-dir',
+        required=False,
+        default=None,
+        help=(
+            'Directory to cache the background fits of HyPhy in. Repeated '
+            'predictions on the same alignment and tree load the fit from the '
+            'cache instead of fitting it again.'
+            ))
+    predict_args.add_argument(
+        '--site-shards',
+        required=False,
+        type=int,
+        default=None,
+        help=(
+            'Split the positions between this many HyPhy runs, which start '
+            'from one fit of the background model and run in parallel on the '
+            'CPUs of the job. Their reports are merged into one. Defaults to '
+            '1.'
+            ))
+    add_resource_args(predict_args)
+    add_scratch_args(predict_args)
     predict_args.add_argument(
         '--output',
         '-o',
@@ -332,6 +575,72 @@ def validate_args(args, log):
             return (
                 False,
                 'Output directory is not readable/writable, or does not exist.')
+        if args['fasta_list']:
+            if not file_funcs.file_exists(args['fasta_list'], log):
+                return (
+                    False,
+                    'The specified list of FASTA files does not exist!')
+            for fasta in parse_input.fasta_list(args['fasta_list']):
+                if not parse_input.valid_fasta(fasta, log):
+                    return (
+                        False,
+                        'The FASTA file ' + fasta + ' in the list is not '
+                        'valid.')
+        valid, msg = validate_search_args(args)
+        if not valid:
+            return (False, msg)
+        valid, msg = validate_resource_args(args)
+        if not valid:
+            return (False, msg)
+        if args.get('orthologue_table') and not file_funcs.file_exists(
+                args['orthologue_table'], log):
+            return (
+                False,
+                'The specified orthologue table does not exist!')
+        if args.get('aligner') not in (
+                None, 'auto', 'pasta', 'clustalo', 'mafft'):
+            return (
+                False,
+                'The aligner must be auto, pasta, clustalo, or mafft.')
+        if args.get('species_tree') and not parse_input.valid_tree(
+                args['species_tree'], log):
+            return (
+                False,
+                'The species tree is not a valid Newick tree.')
+        valid, msg = validate_scratch_args(args)
+        if not valid:
+            return (False, msg)
+    #   Check the arguments passed to orthologues
+    elif args['action'] == 'orthologues':
+        if args['config']:
+            if not file_funcs.file_exists(args['config'], log):
+                return (
+                    False,
+                    'The specified configuration file does not exist!')
+        if not file_funcs.file_exists(args['fasta'], log):
+            return (
+                False,
+                'The specified FASTA file does not exist!')
+        if not args.get('orthologue_table'):
+            return (
+                False,
+                'A path to the orthologue table must be given, with -T or '
+                'ORTHOLOGUE_TABLE in the configuration file.')
+        table_dir = os.path.dirname(os.path.abspath(args['orthologue_table']))
+        if not check_args.valid_dir(table_dir):
+            return (
+                False,
+                'The directory for the orthologue table is not '
+                'readable/writable, or does not exist.')
+        valid, msg = validate_search_args(args)
+        if not valid:
+            return (False, msg)
+        valid, msg = validate_resource_args(args)
+        if not valid:
+            return (False, msg)
+        valid, msg = validate_scratch_args(args)
+        if not valid:
+            return (False, msg)
     #   Check arguments to predict
     elif args['action'] == 'predict':
         #   If config is suppled:
@@ -356,9 +665,83 @@ def validate_args(args, log):
             return (
                 False,
                 'The input substitutions file provided is not valid.')
+        if args['cache_dir'] and not check_args.valid_dir(args['cache_dir']):
+            return (
+                False,
+                'Cache directory is not readable/writable, or does not exist.')
+        if not check_args.valid_count(args.get('site_shards')):
+            return (
+                False,
+                'The number of site shards must be a positive integer.')
+        valid, msg = validate_resource_args(args)
+        if not valid:
+            return (False, msg)
+        valid, msg = validate_scratch_args(args)
+        if not valid:
+            return (False, msg)
     return (args, None)
 
 
+#   Validate the options added by add_search_args()
+def validate_search_args(args):
+    """Check the options of the homology search. Returns a tuple of whether
+    they are valid, and a message if they are not."""
+    if args['blast_format'] not in (None, 'tabular', 'xml'):
+        return (
+            False,
+            'The BLAST format must be either tabular or xml.')
+    if args.get('search_program') not in (
+            None, 'tblastx', 'blastp', 'tblastn'):
+        return (
+            False,
+            'The search program must be tblastx, blastp, or tblastn.')
+    if not check_args.valid_count(args.get('prefilter')):
+        return (
+            False,
+            'The number of prefilter candidates must be a positive integer.')
+    if args['cache_dir'] and not check_args.valid_dir(args['cache_dir']):
+        return (
+            False,
+            'Cache directory is not readable/writable, or does not exist.')
+    if args.get('stage_dir') and not check_args.valid_dir(
+            os.path.expandvars(args['stage_dir'])):
+        return (
+            False,
+            'Stage directory is not readable/writable, or does not exist.')
+    return (True, None)
+
+
+#   Validate the options added by add_resource_args()
+def validate_resource_args(args):
+    """Check the CPU and memory options. Returns a tuple of whether they are
+    valid, and a message if they are not."""
+    if not check_args.valid_count(args.get('num_cpus')):
+        return (
+            False,
+            'The number of CPUs must be a positive integer.')
+    if not check_args.valid_count(args.get('tool_threads')):
+        return (
+            False,
+            'The number of tool threads must be a positive integer.')
+    if not check_args.valid_memory(args.get('memory')):
+        return (
+            False,
+            'The memory must be a number with an optional unit, like 4g.')
+    return (True, None)
+
+
+#   Validate the options added by add_scratch_args()
+def validate_scratch_args(args):
+    """Check the scratch directory options. Returns a tuple of whether they
+    are valid, and a message if they are not."""
+    if args.get('scratch_dir') and not check_args.valid_dir(
+            os.path.expandvars(args['scratch_dir'])):
+        return (
+            False,
+            'Scratch directory is not readable/writable, or does not exist.')
+    return (True, None)
+
+
 #   This is just a simple function that shows when the user does not supply
 #   any arguments. This is an issue with Python 2.*, and has been "fixed" in
 #   Python 3+.
@@ -366,12 +749,13 @@ def usage():
     """Print a usage message."""
     print("""Usage: BAD_Mutations.py <subcommand> <arguments>
 
-where <subcommand> is one of 'setup', 'fetch', 'align', 'predict', or
-'compile.' This package will download the necessary data to perform the
-likelihood ratio test (LRT) for deleterious SNP prediction as described in Chun
-and Fay (2009) in Genome Research. Because of the data sources used, this
-implementation is specific to SNP annotation in plants. If you use this package
-to predict deleterious SNPs, please cite https://doi.org/10.1534/g3.118.200563.
+where <subcommand> is one of 'setup', 'fetch', 'align', 'orthologues',
+'predict', or 'compile.' This package will download the necessary data to
+perform the likelihood ratio test (LRT) for deleterious SNP prediction as
+described in Chun and Fay (2009) in Genome Research. Because of the data
+sources used, this implementation is specific to SNP annotation in plants. If
+you use this package to predict deleterious SNPs, please cite
+https://doi.org/10.1534/g3.118.200563.
 
 The 'setup' subcommand will create a configuration file that contains paths to
 requried executables and parameters for alignment. This is optional, but
@@ -387,6 +771,10 @@ The 'align' subcommand will run TBLASTX against all of the available BLAST
 databases, collect orthologues that pass the E-value threshold, align them with
 PASTA, and produce a phylogenetic tree.
 
+The 'orthologues' subcommand will find the best hits of every CDS of the target
+species once, and store them in a table. 'align' can then look the orthologues
+up in the table instead of searching.
+
 The 'predict' subcommand will run the LRT with a given query sequence and a
 list of affected codons.
 
@@ -77,6 +77,13 @@ def valid_fasta(f, log):
         return True
 
 
+def fasta_list(f):
+    """Read a list of FASTA files, one per line. Blank lines are skipped.
+    Returns a list of paths."""
+    with open(f, 'r') as listfile:
+        return [line.strip() for line in listfile if line.strip()]
+
+
 def parse_subs(f, log):
     """Parse the input substitutions file. Returns a list of integers."""
     #   Does the file exist?
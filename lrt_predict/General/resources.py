@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Functions to split the CPUs and memory of a job between the external tools
+that BAD_Mutations runs. The total number of CPUs (NUM_CPUS) is split between
+running several tools at once, like one BLAST search per species database,
+and the threads of each tool (TOOL_THREADS). The memory of the job (MEMORY)
+is given to the tools that need to be told about it, like the Java heap of
+PASTA."""
+
+#   Import standard library modules here
+import os
+
+#   Java heap for PASTA if no memory is given. This is what Pasta_Align.sh
+#   always used.
+DEFAULT_MEMORY = '4g'
+
+
+def split_cores(ncpu, ntasks, tool_threads=None):
+    """Split ncpu CPUs between ntasks independent tool runs. Returns a tuple
+    of the number of runs to do at once, and the number of threads for each
+    run. If tool_threads is given, every run gets that many threads, and as
+    many runs as fit are done at once. Otherwise, we run as many at once as
+    there are CPUs, since that scales better than the threads of one tool, and
+    give any leftover CPUs to the threads."""
+    ncpu = max(1, int(ncpu)) if ncpu else 1
+    ntasks = max(1, ntasks)
+    if tool_threads:
+        threads = max(1, int(tool_threads))
+        workers = max(1, min(ntasks, ncpu // threads))
+        return (workers, threads)
+    workers = min(ncpu, ntasks)
+    return (workers, max(1, ncpu // workers))
+
+
+def tool_threads(arg):
+    """Return the number of threads for a tool that runs on its own, like the
+    alignment or the HyPhy fit."""
+    return split_cores(arg.get('num_cpus'), 1, arg.get('tool_threads'))[1]
+
+
+def java_memory(memory):
+    """Return an amount of memory in the form that the Java -Xmx option
+    takes, like 4g. Numbers without a unit are in megabytes."""
+    if not memory:
+        return DEFAULT_MEMORY
+    memory = str(memory).strip().lower()
+    if memory[-1].isdigit():
+        memory += 'm'
+    return memory
+
+
+def memory_mb(memory):
+    """Return an amount of memory like 4g or 512m in MB. Numbers without a
+    unit are in megabytes."""
+    memory = java_memory(memory)
+    scale = {'k': 1.0 / 1024, 'm': 1, 'g': 1024}[memory[-1]]
+    return int(float(memory[:-1]) * scale)
+
+
+def tool_env(threads):
+    """Return the environment to run a tool with. Tools built with OpenMP,
+    like FastTreeMP, read the number of threads from OMP_NUM_THREADS."""
+    env = dict(os.environ)
+    env['OMP_NUM_THREADS'] = str(threads)
+    return env
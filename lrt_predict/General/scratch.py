@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""A scratch directory for one run of BAD_Mutations. Every temporary file of
+the run, and of the programs that it runs, goes into a new directory that no
+other job uses, and the directory is removed when the run ends, whether it
+succeeds or fails."""
+
+#   Import standard library modules here
+import os
+import shutil
+import tempfile
+import threading
+
+#   Import our helper scripts here
+from lrt_predict.General import set_verbosity
+
+
+class ScratchDir(object):
+    """A context manager for the scratch directory of a run.
+
+    Contains the following class attributes:
+        PREFIX (str)          Prefix of the names of scratch directories
+        INTERVAL (float)      Seconds between measurements of the size of the
+                              directory
+
+    Contains the following instance attributes:
+        root (str)            Directory to make the scratch directory in, or
+                              None for the system temporary directory
+        keep (bool)           Keep the scratch directory at the end, for
+                              debugging
+        path (str)            Path to the scratch directory, while it is open
+        peak_bytes (int)      Largest size of the directory that was seen
+        mainlog (logger)      Logging messages formatter and handler
+
+    Contains the following methods:
+        usage():
+            Return the size of the files in the scratch directory, in bytes.
+
+        sample():
+            Measure the size of the directory, and update peak_bytes.
+
+    While the directory is open, it is the default directory of the tempfile
+    module, and TMPDIR points to it for the programs that we run. The size of
+    the directory is measured every INTERVAL seconds in a background thread,
+    and the peak is reported when the directory is closed.
+    """
+
+    PREFIX = 'BAD_Mutations_'
+    INTERVAL = 1.0
+
+    def __init__(self, root, keep, verbose):
+        self.mainlog = set_verbosity.verbosity('Scratch_Dir', verbose)
+        if root:
+            root = os.path.abspath(
+                os.path.expandvars(os.path.expanduser(root)))
+        self.root = root
+        self.keep = keep
+        self.path = None
+        self.peak_bytes = 0
+        self.old_tempdir = None
+        self.old_env = None
+        self.done = None
+        self.watcher = None
+        return
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(prefix=self.PREFIX, dir=self.root)
+        self.mainlog.debug('Using scratch directory ' + self.path)
+        #   Send temporary files of this process and of the programs that it
+        #   runs into the scratch directory
+        self.old_tempdir = tempfile.tempdir
+        self.old_env = os.environ.get('TMPDIR')
+        tempfile.tempdir = self.path
+        os.environ['TMPDIR'] = self.path
+        self.done = threading.Event()
+        self.watcher = threading.Thread(target=self.watch)
+        self.watcher.daemon = True
+        self.watcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.done.set()
+        self.watcher.join()
+        self.sample()
+        tempfile.tempdir = self.old_tempdir
+        if self.old_env is None:
+            os.environ.pop('TMPDIR', None)
+        else:
+            os.environ['TMPDIR'] = self.old_env
+        self.mainlog.info(
+            'Peak scratch space used: ' + str(self.peak_bytes) + ' bytes.')
+        if self.keep:
+            self.mainlog.info('Keeping scratch directory ' + self.path)
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.mainlog.debug('Removed scratch directory ' + self.path)
+        #   Do not swallow the exception, if there was one
+        return False
+
+    def usage(self):
+        """Return the total size of the files in the scratch directory. Files
+        that are removed while we count them are skipped."""
+        total = 0
+        for root, dirs, files in os.walk(self.path):
+            for fname in files:
+                try:
+                    total += os.lstat(os.path.join(root, fname)).st_size
+                except OSError:
+                    continue
+        return total
+
+    def sample(self):
+        """Measure the scratch directory, and keep the largest size seen."""
+        self.peak_bytes = max(self.peak_bytes, self.usage())
+        return
+
+    def watch(self):
+        """Measure the scratch directory every INTERVAL seconds, until it is
+        closed."""
+        while not self.done.wait(self.INTERVAL):
+            self.sample()
+        return
@@ -8,18 +8,148 @@ import subprocess
 import os
 import time
 import re
-
-#   Import Biopython modules here for sequence handling
-from Bio import SeqIO
-from Bio import SeqRecord
-from Bio.Seq import Seq
+import json
+import io
 
 #   Import our helper scripts here
 from lrt_predict.General import set_verbosity
 from lrt_predict.General import check_modules
+from lrt_predict.General import resources
+from lrt_predict.Predict import codons
+from lrt_predict.Predict import sanitize
+from lrt_predict.Predict import species_tree
+
+#   Import Biopython modules here for tree handling
+from Bio.Phylo.NewickIO import NewickError
+
+#   Aligners that can be asked for. 'auto' picks one from the size of the
+#   alignment with choose_aligner().
+ALIGNERS = ['auto', 'pasta', 'clustalo', 'mafft']
+#   Alignments with at most this many sequences, none of them longer than
+#   PROGRESSIVE_MAX_LENGTH residues, are small enough that a progressive
+#   aligner is much faster than PASTA and just as accurate. PASTA starts a JVM
+#   and runs several rounds of tree estimation for every alignment. PASTA is
+#   built for alignments that are too large for the accurate modes of MAFFT,
+#   and MAFFT --auto only uses L-INS-i for up to a few hundred sequences of a
+#   few thousand residues, so these cutoffs are well inside the range where
+#   MAFFT is accurate. They were not measured on BAD_Mutations data; check
+#   them with Supporting/Benchmark_Aligners.py.
+PROGRESSIVE_MAX_SEQS = 20
+PROGRESSIVE_MAX_LENGTH = 2000
+#   When PASTA starts from a tree, it stops after this many iterations that do
+#   not improve the score, rather than running all of them
+PASTA_STALL_LIMIT = 1
+
+
+def shell_script(name):
+    """Return the path to one of the shell scripts of the package."""
+    #   Get the base directory of the LRT package
+    lrt_path = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
+    return os.path.join(lrt_path, 'Shell_Scripts', name)
+
+
+def script_text(name):
+    """Return the text of a shell script, which holds the options that a
+    program is run with."""
+    with open(shell_script(name), 'r') as f:
+        return f.read()
+
+
+def choose_aligner(nseqs, max_length, requested=None, have_mafft=False):
+    """Return the name of the aligner to use for nseqs sequences, the longest
+    of which is max_length residues. If an aligner was requested, it is used,
+    except that PASTA cannot align fewer than three sequences. Otherwise, small
+    alignments go to MAFFT if it is installed, or Clustal-omega if not, and
+    the others go to PASTA."""
+    if requested and requested != 'auto':
+        if requested == 'pasta' and nseqs <= 2:
+            return 'clustalo'
+        return requested
+    if nseqs <= 2:
+        return 'clustalo'
+    if nseqs <= PROGRESSIVE_MAX_SEQS and max_length <= PROGRESSIVE_MAX_LENGTH:
+        if have_mafft:
+            return 'mafft'
+        return 'clustalo'
+    return 'pasta'
 
 
 class PastaAlign(object):
+    """A class to align homologous CDS as amino acids, estimate a tree, and
+    back-translate the alignment to codons.
+
+    Contains the following class attributes:
+        BACKENDS (dict)       Names of the aligners, and the methods that run
+                              them
+        SCRIPTS (dict)        Names of the aligners, and the shell scripts
+                              that run them
+
+    Contains the following instance attributes:
+        mafft_path (str)      Path to MAFFT, or False if it is not installed.
+                              Set by the caller.
+        threads (int)         Threads for the aligner and the tree
+        memory (str)          Java heap for PASTA
+        check_codons (bool)   Check the codons after back-translation
+        cache (DiskCache)     Cache of finished alignments and trees, or None.
+                              Set by the caller.
+        species_tree (Tree)   Reference species tree to prune for each gene
+                              instead of estimating a tree, or None. Set by
+                              the caller.
+        species_tree_path (str)
+                              Path to the species tree, for the cache key
+        target (str)          Target species, whose tip the query takes
+        previous_tree (str)   Tree of this gene from an earlier run, to start
+                              PASTA from, or None. Set by the caller.
+        max_length (int)      Length of the longest sequence to align
+        aln_out (str)         Path to the amino acid alignment
+        tree_out (str)        Path to the tree
+
+    Contains the following methods:
+        prepare_sequences():
+            Translate the CDS and write them for the aligner.
+
+        run_aligner(backend):
+            Align with one of the BACKENDS. Each of them sets aln_out, and
+            sets tree_out if the aligner also estimates a tree, like PASTA.
+
+        build_tree():
+            Estimate a tree from aln_out with FastTree, and set tree_out.
+
+        prune_species_tree():
+            Prune the species tree to the sequences in aln_out, and set
+            tree_out to it.
+
+        starting_tree():
+            Write a starting tree for PASTA, from the tree of an earlier run
+            or the species tree.
+
+        back_translate():
+            Rebuild the codon alignment from aln_out.
+
+        sanitize_outputs():
+            Remove characters that HyPhy cannot read from the tree.
+
+        cache_key(backend):
+            Build the key of the finished alignment and tree, from the input
+            sequences and the programs and options that make them.
+
+        cached_outputs(key):
+            Write the cached alignment and tree into temporary files, and set
+            final_aln and tree_out to them.
+
+        save_outputs(key):
+            Store the finished alignment and tree in the cache.
+    """
+
+    BACKENDS = {
+        'pasta': 'pasta_align',
+        'clustalo': 'clustalo_align',
+        'mafft': 'mafft_align'}
+    SCRIPTS = {
+        'pasta': 'Pasta_Align.sh',
+        'clustalo': 'Clustalo_Align.sh',
+        'mafft': 'Mafft_Align.sh'}
+
     def __init__(
             self,
             pasta_path,
@@ -37,10 +167,24 @@ class PastaAlign(object):
         self.pasta_path = check_modules.check_executable(pasta_path)
         self.clustalo_path = check_modules.check_executable(clustalo_path)
         self.fasttree_path = check_modules.check_executable(fasttree_path)
+        self.mafft_path = False
         self.protein_input = None
         self.aln_out = None
         self.tree_out = None
         self.final_aln = None
+        self.max_length = 0
+        #   Threads for the aligner and the tree, and memory for PASTA. These
+        #   are set by the caller from the resource options.
+        self.threads = 1
+        self.memory = None
+        #   Whether to check that the back-translated codons match the
+        #   aligned residues
+        self.check_codons = False
+        self.cache = None
+        self.species_tree = None
+        self.species_tree_path = None
+        self.target = None
+        self.previous_tree = None
         return
 
     def prepare_sequences(self):
@@ -48,74 +192,46 @@ class PastaAlign(object):
         sequences are not multiples of 3, and appends N if not. Translates
         the nucleotide sequences to amino acids for protein alignment with
         Pasta, then removes the trailing stop codon, if it is present."""
-        #   First, read in the sequences and check their length
-        input_seqs = list(SeqIO.parse(self.input_seq.name, 'fasta'))
         #   Start accumulating translated sequences to write into the
         #   alignment input file.
         tl_seqs = []
-        for i in input_seqs:
+        for name, cds in codons.read_fasta(self.input_seq.name):
             #   Fix the names for HyPhy. Names must be alphanumeric, with
-            #   underscores
-            fixed_name = re.sub('[^0-9a-zA-Z]', '_', i.id)
+            #   underscores. This is done for every sequence, including those
+            #   that get Ns added, which used to keep their own names and were
+            #   then left out of the back-translation.
+            fixed_name = re.sub('[^0-9a-zA-Z]', '_', name)
             #   If the length is not a multiple of 3, then we have to add Ns to
-            #   make it so.
-            if len(i) % 3 != 0:
-                to_add = 3 - (len(i) % 3)
-                #   Tack on the original sequence, with some appended Ns so we
-                #   can recreate the nucleotide alignment later.
-                self.input_dict[fixed_name] = str(i.seq) + to_add*'N'
+            #   make it so. We keep the original sequence, with the Ns, so we
+            #   can recreate the nucleotide alignment later.
+            if len(cds) % 3 != 0:
+                to_add = 3 - (len(cds) % 3)
+                cds += to_add*'N'
                 self.mainlog.debug(
-                    'Length of sequence ' + i.id + ' is not a mulitple of 3. ' +
-                    'Adding ' + str(to_add) + ' Ns to the end.'
+                    'Length of sequence ' + name + ' is not a mulitple of '
+                    '3. Adding ' + str(to_add) + ' Ns to the end.'
                     )
-                #   Create the new sequence. Pasta chokes on ambiguous
-                #   amino acids that aren't X, so we replace them all with X.
-                fixed_seq = Seq(str(i.seq) + to_add*'N').translate()
-                sub_seq = Seq(
-                    re.sub(
-                        'B|Z|J|O|U',
-                        'X',
-                        str(fixed_seq),
-                        re.I))
-                new_seq = SeqRecord.SeqRecord(
-                    sub_seq,
-                    id=i.id,
-                    description='')
-            else:
-                self.input_dict[fixed_name] = str(i.seq)
-                sub_seq = Seq(
-                    re.sub(
-                        'B|Z|J|O|U',
-                        'X',
-                        str(i.seq.translate()),
-                        re.I))
-                new_seq = SeqRecord.SeqRecord(
-                    sub_seq,
-                    id=fixed_name,
-                    description='')
-            self.mainlog.debug(new_seq.id + '\t' + str(new_seq.seq))
-            tl_seqs.append(new_seq)
+            self.input_dict[fixed_name] = cds
+            #   Pasta chokes on ambiguous amino acids that aren't X, so we
+            #   replace them all with X. The old re.sub() call passed re.I as
+            #   its count, and only replaced the first two.
+            protein = codons.AMBIGUOUS_AA.sub('X', codons.translate(cds))
+            self.mainlog.debug(fixed_name + '\t' + protein)
+            tl_seqs.append((fixed_name, protein))
         self.mainlog.debug('Number of species aligned: ' + str(len(tl_seqs)))
-        #   Then, we have to iterate through the translated sequences and
-        #   check for sequences ending in stop codons. Pasta hates these, so
-        #   we will prune them. We also check for those with internal stop
-        #   codons, and skip those.
+        #   Then, we have to check for sequences ending in stop codons. Pasta
+        #   hates these, so we will prune them. We also check for those with
+        #   internal stop codons, and skip those.
         fixed_tl_seqs = []
-        for i in tl_seqs:
-            #   If we find an internal stop codon
-            if re.match(r'.+\*[^$]', str(i.seq)):
+        for name, protein in tl_seqs:
+            trimmed = codons.trim_stop(protein)
+            if trimmed is None:
                 self.mainlog.debug(
-                    'Sequence ' + i.id + ' has internal stop. Skipping.'
+                    'Sequence ' + name + ' has internal stop. Skipping.'
                     )
                 continue
-            else:
-                #   Otherwise, just strip the stop codon off the end and save
-                if i.seq.endswith('*'):
-                    fixed_tl_seqs.append(
-                        SeqRecord.SeqRecord(i.seq[:-1], id=i.id, description='')
-                        )
-                else:
-                    fixed_tl_seqs.append(i)
+            fixed_tl_seqs.append((name, trimmed))
+            self.max_length = max(self.max_length, len(trimmed))
         #   Then, we open another temporary file to hold our amino acid
         #   sequences.
         self.protein_input = tempfile.NamedTemporaryFile(
@@ -123,7 +239,7 @@ class PastaAlign(object):
             prefix='BAD_Mutations_PastaInput_',
             suffix='.fasta')
         #   And write the protein sequences into it
-        SeqIO.write(fixed_tl_seqs, self.protein_input, 'fasta')
+        codons.write_fasta(self.protein_input, fixed_tl_seqs)
         self.protein_input.flush()
         # Return the number of sequences to align here
         return len(fixed_tl_seqs)
@@ -132,45 +248,34 @@ class PastaAlign(object):
         """Back-translates from amino acid to nucleotide, using the original
         input sequences as a guide to avoid ambiguity. Assumes that a non-gap
         character in the amino acid alignment will be faithfully represented
-        by a triplet in the source sequence, and will not check identity of
-        translated codons."""
-        #   Iterate through the aligned protein file, and start rebuilding the
-        #   original nucleotide sequence.
-        aln_prot = SeqIO.parse(self.aln_out, 'fasta')
+        by a triplet in the source sequence. If check_codons is set, codons
+        that do not translate to the residue they are aligned to are
+        reported. The alignment is sanitized for HyPhy in memory, so that the
+        file is only written once."""
         bt_seqs = []
-        for rec in aln_prot:
+        for name, aligned in codons.read_fasta(self.aln_out):
             #   Check if we have name mismatch. This *shouldn't* happen, but
             #   this should stop some errors
-            if rec.id in self.input_dict:
-                in_seq = self.input_dict[rec.id]
-                rebuilt_seq = ''
-                pos = 0
-                #   Now, iterate through the amino acid sequence and rebuild
-                #   the nucleotide sequence.
-                for aa in rec.seq:
-                    #   If we have a gap, put in three gaps
-                    if aa == '-':
-                        rebuilt_seq += '---'
-                    else:
-                        rebuilt_seq += in_seq[pos:pos+3]
-                        pos += 3
-            else:
+            if name not in self.input_dict:
                 continue
-            #   Then, put in a new SeqRecord with the sequence and the name, so
-            #   we can write a fasta file.
-            bt_seqs.append(
-                SeqRecord.SeqRecord(
-                    Seq(rebuilt_seq),
-                    id=rec.id,
-                    description='')
-                )
+            rebuilt_seq, mismatches = codons.back_translate(
+                aligned,
+                self.input_dict[name],
+                self.check_codons)
+            for col, aa, codon in mismatches:
+                self.mainlog.warning(
+                    'Codon ' + codon + ' of ' + name + ' is aligned to ' +
+                    aa + ' in column ' + str(col + 1) + '.')
+            bt_seqs.append((name, rebuilt_seq))
         #   And create a new temporary file for them
         final_seqs = tempfile.NamedTemporaryFile(
             mode='w+t',
             prefix='BAD_Mutations_BackTranslated_',
             suffix='.fasta',
             delete=False)
-        SeqIO.write(bt_seqs, final_seqs, 'fasta')
+        buf = io.StringIO()
+        codons.write_fasta(buf, bt_seqs)
+        final_seqs.write(sanitize.sanitize_fasta(buf.getvalue()))
         final_seqs.flush()
         self.final_aln = final_seqs.name
         return
@@ -184,8 +289,10 @@ class PastaAlign(object):
             lrt_path,
             'Shell_Scripts',
             'Pasta_Align.sh')
-        #   Pasta expects a directory for output. We use the system temp dir
-        pasta_out = tempfile.gettempdir()
+        #   Pasta expects a directory for output. We make a new one in the
+        #   temp dir, which is the scratch directory of the run, so that other
+        #   alignments never share it
+        pasta_out = tempfile.mkdtemp(prefix='BAD_Mutations_Pasta_')
         #   We make a job name from the time in microseconds
         #   This should be good enough...
         pasta_job = 'pastajob_' + '%.6f' % time.time()
@@ -196,14 +303,22 @@ class PastaAlign(object):
             self.pasta_path,
             self.protein_input.name,
             pasta_out,
-            pasta_job]
+            pasta_job,
+            str(self.threads),
+            resources.java_memory(self.memory)]
+        #   Starting from a tree that is close to the answer saves PASTA its
+        #   first tree estimate, and most of its iterations
+        start_tree = self.starting_tree()
+        if start_tree:
+            cmd.extend([start_tree, str(PASTA_STALL_LIMIT)])
         self.mainlog.debug(' '.join(cmd))
         #   Then, we'll execute it
         p = subprocess.Popen(
             cmd,
             shell=False,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+            stderr=subprocess.PIPE,
+            env=resources.tool_env(self.threads))
         out, err = p.communicate()
         #   Then, build the output name
         #   The structure of the Pasta output files is
@@ -214,7 +329,7 @@ class PastaAlign(object):
             os.path.sep,
             pasta_job,
             '.marker001.',
-            self.protein_input.name.split(os.path.sep)[-1].replace('.fasta', ''),
+            os.path.basename(self.protein_input.name).replace('.fasta', ''),
             '.aln'])
         tree_out = ''.join([
             pasta_out,
@@ -229,68 +344,235 @@ class PastaAlign(object):
     def clustalo_align(self):
         """Align the amino acid sequences with Clustal-omega. We invoke this
         function in the case where a sequence only finds one homologue, which
-        means we have a pairwise alignment."""
-        #   Get the base directory of the LRT package
-        lrt_path = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
-        #   Then build the path to the pasta script
-        clustalo_script = os.path.join(
-            lrt_path,
-            'Shell_Scripts',
-            'Clustalo_Align.sh')
-        # Clustal-omega needs an output filename
-        clustalo_out = tempfile.NamedTemporaryFile(
+        means we have a pairwise alignment, and for small alignments if MAFFT
+        is not installed. The tree is estimated by build_tree()."""
+        return self.run_script(
+            self.SCRIPTS['clustalo'], self.clustalo_path, 'Clustalo')
+
+    def mafft_align(self):
+        """Align the amino acid sequences with MAFFT. This is used for small
+        alignments, where starting PASTA takes longer than the alignment. The
+        tree is estimated by build_tree()."""
+        return self.run_script(
+            self.SCRIPTS['mafft'], self.mafft_path, 'Mafft')
+
+    def run_script(self, script, program, label):
+        """Run a shell script that takes a program, an input file, an output
+        file, and a number of threads. The input is the protein alignment
+        input, and the output is a new temporary file, which is saved as
+        aln_out. Returns the stdout and stderr of the script."""
+        script_path = shell_script(script)
+        aln_out = tempfile.NamedTemporaryFile(
             mode='w+t',
-            prefix='BAD_Mutations_Clustalo_Out_',
+            prefix='BAD_Mutations_' + label + '_Out_',
             suffix='.fasta',
             delete=False)
-        #   Create the command line
+        aln_out.close()
         cmd = [
             'bash',
-            clustalo_script,
-            self.clustalo_path,
+            script_path,
+            program,
             self.protein_input.name,
-            clustalo_out.name,
-            self.fasttree_path]
+            aln_out.name,
+            str(self.threads)]
         self.mainlog.debug(' '.join(cmd))
-        #   Then, we'll execute it
         p = subprocess.Popen(
             cmd,
             shell=False,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+            stderr=subprocess.PIPE,
+            env=resources.tool_env(self.threads))
         out, err = p.communicate()
-        aln_out = clustalo_out.name
-        tree_out = clustalo_out.name.replace('.fasta', '.tre')
-        #   And save the paths to these files as class variables
-        self.aln_out = aln_out
-        self.tree_out = tree_out
-        # Seek back to the beginning of the output file so it can be read again
-        clustalo_out.seek(0)
+        self.aln_out = aln_out.name
+        self.tree_out = None
         return (out, err)
 
-    def sanitize_outputs(self):
-        """Remove troublesome characters from the PASTA output files that
-        cause HyPhy to crash, or the Biopython Newick parser to fail."""
-        #   Get the base directory of the LRT package
-        lrt_path = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
-        #   Then build the path to the pasta script
-        santize_script = os.path.join(
-            lrt_path,
-            'Shell_Scripts',
-            'Prepare_HyPhy.sh')
-        #   Create the command line
+    def run_aligner(self, backend):
+        """Align the amino acid sequences with one of the BACKENDS. Every
+        backend sets aln_out to the path of the amino acid alignment. PASTA
+        also sets tree_out to its tree; the others leave it as None, and the
+        tree is estimated with build_tree(). Returns the stdout and stderr of
+        the aligner."""
+        start = time.time()
+        out, err = getattr(self, self.BACKENDS[backend])()
+        self.mainlog.info(
+            'Aligned with ' + backend + ' in ' +
+            '%.1f' % (time.time() - start) + ' seconds.')
+        return (out, err)
+
+    def build_tree(self):
+        """Estimate a tree from the amino acid alignment with FastTree. This
+        is separate from the aligners, so that any of them can be used."""
+        tree_script = shell_script('FastTree.sh')
+        tree_out = os.path.splitext(self.aln_out)[0] + '.tre'
         cmd = [
             'bash',
-            santize_script,
-            self.final_aln,
-            self.tree_out]
-        #   Run it
-        self.mainlog.debug('Sanitizing alignment in ' + self.final_aln)
-        self.mainlog.debug('Sanitizing tree in ' + self.tree_out)
+            tree_script,
+            self.fasttree_path,
+            self.aln_out,
+            tree_out,
+            str(self.threads)]
+        self.mainlog.debug(' '.join(cmd))
+        start = time.time()
         p = subprocess.Popen(
             cmd,
             shell=False,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+            stderr=subprocess.PIPE,
+            env=resources.tool_env(self.threads))
         out, err = p.communicate()
-        return(out, err)
+        self.mainlog.info(
+            'Estimated the tree in ' + '%.1f' % (time.time() - start) +
+            ' seconds.')
+        self.tree_out = tree_out
+        return (out, err)
+
+    def sanitize_outputs(self):
+        """Remove troublesome characters from the tree that cause HyPhy to
+        crash, or the Biopython Newick parser to fail. The alignment was
+        already sanitized by back_translate(), before it was written."""
+        self.mainlog.debug('Sanitizing tree in ' + self.tree_out)
+        sanitize.sanitize_file(self.tree_out, sanitize.tree_lines)
+        return
+
+    def query_name(self):
+        """Return the name of the query sequence in the alignment."""
+        return re.sub(
+            '[^0-9a-zA-Z]', '_', codons.read_fasta(self.query)[0][0])
+
+    def starting_tree(self):
+        """Write a starting tree for PASTA, pruned to the sequences to align.
+        The tree of this gene from an earlier run is tried first, then the
+        species tree. Returns the path to the tree, or None if neither of them
+        has all of the sequences."""
+        names = [
+            name
+            for name, seq
+            in codons.read_fasta(self.protein_input.name)]
+        query = self.query_name()
+        sources = []
+        if self.previous_tree and os.path.isfile(self.previous_tree) and \
+                os.path.getsize(self.previous_tree) > 0:
+            try:
+                #   The query has its own tip in the tree of an earlier run
+                sources.append((
+                    'the tree of an earlier run',
+                    species_tree.read_tree(self.previous_tree),
+                    query))
+            except (NewickError, ValueError):
+                self.mainlog.debug('Cannot read ' + self.previous_tree)
+        if self.species_tree is not None:
+            sources.append(
+                ('the species tree', self.species_tree, self.target))
+        for label, tree, target in sources:
+            pruned, problem = species_tree.prune_tree(
+                tree, names, query, target)
+            if pruned is None:
+                self.mainlog.debug(
+                    'Not starting PASTA from ' + label + ': ' + problem)
+                continue
+            handle = tempfile.NamedTemporaryFile(
+                mode='w+t',
+                prefix='BAD_Mutations_Pasta_Start_',
+                suffix='.tre',
+                delete=False)
+            handle.close()
+            species_tree.write_tree(pruned, handle.name)
+            self.mainlog.info('Starting PASTA from ' + label + '.')
+            return handle.name
+        return None
+
+    def prune_species_tree(self):
+        """Prune the species tree to the sequences in the amino acid
+        alignment, and write it as the tree of this gene. Returns False, and
+        leaves tree_out alone, if a sequence cannot be placed in the species
+        tree."""
+        names = [name for name, seq in codons.read_fasta(self.aln_out)]
+        query = self.query_name()
+        pruned, problem = species_tree.prune_tree(
+            self.species_tree, names, query, self.target)
+        if pruned is None:
+            self.mainlog.warning(
+                'Cannot use the species tree: ' + problem + '. Estimating a '
+                'tree from the alignment instead.')
+            return False
+        tree_out = os.path.splitext(self.aln_out)[0] + '_Species.tre'
+        species_tree.write_tree(pruned, tree_out)
+        self.mainlog.debug('Pruned the species tree into ' + tree_out)
+        self.tree_out = tree_out
+        return True
+
+    def cache_key(self, backend):
+        """Build the cache key of the finished alignment and tree. The key
+        covers the input sequences, in order and with the names that are
+        written into the alignment, the aligner and the tree program, and the
+        scripts that hold their options, and the sanitizing rules. The number
+        of threads and the memory are left out, since they do not change the
+        alignment."""
+        programs = {
+            'pasta': self.pasta_path,
+            'clustalo': self.clustalo_path,
+            'mafft': self.mafft_path}
+        parts = [
+            'alignment',
+            backend,
+            check_modules.tool_identity(programs[backend]),
+            script_text(self.SCRIPTS[backend])]
+        #   Only PASTA makes its own tree. FastTree is also used if the
+        #   species tree cannot be pruned for a gene.
+        if backend != 'pasta' or self.species_tree is not None:
+            parts.extend([
+                check_modules.tool_identity(self.fasttree_path),
+                script_text('FastTree.sh')])
+        if self.species_tree is not None:
+            with open(self.species_tree_path, 'r') as f:
+                parts.extend([f.read(), self.target])
+        #   The tree of an earlier run is left out on purpose. It only changes
+        #   where PASTA starts, and the earlier run wrote it, so including it
+        #   would make every repeated run miss the cache.
+        parts.append(sanitize.rules_text())
+        for name, cds in self.input_dict.items():
+            parts.extend([name, cds])
+        return self.cache.make_key(*parts)
+
+    def cached_outputs(self, key):
+        """Look up the finished alignment and tree in the cache. If they are
+        there, they are written into temporary files, final_aln and tree_out
+        are set to them, and True is returned."""
+        data = self.cache.get(key)
+        if data is None:
+            return False
+        try:
+            entry = json.loads(data.decode('utf-8'))
+            msa = entry['msa']
+            tree = entry['tree']
+        except (ValueError, KeyError):
+            self.mainlog.warning('Ignoring unreadable cache entry ' + key)
+            return False
+        outputs = []
+        for text, suffix in [(msa, '.fasta'), (tree, '.tre')]:
+            handle = tempfile.NamedTemporaryFile(
+                mode='w+t',
+                prefix='BAD_Mutations_Cached_',
+                suffix=suffix,
+                delete=False)
+            handle.write(text)
+            handle.close()
+            outputs.append(handle.name)
+        self.final_aln, self.tree_out = outputs
+        return True
+
+    def save_outputs(self, key):
+        """Store the finished alignment and tree in the cache."""
+        with open(self.final_aln, 'r') as f:
+            msa = f.read()
+        with open(self.tree_out, 'r') as f:
+            tree = f.read()
+        #   An empty alignment or tree means that a program failed, and should
+        #   not be reused
+        if not msa.strip() or not tree.strip():
+            return
+        self.cache.put(
+            key,
+            json.dumps({'msa': msa, 'tree': tree}).encode('utf-8'))
+        return
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Functions to translate CDS into amino acids, and to back-translate amino
+acid alignments into codon alignments, without building Seq and SeqRecord
+objects. Codons are translated with a lookup table, and back-translation works
+on runs of gaps and residues in the alignment: a run of residues is one slice
+of the CDS, and a run of gaps is three gaps per column, so the work is in the
+number of runs rather than the number of columns."""
+
+#   Import standard library modules here
+import re
+
+#   Import Biopython modules here for sequence handling
+from Bio.Seq import Seq
+
+#   Translations of the codons that we have seen. Biopython translates each
+#   codon the first time, so that ambiguous codons give the same amino acid as
+#   translating the whole sequence would.
+_CODONS = {}
+
+#   Ambiguous amino acids that PASTA does not take
+AMBIGUOUS_AA = re.compile('B|Z|J|O|U', re.I)
+
+#   Width of the sequence lines in FASTA files, the same as Biopython
+LINE_WIDTH = 60
+
+#   Codons, with a partial codon at the end, and runs of the alignment
+CODON = re.compile('.{1,3}', re.S)
+RUN = re.compile('-+|[^-]+')
+
+
+def split_codons(cds):
+    """Split a CDS into a list of codons. A partial codon at the end is
+    kept."""
+    return CODON.findall(cds)
+
+
+def translate_codon(codon):
+    """Translate one codon, with the standard genetic code."""
+    aa = _CODONS.get(codon)
+    if aa is None:
+        aa = str(Seq(codon).translate())
+        _CODONS[codon] = aa
+    return aa
+
+
+def translate(cds):
+    """Translate a CDS whose length is a multiple of 3."""
+    cds_codons = split_codons(cds)
+    for codon in set(cds_codons).difference(_CODONS):
+        translate_codon(codon)
+    return ''.join(map(_CODONS.__getitem__, cds_codons))
+
+
+def trim_stop(protein):
+    """Remove the trailing stop codon from a protein. Returns None if the
+    protein has an internal stop, which is a stop that is neither the first
+    nor the last residue."""
+    if '*' in protein[1:-1]:
+        return None
+    if protein.endswith('*'):
+        return protein[:-1]
+    return protein
+
+
+def back_translate(aligned, cds, check=False):
+    """Rebuild the codon alignment of one sequence from its amino acid
+    alignment and its CDS. If check is True, also return the (column,
+    residue, codon) of each codon that does not translate to the residue it
+    is aligned to. Returns a tuple of the codon alignment and the list of
+    mismatches."""
+    mismatches = []
+    pieces = []
+    #   Position in the CDS, in nucleotides
+    pos = 0
+    for run in RUN.finditer(aligned):
+        length = run.end() - run.start()
+        if run.group().startswith('-'):
+            pieces.append('---' * length)
+            continue
+        #   Residues past the end of the CDS give nothing
+        piece = cds[pos:pos + 3 * length]
+        pos += 3 * length
+        pieces.append(piece)
+        if check:
+            mismatches.extend(
+                check_run(run.group(), piece, run.start()))
+    return (''.join(pieces), mismatches)
+
+
+def check_run(residues, piece, start):
+    """Return the (column, residue, codon) of each codon in a run that does
+    not translate to the residue it is aligned to. Ambiguous residues were
+    replaced with X before aligning, so they match X."""
+    found = []
+    tl = AMBIGUOUS_AA.sub('X', translate(piece[:len(piece) - len(piece) % 3]))
+    if tl == residues:
+        return found
+    for i, aa in enumerate(residues):
+        codon = piece[3 * i:3 * i + 3]
+        if len(codon) == 3 and i < len(tl) and tl[i] != aa:
+            found.append((start + i, aa, codon))
+    return found
+
+
+def read_fasta(fname):
+    """Read a FASTA file into a list of (name, sequence) tuples. The name is
+    the first word of the header."""
+    records = []
+    name = None
+    seq = []
+    with open(fname, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                if name is not None:
+                    records.append((name, ''.join(seq)))
+                name = line[1:].split(None, 1)[0] if line[1:].strip() else ''
+                seq = []
+            elif name is not None:
+                seq.append(line.replace(' ', ''))
+    if name is not None:
+        records.append((name, ''.join(seq)))
+    return records
+
+
+def write_fasta(handle, records):
+    """Write (name, sequence) tuples into an open file handle, in the same
+    format as Biopython."""
+    for name, seq in records:
+        handle.write('>' + name + '\n')
+        for i in range(0, len(seq), LINE_WIDTH):
+            handle.write(seq[i:i + LINE_WIDTH] + '\n')
+    return
@@ -6,6 +6,7 @@ import subprocess
 import os
 import tempfile
 import re
+from multiprocessing.pool import ThreadPool
 
 #   Import Biopython library
 from Bio import AlignIO
@@ -15,6 +16,9 @@ from Bio import SeqIO
 from ..General import parse_input
 from ..General import set_verbosity
 from ..General import check_modules
+from ..General import resources
+from . import align
+from . import shards
 
 
 class LRTPredict(object):
@@ -37,6 +41,20 @@ class LRTPredict(object):
         self.aligned_pos = None
         self.hyphy_input = None
         self.hyphy_output = None
+        #   Threads for HyPhy, set by the caller from the resource options.
+        #   When the positions are split, threads is the share of each run,
+        #   and fit_threads is used for the shared fit, which runs alone.
+        self.threads = 1
+        self.fit_threads = 1
+        #   Cache of background fits, set by the caller if it is used
+        self.fit_cache = None
+        self.fit_key = None
+        self.fit_path = None
+        self.fit_mode = 'NONE'
+        #   Number of HyPhy runs to split the positions between, and how many
+        #   of them to run at once, set by the caller
+        self.shards = 1
+        self.workers = 1
         return
 
     def get_query_position(self):
@@ -74,24 +92,75 @@ class LRTPredict(object):
             'Aligned Pos: ' + ', '.join([str(i) for i in self.aligned_pos]))
         return
 
-    def write_aligned_subs(self):
-        """Write the aligned positions into a temporary file."""
+    def write_aligned_subs(self, positions=None):
+        """Write the aligned positions into a temporary file. Writes all of
+        them, unless a list of positions is given."""
+        if positions is None:
+            positions = self.aligned_pos
         subsfile = tempfile.NamedTemporaryFile(
             mode='w+t',
             prefix='BAD_Mutations_HYPHY_Subs_',
             suffix='.txt',
             delete=False
             )
-        subsfile.write('\n'.join([str(i) for i in self.aligned_pos]))
+        subsfile.write('\n'.join([str(i) for i in positions]))
         return subsfile
 
-    def prepare_hyphy_inputs(self):
-        """Prepare the input files for the HYPHY prediction script. Writes the
-        paths of the MSA, tree, and substitutions file into a plain text file.
-        Also builds the name of the temporary output file to hold the
-        predictions."""
-        #   Write the substitutions file
-        alignedsubs = self.write_aligned_subs()
+    def background_fit(self):
+        """Look up the background fit of the alignment and tree in the cache.
+        The fit of the MG94 model to the whole alignment does not depend on
+        the query or the positions, so every prediction on the same alignment
+        and tree can share it. Sets fit_mode to LOAD if the fit is cached, and
+        writes it into fit_path; to SAVE if HyPhy should write it into
+        fit_path; or to NONE if there is no cache."""
+        if self.fit_cache is None:
+            self.fit_path = os.devnull
+            self.fit_mode = 'NONE'
+            return
+        with open(self.nmsa_path, 'r') as f:
+            msa = f.read()
+        with open(self.phylogenetic, 'r') as f:
+            tree = f.read()
+        with open(align.shell_script('LRT.hyphy'), 'r') as f:
+            script = f.read()
+        self.fit_key = self.fit_cache.make_key(
+            'hyphy_fit',
+            check_modules.tool_identity(self.hyphy_path),
+            script,
+            msa,
+            tree)
+        fitfile = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_HYPHY_Fit_',
+            suffix='.txt',
+            delete=False)
+        data = self.fit_cache.get(self.fit_key)
+        if data is None:
+            self.fit_mode = 'SAVE'
+        else:
+            fitfile.write(data.decode('utf-8'))
+            self.fit_mode = 'LOAD'
+            self.mainlog.debug('Using cached background fit ' + self.fit_key)
+        fitfile.close()
+        self.fit_path = fitfile.name
+        return
+
+    def save_background_fit(self):
+        """Store the background fit that HyPhy wrote in the cache."""
+        if self.fit_mode != 'SAVE':
+            return
+        with open(self.fit_path, 'r') as f:
+            fit = f.read()
+        #   An empty fit means that HyPhy failed, and should not be reused
+        if not fit.strip():
+            return
+        self.fit_cache.put(self.fit_key, fit.encode('utf-8'))
+        return
+
+    def write_hyphy_input(self, subs_path, fit_path, fit_mode):
+        """Write the input file of the HYPHY prediction script: the paths of
+        the MSA, tree, and substitutions file, the query name, and where and
+        how to use the background fit. Returns the open file."""
         infile = tempfile.NamedTemporaryFile(
             mode='w+t',
             prefix='BAD_Mutations_HYHPY_In_',
@@ -102,15 +171,33 @@ class LRTPredict(object):
         #   into the file.
         infile.write(self.nmsa_path + '\n')
         infile.write(os.path.abspath(self.phylogenetic) + '\n')
-        infile.write(alignedsubs.name + '\n')
+        infile.write(subs_path + '\n')
         # Remove all non-allowed characters in sequence name, and replace them
         # with underscores
         safe_name = re.sub(r'[:\.\+-]', '_', self.query.id)
-        infile.write(safe_name)
+        infile.write(safe_name + '\n')
+        #   Then where to load or save the background fit, and which to do
+        infile.write(fit_path + '\n')
+        infile.write(fit_mode)
         infile.flush()
         #   Print out the HyPhy input to debug
         infile.seek(0)
         self.mainlog.debug('HyPhy input file: \n' + infile.read())
+        return infile
+
+    def prepare_hyphy_inputs(self):
+        """Prepare the input files for the HYPHY prediction script. Writes the
+        paths of the MSA, tree, and substitutions file into a plain text file.
+        Also builds the name of the temporary output file to hold the
+        predictions, and looks up the background fit."""
+        #   Write the substitutions file
+        alignedsubs = self.write_aligned_subs()
+        alignedsubs.close()
+        self.background_fit()
+        infile = self.write_hyphy_input(
+            alignedsubs.name,
+            self.fit_path,
+            self.fit_mode)
         #   And then we create a name for the HYPHY output file
         outfile = tempfile.NamedTemporaryFile(
             mode='w+t',
@@ -121,8 +208,9 @@ class LRTPredict(object):
         self.hyphy_output = outfile
         return
 
-    def predict_codons(self):
-        """Run the HYPHY script to predict the codons."""
+    def run_hyphy(self, input_path, output_path, threads):
+        """Run the HYPHY script on one input file, and write the report into
+        output_path."""
         #   Get the base directory of the LRT package
         lrt_path = os.path.realpath(__file__).rsplit(os.path.sep, 3)[0]
         #   Then build the path to the hyphy script
@@ -141,8 +229,9 @@ class LRTPredict(object):
             hyphy_script,
             self.hyphy_path,
             prediction_script,
-            self.hyphy_input.name,
-            self.hyphy_output.name
+            input_path,
+            output_path,
+            str(threads)
             ]
         self.mainlog.debug(' '.join(cmd))
         #   Then run the command
@@ -150,9 +239,118 @@ class LRTPredict(object):
             cmd,
             shell=False,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+            stderr=subprocess.PIPE,
+            env=resources.tool_env(threads))
         out, err = p.communicate()
         self.mainlog.debug('stdout:\n' + out.decode('utf-8'))
         self.mainlog.debug('stderr:\n' + err.decode('utf-8'))
+        return
+
+    def shared_fit(self):
+        """Fit the background model once for the runs on parts of the
+        positions, unless it is cached. HyPhy stops after the fit, and the
+        runs load it from fit_path. Nothing else runs during the fit, so it
+        gets fit_threads rather than the share of one run. Returns the lines
+        of the report of the fit, or None if it was cached."""
+        if self.fit_mode == 'LOAD':
+            return None
+        if self.fit_mode == 'NONE':
+            fitfile = tempfile.NamedTemporaryFile(
+                mode='w+t',
+                prefix='BAD_Mutations_HYPHY_Fit_',
+                suffix='.txt',
+                delete=False)
+            fitfile.close()
+            self.fit_path = fitfile.name
+        infile = self.write_hyphy_input(
+            os.devnull,
+            self.fit_path,
+            'FIT')
+        outfile = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_HYPHY_Fit_Out_',
+            suffix='.txt'
+            )
+        self.mainlog.info('Fitting the background model.')
+        self.run_hyphy(infile.name, outfile.name, self.fit_threads)
+        infile.close()
+        report = outfile.readlines()
+        outfile.close()
+        with open(self.fit_path, 'r') as f:
+            fit = f.read()
+        if not fit.strip():
+            self.mainlog.error(
+                'HyPhy did not fit the background model. Run predict with '
+                '-v DEBUG to see its output.')
+            exit(1)
+        self.save_background_fit()
+        self.fit_mode = 'LOAD'
+        return report
+
+    def run_shard(self, positions):
+        """Run HyPhy on some of the positions, loading the shared background
+        fit. Returns the lines of its report."""
+        subsfile = self.write_aligned_subs(positions)
+        subsfile.close()
+        infile = self.write_hyphy_input(
+            subsfile.name,
+            self.fit_path,
+            'LOAD')
+        outfile = tempfile.NamedTemporaryFile(
+            mode='w+t',
+            prefix='BAD_Mutations_HYPHY_Shard_',
+            suffix='.txt'
+            )
+        self.run_hyphy(infile.name, outfile.name, self.threads)
+        infile.close()
+        report = outfile.readlines()
+        outfile.close()
+        return report
+
+    def predict_shards(self):
+        """Split the positions between several HyPhy runs, and merge their
+        reports into the output file. The background model is fitted once,
+        and every run starts from that fit."""
+        fit_report = self.shared_fit()
+        parts = shards.split_positions(self.aligned_pos, self.shards)
+        self.mainlog.info(
+            'Predicting ' + str(len(self.aligned_pos)) + ' positions in ' +
+            str(len(parts)) + ' HyPhy runs, ' + str(self.workers) +
+            ' at once.')
+        if self.workers > 1 and len(parts) > 1:
+            #   We use threads rather than processes, since the real work is
+            #   done by the HyPhy subprocesses. map() keeps the reports in the
+            #   same order as the parts.
+            pool = ThreadPool(min(self.workers, len(parts)))
+            try:
+                reports = pool.map(self.run_shard, parts)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            reports = [self.run_shard(part) for part in parts]
+        merged = shards.merge_reports(reports, fit_report)
+        if merged is None:
+            self.mainlog.error(
+                'The HyPhy reports of the parts of the positions do not '
+                'match. Run predict with -v DEBUG to see their output.')
+            exit(1)
+        self.hyphy_output.seek(0)
+        self.hyphy_output.truncate()
+        self.hyphy_output.writelines(merged)
+        self.hyphy_output.flush()
+        return
+
+    def predict_codons(self):
+        """Run the HYPHY script to predict the codons. If the positions are
+        split between several runs, their reports are merged into one."""
+        if self.shards > 1 and len(self.aligned_pos) > 1:
+            self.predict_shards()
+        else:
+            self.run_hyphy(
+                self.hyphy_input.name,
+                self.hyphy_output.name,
+                self.threads)
+            self.save_background_fit()
         #   Return the output file
         return self.hyphy_output
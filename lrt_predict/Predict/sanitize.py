@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Functions to remove bootstrap values, spaces, and other characters that
+HyPhy or the Biopython Newick parser cannot read from an alignment and a tree.
+These are the rules of Prepare_HyPhy.sh, from Justin C. Fay, applied in one
+pass over each line instead of one sed -i run per rule. The rules work on one
+line at a time, so applying all of them to a line gives the same result as
+applying each of them to the whole file in turn."""
+
+#   Import standard library modules here
+import os
+import re
+import tempfile
+
+#   The rules are (pattern, replacement) tuples, applied in order. sed treats
+#   each line without its newline, so [[:space:]] never matches the newline.
+UNKNOWN = (re.compile('[ \t\r\f\v]<unknown description>'), '')
+FASTA_RULES = [
+    UNKNOWN,
+    (re.compile(r'\+'), ''),
+    (re.compile(r'\.'), '_')]
+TREE_RULES = [
+    UNKNOWN,
+    #   Bootstrap values after a closing parenthesis
+    (re.compile(r'[)][0-9]\.[0-9]+'), ')'),
+    (re.compile("'"), ''),
+    (re.compile(r'\+'), ''),
+    (re.compile(r'\.'), '_'),
+    #   Put back the decimal points of the branch lengths
+    (re.compile(r':([0-9])_'), r':\1.')]
+#   Lines of the tree that are removed after the rules are applied
+EMPTY_TREE_LINE = re.compile('^;+$')
+
+
+def rules_text():
+    """Return the rules as text, so that a cache key can change with them."""
+    return repr([
+        (pattern.pattern, repl)
+        for pattern, repl
+        in FASTA_RULES + TREE_RULES + [(EMPTY_TREE_LINE, None)]])
+
+
+def apply_rules(line, rules):
+    """Apply rules to one line, which may end in a newline."""
+    if line.endswith('\n'):
+        body = line[:-1]
+        end = '\n'
+    else:
+        body = line
+        end = ''
+    for pattern, repl in rules:
+        body = pattern.sub(repl, body)
+    return (body, end)
+
+
+def fasta_lines(lines):
+    """Sanitize the lines of a FASTA file. Returns a generator of lines."""
+    for line in lines:
+        body, end = apply_rules(line, FASTA_RULES)
+        yield body + end
+
+
+def tree_lines(lines):
+    """Sanitize the lines of a Newick file. Lines that are only semicolons
+    are removed. Returns a generator of lines."""
+    for line in lines:
+        body, end = apply_rules(line, TREE_RULES)
+        if EMPTY_TREE_LINE.match(body):
+            continue
+        yield body + end
+
+
+def sanitize_fasta(text):
+    """Sanitize an alignment that is held in a string."""
+    return ''.join(fasta_lines(text.splitlines(True)))
+
+
+def sanitize_tree(text):
+    """Sanitize a tree that is held in a string."""
+    return ''.join(tree_lines(text.splitlines(True)))
+
+
+def sanitize_file(fname, sanitizer):
+    """Sanitize a file in place with fasta_lines() or tree_lines(). The file
+    is read once and written under a temporary name that is renamed over it,
+    so it is never left half-written."""
+    handle = tempfile.NamedTemporaryFile(
+        mode='w+t',
+        dir=os.path.dirname(os.path.abspath(fname)),
+        prefix='.tmp_',
+        delete=False)
+    try:
+        with open(fname, 'r') as f:
+            for line in sanitizer(f):
+                handle.write(line)
+    finally:
+        handle.close()
+    #   Keep the permissions of the original file, like sed -i does
+    os.chmod(handle.name, os.stat(fname).st_mode & 0o7777)
+    os.rename(handle.name, fname)
+    return
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Functions to split the positions of one gene between several HyPhy runs,
+and to merge their reports back into one. LRT.hyphy prints a row for every
+codon of the alignment, and only tests the positions that it is given; the
+others get a row that ends in NOSNP. The test of one position does not depend
+on the others, so each run gets some of the positions, and the merged report
+takes the tested row of each position from the run that tested it. The
+merged report has the same format as the report of one run."""
+
+#   The line before the rows of the sites, and the line after them
+SITES_HEADER = 'Position'
+SITES_END = 'Alignment order'
+#   The timing lines of the report
+FIT_TIME = 'CPU time taken for dS: '
+SITES_TIME = 'CPU time taken for sites: '
+
+
+def split_positions(positions, nshards):
+    """Split a sorted list of positions into at most nshards lists. Positions
+    are dealt out in turn, so that the lists stay sorted, and every list gets
+    positions from the whole gene. Returns a list of non-empty lists."""
+    nshards = max(1, min(nshards, len(positions)))
+    return [positions[i::nshards] for i in range(nshards)]
+
+
+def split_report(lines):
+    """Split the lines of a HyPhy report into the lines up to the header of
+    the sites, the rows of the sites, and the lines after them. Returns None
+    if the report is not complete."""
+    start = None
+    for index, line in enumerate(lines):
+        if start is None and line.startswith(SITES_HEADER):
+            start = index + 1
+        elif start is not None and line.startswith(SITES_END):
+            return (lines[:start], lines[start:index], lines[index:])
+    return None
+
+
+def format_seconds(seconds):
+    """Format a number of seconds the way that HyPhy prints it."""
+    if seconds == int(seconds):
+        return str(int(seconds))
+    return '%.10g' % seconds
+
+
+def seconds_of(line, label):
+    """Return the number of seconds in a timing line of a report."""
+    try:
+        return float(line[len(label):].split()[0])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def merge_reports(reports, fit_report=None):
+    """Merge the reports of HyPhy runs on parts of the positions of one gene.
+    reports is a list of the lines of each report. The rows of the sites are
+    taken from the first report, except for the positions that another report
+    tested. The time of the sites is the sum of the runs, and the time of the
+    fit is taken from fit_report, the lines of the run that made the shared
+    fit, if there was one. Returns the lines of the merged report, or None if
+    the reports do not match."""
+    parts = [split_report(lines) for lines in reports]
+    if not parts or None in parts:
+        return None
+    head, rows, tail = parts[0]
+    if any(len(part[1]) != len(rows) for part in parts):
+        return None
+    merged = []
+    fit_line = None
+    if fit_report:
+        fit_line = [
+            line
+            for line
+            in fit_report
+            if line.startswith(FIT_TIME)]
+    for line in head:
+        if fit_line and line.startswith(FIT_TIME):
+            line = fit_line[0]
+        merged.append(line)
+    for site in zip(*[part[1] for part in parts]):
+        #   Every run prints the position first, so the rows must line up
+        if len(set(row.split('\t', 1)[0] for row in site)) != 1:
+            return None
+        tested = [row for row in site if 'NOSNP' not in row]
+        merged.append(tested[0] if tested else site[0])
+    total = sum(
+        seconds_of(line, SITES_TIME)
+        for part in parts
+        for line in part[2]
+        if line.startswith(SITES_TIME))
+    for line in tail:
+        if line.startswith(SITES_TIME):
+            line = SITES_TIME + format_seconds(total) + ' seconds.\n'
+        merged.append(line)
+    return merged
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Functions to use one reference species tree for every gene, instead of
+estimating a tree from each alignment. The LRT only needs the topology, since
+HyPhy fits the branch lengths again, so the species tree is pruned to the
+species in the alignment, and its tips are renamed to the sequences.
+
+A tip matches a sequence if the tip name is in the sequence name, ignoring
+case, like TARGET_SPECIES matches a database. The homologues are named after
+their species databases, and the query sequence takes the place of the target
+species. If more than one tip matches, the longest wins."""
+
+#   Import standard library modules here
+import copy
+
+#   Import Biopython modules here for tree handling
+from Bio import Phylo
+
+#   Characters that must be quoted in the names of a Newick tree
+NEWICK_SPECIAL = " ():;,[]'"
+
+
+def read_tree(path):
+    """Read a species tree in Newick format."""
+    return Phylo.read(path, 'newick')
+
+
+def tip_of(name, tips):
+    """Return the tip of the species tree that a sequence name matches, or
+    None if there is none."""
+    best = None
+    for tip in tips:
+        if tip.upper() not in name.upper():
+            continue
+        if best is None or len(tip) > len(best):
+            best = tip
+    return best
+
+
+def prune_tree(tree, names, query, target):
+    """Prune a copy of a species tree to the species of the sequences in
+    names, and rename the tips to the sequence names. The sequence named query
+    is placed at the tip of the target species. Returns a tuple of the pruned
+    tree and None, or None and the reason that the tree could not be made."""
+    tips = [clade.name for clade in tree.get_terminals() if clade.name]
+    placed = {}
+    for name in names:
+        tip = tip_of(target if name == query else name, tips)
+        if tip is None:
+            return (None, name + ' is not in the species tree')
+        if tip in placed:
+            return (
+                None,
+                name + ' and ' + placed[tip] + ' both match ' + tip +
+                ' in the species tree')
+        placed[tip] = name
+    pruned = copy.deepcopy(tree)
+    for clade in pruned.get_terminals():
+        if clade.name in placed:
+            clade.name = placed[clade.name]
+        else:
+            pruned.prune(clade)
+    #   Support values and the names of internal nodes are not wanted by HyPhy
+    for clade in pruned.find_clades():
+        clade.confidence = None
+        if not clade.is_terminal():
+            clade.name = None
+    return (pruned, None)
+
+
+def newick_clade(clade):
+    """Return the Newick string of a clade. The branch length is left out if
+    it is None, so that a tree with only a topology is written without
+    lengths, rather than with a length of 0 on every branch."""
+    if clade.is_terminal():
+        text = newick_name(clade.name)
+    else:
+        text = '(' + ','.join(
+            newick_clade(child)
+            for child
+            in clade.clades) + ')' + newick_name(clade.name)
+    if clade.branch_length is not None:
+        text += ':' + str(clade.branch_length)
+    return text
+
+
+def newick_name(name):
+    """Return a name for a Newick string, quoted if it has characters that
+    Newick uses."""
+    if not name:
+        return ''
+    if any(char in name for char in NEWICK_SPECIAL):
+        return "'" + name.replace("'", "''") + "'"
+    return name
+
+
+def write_tree(tree, path):
+    """Write a tree in Newick format. Branch lengths are only written if the
+    tree has them."""
+    with open(path, 'w') as handle:
+        handle.write(newick_clade(tree.root) + ';\n')
+    return
@@ -24,7 +24,33 @@ class ConfigHandler(object):
                 'PASTA': 'pasta_path',
                 'HYPHY': 'hyphy_path',
                 'CLUSTALO': 'clustalo_path',
-                'FASTTREE': 'fasttree_path'
+                'FASTTREE': 'fasttree_path',
+                'NUM_CPUS': 'num_cpus',
+                'BLAST_FORMAT': 'blast_format',
+                'CACHE_DIR': 'cache_dir',
+                'CACHE_SIZE': 'cache_size',
+                'SEARCH_PROGRAM': 'search_program',
+                'MERGED_DB': 'merged_db',
+                'PREFILTER': 'prefilter',
+                'ORTHOLOGUE_TABLE': 'orthologue_table',
+                'MAX_SPECIES': 'max_species',
+                'SPECIES_CLADES': 'species_clades',
+                'GROUP_ISOFORMS': 'group_isoforms',
+                'STAGE_DIR': 'stage_dir',
+                'STAGE_SIZE': 'stage_size',
+                'STAGE_PREWARM': 'stage_prewarm',
+                'TOOL_THREADS': 'tool_threads',
+                'MEMORY': 'memory',
+                'CHECK_CODONS': 'check_codons',
+                'ALIGNER': 'aligner',
+                'MAFFT': 'mafft_path',
+                'SCRATCH_DIR': 'scratch_dir',
+                'KEEP_SCRATCH': 'keep_scratch',
+                'SPECIES_TREE': 'species_tree',
+                'ADMISSION': 'admission',
+                'NODE_MEMORY': 'node_memory',
+                'ADMISSION_DIR': 'admission_dir',
+                'SITE_SHARDS': 'site_shards'
                 }
     #   Here is the string that prefixes a variable delcaration
     DECLR = '#define'
@@ -77,6 +77,7 @@ class SetupEnv(object):
         self.hyphy_path = spawn.find_executable('HYPHYMP') or spawn.find_executable('hyphymp') or ''
         self.clustalo_path = spawn.find_executable('clustalo') or ''
         self.fasttree_path = spawn.find_executable('fasttree') or ''
+        self.mafft_path = spawn.find_executable('mafft') or ''
         self.mainlog.debug(
             'Setting executable path variables:\n' +
             '#define BASH ' + self.bash_path + '\n' +
@@ -86,7 +87,8 @@ class SetupEnv(object):
             '#define PASTA ' + self.pasta_path + '\n' +
             '#define HYPHY ' + self.hyphy_path + '\n' +
             '#define CLUSTALO ' + self.clustalo_path + '\n' +
-            '#define FASTTREE ' + self.fasttree_path)
+            '#define FASTTREE ' + self.fasttree_path + '\n' +
+            '#define MAFFT ' + self.mafft_path)
         #   Print out some warnings if executables are not found
         if self.bash_path == '':
             self.mainlog.error('Cannot find bash!')
@@ -109,6 +111,10 @@ class SetupEnv(object):
         if self.fasttree_path == '':
             self.mainlog.warning('Cannot find fasttree!')
             self.missing_progs.append('fasttree')
+        #   MAFFT is optional, so it is not downloaded
+        if self.mafft_path == '':
+            self.mainlog.info(
+                'Cannot find MAFFT. Small alignments will use Clustal-omega.')
         return
 
     def get_deps(self):
@@ -140,6 +146,8 @@ class SetupEnv(object):
         handle.write('#define HYPHY ' + self.hyphy_path + '\n')
         handle.write('#define CLUSTALO ' + self.clustalo_path + '\n')
         handle.write('#define FASTTREE ' + self.fasttree_path + '\n')
+        if self.mafft_path:
+            handle.write('#define MAFFT ' + self.mafft_path + '\n')
         handle.flush()
         handle.close()
         self.mainlog.info('Wrote configuration into ' + self.config_file)
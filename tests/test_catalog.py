@@ -0,0 +1,74 @@
+"""Tests for telling when the catalog of species databases is out of date."""
+
+import logging
+import os
+
+from lrt_predict.Fetch import catalog
+
+LOG = logging.getLogger('test_catalog')
+
+
+def make_base(tmp_path):
+    base = tmp_path / 'base'
+    species = base / 'Athaliana'
+    species.mkdir(parents=True)
+    with open(str(species / 'Athaliana.cds.fa'), 'w') as f:
+        f.write('>a\nATGAAA\n')
+    return str(base), str(species)
+
+
+def test_fresh_catalog(tmp_path):
+    base, species = make_base(tmp_path)
+    entries = catalog.build_catalog(base, LOG)
+    assert not catalog.is_stale(base, catalog.load_catalog(base))
+    assert len(entries) == 1
+
+
+def test_database_added_to_species_directory(tmp_path):
+    base, species = make_base(tmp_path)
+    catalog.build_catalog(base, LOG)
+    entries = catalog.load_catalog(base)
+    assert not catalog.is_stale(base, entries)
+    #   A new database in an existing species directory does not change the
+    #   base directory, only the species directory
+    with open(os.path.join(species, 'Athaliana.v2.cds.fa'), 'w') as f:
+        f.write('>b\nATGCCC\n')
+    assert catalog.is_stale(base, entries)
+
+
+def test_database_added_in_new_species_directory(tmp_path):
+    base, species = make_base(tmp_path)
+    catalog.build_catalog(base, LOG)
+    entries = catalog.load_catalog(base)
+    os.mkdir(os.path.join(base, 'Osativa'))
+    with open(os.path.join(base, 'Osativa', 'Osativa.cds.fa'), 'w') as f:
+        f.write('>c\nATGGGG\n')
+    assert catalog.is_stale(base, entries)
+
+
+def test_database_changed_or_removed(tmp_path):
+    base, species = make_base(tmp_path)
+    catalog.build_catalog(base, LOG)
+    entries = catalog.load_catalog(base)
+    db = os.path.join(species, 'Athaliana.cds.fa')
+    with open(db, 'a') as f:
+        f.write('>d\nATGTTT\n')
+    assert catalog.is_stale(base, entries)
+    os.remove(db)
+    assert catalog.is_stale(base, entries)
+
+
+def test_index_next_to_database_keeps_catalog_fresh(tmp_path):
+    base, species = make_base(tmp_path)
+    catalog.build_catalog(base, LOG)
+    entries = catalog.load_catalog(base)
+    #   Searches build indices and write temporary files next to the
+    #   databases, which changes the times of their directories
+    db = os.path.join(species, 'Athaliana.cds.fa')
+    for name in [db + '.fidx', db + '.kmer', '.tmp_x.kmer']:
+        with open(os.path.join(species, name), 'w') as f:
+            f.write('index')
+    future = os.path.getmtime(catalog.catalog_path(base)) + 100
+    os.utime(species, (future, future))
+    os.utime(base, (future, future))
+    assert not catalog.is_stale(base, entries)
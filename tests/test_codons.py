@@ -0,0 +1,189 @@
+"""Tests that the codon table translation and run-based back-translation give
+the same results as the per-column code that they replaced."""
+
+import hashlib
+import io
+import os
+import random
+import re
+
+from Bio.Seq import Seq
+
+from lrt_predict.Predict import align
+from lrt_predict.Predict import codons
+
+TEST_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Test_Data')
+#   MD5 of the protein input that prepare_sequences() writes for the changed
+#   ADH3 homologues
+PREPARED_ADH3_MD5 = 'cb7d6c378cd24143b1c42e0fe1b66bc7'
+
+CODONS = [
+    a + b + c
+    for a in 'ACGT'
+    for b in 'ACGT'
+    for c in 'ACGT']
+STOPS = ['TAA', 'TAG', 'TGA']
+
+
+def old_translate(cds):
+    """Translation the way align.py did it before, with Biopython."""
+    return str(Seq(cds).translate())
+
+
+def old_back_translate(aligned, cds):
+    """The per-column back-translation that align.py used before."""
+    rebuilt_seq = ''
+    pos = 0
+    for aa in aligned:
+        if aa == '-':
+            rebuilt_seq += '---'
+        else:
+            rebuilt_seq += cds[pos:pos+3]
+            pos += 3
+    return rebuilt_seq
+
+
+def old_has_internal_stop(protein):
+    return bool(re.match(r'.+\*[^$]', protein))
+
+
+def random_cds(rng, ncodons):
+    sense = [c for c in CODONS if c not in STOPS]
+    cds = [rng.choice(sense) for _ in range(ncodons)]
+    #   Ambiguous codons, and sometimes stops inside and at the end
+    for _ in range(2):
+        cds[rng.randrange(ncodons)] = rng.choice(['NNN', 'ATN', 'RAY'])
+    if rng.random() < 0.3:
+        cds[rng.randrange(1, ncodons - 1)] = rng.choice(STOPS)
+    if rng.random() < 0.5:
+        cds.append(rng.choice(STOPS))
+    return ''.join(cds)
+
+
+def gapped(rng, protein, columns):
+    """Spread a protein over an alignment of the given width, with gaps."""
+    gaps = sorted(rng.sample(range(columns), columns - len(protein)))
+    out = []
+    residues = iter(protein)
+    for col in range(columns):
+        if gaps and gaps[0] == col:
+            out.append('-')
+            gaps.pop(0)
+        else:
+            out.append(next(residues))
+    return ''.join(out)
+
+
+def test_translate_matches_biopython():
+    rng = random.Random(1)
+    for _ in range(200):
+        cds = random_cds(rng, rng.randint(3, 60))
+        assert codons.translate(cds) == old_translate(cds)
+
+
+def test_trim_stop_matches_old_check():
+    for protein in ['MK*', 'M*K', '*MK', 'MKL', 'M**', '*', 'MK*L*']:
+        trimmed = codons.trim_stop(protein)
+        assert (trimmed is None) == old_has_internal_stop(protein)
+        if trimmed is not None:
+            assert trimmed == (protein[:-1] if protein.endswith('*')
+                               else protein)
+
+
+def test_back_translate_round_trip():
+    rng = random.Random(2)
+    for _ in range(50):
+        nseqs = rng.randint(2, 6)
+        cdss = [random_cds(rng, rng.randint(5, 40)) for _ in range(nseqs)]
+        #   Ambiguous residues are replaced with X before aligning
+        proteins = [
+            codons.AMBIGUOUS_AA.sub('X', codons.translate(cds))
+            for cds in cdss]
+        #   Extra columns, some of which are gaps in every sequence
+        width = max(len(p) for p in proteins) + rng.randint(0, 10)
+        aligned = [gapped(rng, p, width) for p in proteins]
+        for cds, aln in zip(cdss, aligned):
+            rebuilt, mismatches = codons.back_translate(aln, cds, True)
+            assert rebuilt == old_back_translate(aln, cds)
+            assert rebuilt.replace('-', '') == cds.replace('-', '')
+            assert len(rebuilt) == 3 * width
+            assert mismatches == []
+
+
+def test_back_translate_gap_only_and_short_cds():
+    #   A run of residues past the end of the CDS gives nothing, like before
+    rebuilt, _ = codons.back_translate('M--KL---', 'ATGAAA')
+    assert rebuilt == old_back_translate('M--KL---', 'ATGAAA')
+    rebuilt, _ = codons.back_translate('----', 'ATGAAA')
+    assert rebuilt == '-' * 12
+
+
+def test_back_translate_reports_mismatches():
+    _, mismatches = codons.back_translate('-MK', 'ATGCCC', True)
+    assert mismatches == [(2, 'K', 'CCC')]
+
+
+def test_fasta_round_trip(tmp_path):
+    records = [('a', 'M' * 130), ('b', 'MK-' * 5)]
+    handle = io.StringIO()
+    codons.write_fasta(handle, records)
+    path = str(tmp_path / 'x.fasta')
+    with open(path, 'w') as f:
+        f.write(handle.getvalue())
+    assert codons.read_fasta(path) == records
+    assert max(len(line) for line in handle.getvalue().split('\n')) == 60
+
+
+def prepared_adh3(tmp_path):
+    """Prepare a changed copy of the ADH3 homologues in Test_Data for
+    alignment. One name has characters that HyPhy does not take and a CDS
+    whose length is not a multiple of 3, and another CDS has three
+    ambiguous codons."""
+    msa = os.path.join(TEST_DATA, 'MSA', 'ADH3_MSA.fasta')
+    records = [
+        (name, cds.replace('-', ''))
+        for name, cds
+        in codons.read_fasta(msa)]
+    name, cds = records[0]
+    records[0] = ('Aegilops.tauschii|v2', cds[:-1])
+    name, cds = records[2]
+    #   RAY, SAR, and MTT translate to B, Z, and J
+    records[2] = (name, cds[:3] + 'RAYSARMTT' + cds[12:])
+    unaligned = open(str(tmp_path / 'ADH3.fasta'), 'w+t')
+    codons.write_fasta(unaligned, records)
+    unaligned.flush()
+    aln = align.PastaAlign(
+        'pasta', 'clustalo', 'FastTree', unaligned,
+        os.path.join(TEST_DATA, 'ADH3.fasta'), 'WARNING')
+    aln.prepare_sequences()
+    return (records, aln)
+
+
+def test_prepared_test_data_alignment(tmp_path):
+    #   Two deliberate changes from the old prepare_sequences: every
+    #   ambiguous residue becomes X, where re.sub() with re.I as its count
+    #   stopped after two, and a CDS whose length is not a multiple of 3 gets
+    #   the HyPhy-safe name, where it kept its own name and was then dropped
+    #   from the back-translation
+    records, aln = prepared_adh3(tmp_path)
+    proteins = codons.read_fasta(aln.protein_input.name)
+    assert [name for name, protein in proteins] == [
+        'Aegilops_tauschii_v2', 'ADH3_Morex', 'Bdistachyon_314_v3',
+        'Triticum_urartu']
+    assert aln.input_dict['Aegilops_tauschii_v2'] == records[0][1] + 'N'
+    assert proteins[2][1][:4] == 'MXXX'
+    for (name, cds), (fixed, protein) in zip(records, proteins):
+        expected = str(Seq(aln.input_dict[fixed]).translate()).rstrip('*')
+        assert protein == codons.AMBIGUOUS_AA.sub('X', expected)
+    with open(aln.protein_input.name, 'rb') as f:
+        assert hashlib.md5(f.read()).hexdigest() == PREPARED_ADH3_MD5
+    #   Every sequence comes back from the back-translation
+    aln.aln_out = aln.protein_input.name
+    aln.back_translate()
+    rebuilt = codons.read_fasta(aln.final_aln)
+    os.remove(aln.final_aln)
+    assert [name for name, cds in rebuilt] == [
+        name for name, protein in proteins]
+    assert rebuilt[0][1] == records[0][1] + 'N'
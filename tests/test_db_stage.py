@@ -0,0 +1,48 @@
+"""Tests for staging species databases on node-local scratch space."""
+
+import os
+from multiprocessing.pool import ThreadPool
+
+from lrt_predict.Blast import db_stage
+
+
+def make_databases(tmp_path, count):
+    base = tmp_path / 'base'
+    base.mkdir()
+    dbs = []
+    for index in range(count):
+        db = str(base / ('Species' + str(index) + '.cds.fa'))
+        with open(db, 'w') as f:
+            f.write('>a\n' + 'ATG' * 100 + '\n')
+        with open(db + '.fidx', 'w') as f:
+            f.write('index')
+        dbs.append(db)
+    return (str(base), dbs)
+
+
+def test_staged_copy_is_reused(tmp_path):
+    base, dbs = make_databases(tmp_path, 1)
+    stage = db_stage.DatabaseStage(
+        base, str(tmp_path / 'scratch'), None, False, 'WARNING')
+    local = stage.local_path(dbs[0])
+    assert local != dbs[0]
+    assert os.path.isfile(local)
+    assert os.path.isfile(local + '.fidx')
+    assert stage.local_path(dbs[0]) == local
+
+
+def test_parallel_staging_while_evicting(tmp_path, monkeypatch):
+    #   Every database is over the size limit and old enough to evict, so
+    #   each stage() evicts while the other threads are adding to staged
+    monkeypatch.setattr(db_stage.DatabaseStage, 'MIN_IDLE', -1)
+    base, dbs = make_databases(tmp_path, 60)
+    stage = db_stage.DatabaseStage(
+        base, str(tmp_path / 'scratch'), 0.0001, False, 'WARNING')
+    pool = ThreadPool(8)
+    try:
+        locals_ = pool.map(stage.local_path, dbs)
+    finally:
+        pool.close()
+        pool.join()
+    #   Copies that this process uses are never evicted
+    assert all(os.path.isfile(local) for local in locals_)
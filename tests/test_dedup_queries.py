@@ -0,0 +1,77 @@
+"""Tests for finding queries with the same CDS, and copying their outputs."""
+
+import os
+
+from lrt_predict.General import dedup_queries
+
+
+def write_queries(tmp_path, seqs):
+    queries = []
+    for name, seq in seqs:
+        path = str(tmp_path / (name + '.fasta'))
+        with open(path, 'w') as f:
+            f.write('>' + name + '\n' + seq + '\n')
+        queries.append(path)
+    return queries
+
+
+def test_group_by_cds(tmp_path):
+    queries = write_queries(tmp_path, [
+        ('GeneA.1', 'ATGAAATGA'),
+        ('GeneB.1', 'ATGCCCTGA'),
+        ('GeneC.1', 'atgaaatga'),
+        ('GeneD.1', 'ATGAAATGA')])
+    records = dedup_queries.read_queries(queries)
+    unique, copies = dedup_queries.group_by_cds(queries, records)
+    assert unique == [queries[0], queries[1]]
+    assert copies == {
+        queries[0]: [queries[2], queries[3]],
+        queries[1]: []}
+
+
+def test_group_by_gene(tmp_path):
+    queries = write_queries(tmp_path, [
+        ('Sobic.001G000100.1', 'ATGAAATGA'),
+        ('Sobic.001G000100.2', 'ATGAAACCCTGA'),
+        ('GRMZM2G000001_T01', 'ATGTGA'),
+        ('GRMZM2G000001_T02', 'ATGGGG')])
+    records = dedup_queries.read_queries(queries)
+    homologues = dedup_queries.group_by_gene(queries, records)
+    assert homologues == {
+        queries[0]: queries[1],
+        queries[1]: queries[1],
+        #   Ties go to the first isoform
+        queries[2]: queries[2],
+        queries[3]: queries[2]}
+
+
+def test_rename_outputs(tmp_path):
+    msa = str(tmp_path / 'in.fasta')
+    tree = str(tmp_path / 'in.tree')
+    with open(msa, 'w') as f:
+        f.write('>GeneA_1\nATG\n>GeneA_10\nATG\n>Zmays\nATG\n')
+    with open(tree, 'w') as f:
+        f.write('((GeneA_1:0.1,GeneA_10:0.2):0.1,Zmays:0.3);\n')
+    out_msa = str(tmp_path / 'out.fasta')
+    out_tree = str(tmp_path / 'out.tree')
+    assert dedup_queries.rename_outputs(
+        msa, tree, 'GeneA.1', 'GeneC.1', out_msa, out_tree)
+    with open(out_msa, 'r') as f:
+        assert f.read() == '>GeneC_1\nATG\n>GeneA_10\nATG\n>Zmays\nATG\n'
+    with open(out_tree, 'r') as f:
+        assert f.read() == '((GeneC_1:0.1,GeneA_10:0.2):0.1,Zmays:0.3);\n'
+
+
+def test_rename_outputs_missing_query(tmp_path):
+    msa = str(tmp_path / 'in.fasta')
+    tree = str(tmp_path / 'in.tree')
+    with open(msa, 'w') as f:
+        f.write('>GeneA_10\nATG\n>Zmays\nATG\n')
+    with open(tree, 'w') as f:
+        f.write('(GeneA_10:0.2,Zmays:0.3);\n')
+    out_msa = str(tmp_path / 'out.fasta')
+    out_tree = str(tmp_path / 'out.tree')
+    assert not dedup_queries.rename_outputs(
+        msa, tree, 'GeneA.1', 'GeneC.1', out_msa, out_tree)
+    assert not os.path.exists(out_msa)
+    assert not os.path.exists(out_tree)
@@ -0,0 +1,33 @@
+"""Tests for the persistent cache of BLAST hits, alignments, and fits."""
+
+import threading
+
+from lrt_predict.General import disk_cache
+
+
+def test_round_trip(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path), 1, 'WARNING')
+    key = cache.make_key('a', 'b')
+    assert cache.get(key) is None
+    cache.put(key, b'data')
+    assert cache.get(key) == b'data'
+    assert cache.make_key('ab', '') != cache.make_key('a', 'b')
+
+
+def test_size_with_concurrent_writers(tmp_path):
+    #   Writers that replace the same keys at the same time must keep the
+    #   recorded size equal to the size on disk
+    cache = disk_cache.DiskCache(str(tmp_path), 100, 'WARNING')
+
+    def write(worker):
+        for i in range(40):
+            cache.put('key' + str(i % 4), b'x' * (100 + 10 * worker + i))
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(str(tmp_path / disk_cache.DiskCache.SIZE_NAME), 'r') as f:
+        recorded = int(f.read())
+    assert recorded == cache.disk_usage()
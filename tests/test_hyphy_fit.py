@@ -0,0 +1,61 @@
+"""Tests that a background fit saved by LRT.hyphy and loaded again gives the
+same report as the run that fitted it. These run HyPhy, and are skipped if it
+is not installed. Set BAD_MUTATIONS_HYPHY to the HyPhy executable to use one
+that is not on the PATH."""
+
+import os
+from distutils import spawn
+
+import pytest
+
+from lrt_predict.General import disk_cache
+from lrt_predict.Predict import predict
+
+TEST_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Test_Data')
+HYPHY = os.environ.get('BAD_MUTATIONS_HYPHY') or \
+    spawn.find_executable('HYPHYMP') or \
+    spawn.find_executable('hyphymp') or \
+    spawn.find_executable('HYPHYSP')
+#   Lines of the report that hold times, which differ between runs
+TIME_LINES = ('CPU time taken for dS: ', 'CPU time taken for sites: ')
+
+pytestmark = pytest.mark.skipif(not HYPHY, reason='HyPhy is not installed')
+
+
+def predict_adh3(cache):
+    """Predict the substitutions of ADH3 in Test_Data, with a cache of
+    background fits. Returns the fit mode and the lines of the report."""
+    lrt = predict.LRTPredict(
+        HYPHY,
+        os.path.join(TEST_DATA, 'MSA', 'ADH3_MSA.fasta'),
+        os.path.join(TEST_DATA, 'Tree', 'ADH3.tree'),
+        os.path.join(TEST_DATA, 'ADH3.fasta'),
+        os.path.join(TEST_DATA, 'ADH3.subs'),
+        'WARNING')
+    lrt.fit_cache = cache
+    lrt.get_query_position()
+    lrt.get_aligned_positions()
+    lrt.prepare_hyphy_inputs()
+    mode = lrt.fit_mode
+    report = lrt.predict_codons()
+    with open(report.name, 'r') as f:
+        lines = f.readlines()
+    return (mode, lines)
+
+
+def without_times(lines):
+    return [line for line in lines if not line.startswith(TIME_LINES)]
+
+
+def test_loaded_fit_gives_the_same_report(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / 'fits'), 16, 'WARNING')
+    fitted_mode, fitted = predict_adh3(cache)
+    loaded_mode, loaded = predict_adh3(cache)
+    assert (fitted_mode, loaded_mode) == ('SAVE', 'LOAD')
+    assert [line for line in fitted if line.startswith('Position\t')]
+    #   The global and branch parameters, and the test of every site, are
+    #   the same, and loading the fit adds no lines to the report
+    assert without_times(loaded) == without_times(fitted)
+    assert len(loaded) == len(fitted)
@@ -0,0 +1,69 @@
+"""Tests for the k-mer index that picks the candidates of the prefilter."""
+
+import glob
+import os
+import random
+
+from lrt_predict.Fetch import format_blast
+from lrt_predict.Fetch import kmer_index
+from lrt_predict.Predict import codons
+
+TEST_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Test_Data')
+#   The species of the homologues in Test_Data/MSA, besides the query
+SPECIES = ['Aegilops_tauschii', 'Bdistachyon_314_v3', 'Triticum_urartu']
+
+
+def random_cds(rng, ncodons):
+    return ''.join(rng.choice('ACGT') for i in range(ncodons * 3))
+
+
+def test_merged_chunks_match_one_sort(tmp_path, monkeypatch):
+    rng = random.Random(3)
+    seqs = [random_cds(rng, rng.randint(0, 120)) for i in range(200)]
+    fasta = str(tmp_path / 'Species.cds.fa')
+    with open(fasta, 'w') as f:
+        for index, seq in enumerate(seqs):
+            f.write('>rec' + str(index) + '\n' + seq + '\n')
+    expected = sorted(
+        (code, record)
+        for record, seq in enumerate(seqs)
+        for code in kmer_index.kmers(format_blast.translate_seq(seq)))
+    #   Small chunks and blocks, so that several sorted runs are merged
+    monkeypatch.setattr(kmer_index, 'CHUNK', 50)
+    monkeypatch.setattr(kmer_index, 'BLOCK', 7)
+    kmer_index.build_index(fasta)
+    codes, records = kmer_index.load_index(fasta)
+    assert list(zip(codes, records)) == expected
+    assert not [
+        name
+        for name
+        in os.listdir(str(tmp_path))
+        if name.startswith('.tmp_')]
+
+
+def test_prefilter_keeps_exhaustive_best_hits(tmp_path):
+    #   The homologues in Test_Data/MSA are the best hits of the exhaustive
+    #   tblastx search in each species. Put the homologues of every gene into
+    #   one database per species, and check that the best k-mer candidate of
+    #   each query is its homologue.
+    genes = sorted(
+        os.path.basename(path).replace('_MSA.fasta', '')
+        for path
+        in glob.glob(os.path.join(TEST_DATA, 'MSA', '*_MSA.fasta')))
+    homologues = dict(
+        (gene, dict(codons.read_fasta(
+            os.path.join(TEST_DATA, 'MSA', gene + '_MSA.fasta'))))
+        for gene in genes)
+    for species in SPECIES:
+        fasta = str(tmp_path / (species + '.cds.fa'))
+        with open(fasta, 'w') as f:
+            for gene in genes:
+                f.write(
+                    '>' + gene + '\n' +
+                    homologues[gene][species].replace('-', '') + '\n')
+        for record, gene in enumerate(genes):
+            query = codons.read_fasta(
+                os.path.join(TEST_DATA, gene + '.fasta'))[0][1]
+            assert kmer_index.candidates(fasta, query, 1, 2) == [record]
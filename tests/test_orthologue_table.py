@@ -0,0 +1,43 @@
+"""Tests for the table of precomputed best hits."""
+
+import os
+
+from lrt_predict.Blast import orthologue_table
+
+
+def make_dbs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = str(tmp_path / name)
+        with open(path, 'w') as f:
+            f.write(name)
+        paths.append(path)
+    return paths
+
+
+def test_searched_hashes_matches_lookup(tmp_path):
+    dbs = make_dbs(tmp_path, ['a.fa', 'b.fa'])
+    table = orthologue_table.OrthologueTable(
+        str(tmp_path / 'table.db'), 'WARNING')
+    table.check_params({'evalue': '0.05'}, store=True)
+    table.add_query('q1', 'ATGAAA', {dbs[0]: ('s1', 'g1')}, dbs)
+    #   q2 was only searched against one of the databases
+    table.add_query('q2', 'ATGCCC', {}, dbs[:1])
+    searched = table.searched_hashes(dbs)
+    for seq in ['ATGAAA', 'ATGCCC', 'ATGGGG']:
+        expected = all(table.lookup(seq, db)[0] for db in dbs)
+        assert (table.seq_hash(seq) in searched) == expected
+    assert searched == set([table.seq_hash('atgaaa')])
+
+
+def test_changed_database_is_searched_again(tmp_path):
+    dbs = make_dbs(tmp_path, ['a.fa'])
+    table = orthologue_table.OrthologueTable(
+        str(tmp_path / 'table.db'), 'WARNING')
+    table.check_params({'evalue': '0.05'}, store=True)
+    table.add_query('q1', 'ATGAAA', {}, dbs)
+    assert table.searched_hashes(dbs)
+    with open(dbs[0], 'a') as f:
+        f.write('more')
+    os.utime(dbs[0], (0, 0))
+    assert table.searched_hashes(dbs) == set()
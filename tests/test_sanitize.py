@@ -0,0 +1,54 @@
+"""Tests that the sanitizer gives the same output as the Linux branch of
+Prepare_HyPhy.sh, which it replaced. The expected outputs were made by running
+that script with GNU sed on the inputs."""
+
+from lrt_predict.Predict import sanitize
+
+FASTA_IN = (
+    '>Zm.GRMZM2G000001_T01 <unknown description>\n'
+    'ATG---AAA\n'
+    '>Sb+Sobic.001G000100.1\n'
+    'ATGCCC.AA\n'
+    '>plain\n'
+    'ATGAAA\n')
+FASTA_OUT = (
+    '>Zm_GRMZM2G000001_T01\n'
+    'ATG---AAA\n'
+    '>SbSobic_001G000100_1\n'
+    'ATGCCC_AA\n'
+    '>plain\n'
+    'ATGAAA\n')
+TREE_IN = (
+    "((Zm.GRMZM2G000001_T01:0.0123,'Sb+Sobic.001G000100.1':1.5)0.987:0.25,"
+    "plain <unknown description>:2.0)1.0:0.0;\n"
+    ";\n"
+    ";;\n"
+    "(a.b:0.5,c:1.25e-3);\n")
+TREE_OUT = (
+    '((Zm_GRMZM2G000001_T01:0.0123,SbSobic_001G000100_1:1.5):0.25,'
+    'plain:2.0):0.0;\n'
+    '(a_b:0.5,c:1.25e-3);\n')
+
+
+def test_fasta_matches_sed():
+    assert sanitize.sanitize_fasta(FASTA_IN) == FASTA_OUT
+
+
+def test_tree_matches_sed():
+    assert sanitize.sanitize_tree(TREE_IN) == TREE_OUT
+
+
+def test_last_line_without_newline():
+    assert sanitize.sanitize_tree('(a.b:0.5,c:1.0)0.9:0.1;') == \
+        '(a_b:0.5,c:1.0):0.1;'
+
+
+def test_sanitize_file(tmp_path):
+    path = str(tmp_path / 'tree.tre')
+    with open(path, 'w') as f:
+        f.write(TREE_IN)
+    sanitize.sanitize_file(path, sanitize.tree_lines)
+    with open(path, 'r') as f:
+        assert f.read() == TREE_OUT
+    #   Only the file itself is left, not the temporary copy
+    assert [p.name for p in tmp_path.iterdir()] == ['tree.tre']
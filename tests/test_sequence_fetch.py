@@ -0,0 +1,25 @@
+"""Tests for matching the records of a batch blastdbcmd call to their IDs."""
+
+from lrt_predict.Blast import sequence_fetch
+
+
+def test_records_matched_by_header():
+    records = sequence_fetch.split_fasta(
+        '>B desc\nCCC\n>A\nAAA\n')
+    found = sequence_fetch.match_records(['A', 'B'], records)
+    assert found == {'A': '>A\nAAA\n', 'B': '>B desc\nCCC\n'}
+
+
+def test_prefixed_ids():
+    records = sequence_fetch.split_fasta('>lcl|A\nAAA\n>gene2 x\nGGG\n')
+    found = sequence_fetch.match_records(['A', 'lcl|gene2'], records)
+    assert found['A'] == '>lcl|A\nAAA\n'
+    assert found['lcl|gene2'] == '>gene2 x\nGGG\n'
+
+
+def test_mismatch_is_not_guessed():
+    #   The count matches, but one record is not one that was asked for
+    records = sequence_fetch.split_fasta('>A\nAAA\n>C\nCCC\n')
+    assert sequence_fetch.match_records(['A', 'B'], records) is None
+    #   A missing record
+    assert sequence_fetch.match_records(['A', 'B'], records[:1]) is None
@@ -0,0 +1,52 @@
+"""Tests for pruning the species tree and writing it for HyPhy and PASTA."""
+
+import io
+
+from Bio import Phylo
+
+from lrt_predict.Predict import species_tree
+
+
+def parse(newick):
+    """Read a tree from a Newick string."""
+    return Phylo.read(io.StringIO(newick), 'newick')
+
+
+def pruned_string(newick, tmp_path):
+    """Prune a tree to three sequences and return the Newick string that is
+    written for it."""
+    pruned, problem = species_tree.prune_tree(
+        parse(newick),
+        ['query', 'Alyrata_db', 'Zmays_db'],
+        'query',
+        'Athaliana')
+    assert problem is None
+    path = str(tmp_path / 'pruned.tree')
+    species_tree.write_tree(pruned, path)
+    with open(path) as handle:
+        return handle.read()
+
+
+def test_topology_only_tree_has_no_lengths(tmp_path):
+    newick = '((Athaliana,Alyrata),(Osativa,(Zmays,Sbicolor)));'
+    assert pruned_string(newick, tmp_path) == \
+        '((query,Alyrata_db),Zmays_db);\n'
+
+
+def test_branch_lengths_are_kept(tmp_path):
+    newick = (
+        '((Athaliana:1,Alyrata:2):0.5,'
+        '(Osativa:1,(Zmays:1,Sbicolor:1):0.3):0.25);')
+    assert pruned_string(newick, tmp_path) == \
+        '((query:1.0,Alyrata_db:2.0):0.5,Zmays_db:1.55);\n'
+
+
+def test_written_tree_reads_back(tmp_path):
+    tree = parse("((A:0.1,'B C':0.2),D);")
+    path = str(tmp_path / 'out.tree')
+    species_tree.write_tree(tree, path)
+    again = Phylo.read(path, 'newick')
+    assert [clade.name for clade in again.get_terminals()] == \
+        ['A', 'B C', 'D']
+    assert [clade.branch_length for clade in again.get_terminals()] == \
+        [0.1, 0.2, None]